@@ -2,6 +2,9 @@ from langchain_google_genai import GoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from .fetchdb import get_user_context, get_comprehensive_data
+from .curriculum import CURRICULUM_TOPICS
+from knockout.analytics import grade_weak_topics
+from knockout.progress import mastery_matrix
 from typing import Dict, Any, Optional, List
 import dotenv
 import os
@@ -212,6 +215,27 @@ def chatmodel(user_input: str, user_id: str, conversation_context: Optional[str]
             "timestamp": datetime.now().isoformat()
         }
 
+def knockout_accuracy(activity: Optional[Dict[str, Any]]) -> str:
+    """Share of knockout questions answered correctly, from the rolled up engagement totals"""
+    if not activity or not activity.get('answers'):
+        return "No games played"
+    return f"{100 * activity['correct_answers'] / activity['answers']:.0f}% of {activity['answers']} questions"
+
+
+def weak_topic_lines(weak_topics: List[Dict[str, Any]]) -> str:
+    """Weakest topics first, one prompt line each, from the topic mastery counters"""
+    if not weak_topics:
+        return "No weak topics found in knockout games yet"
+    return "\n".join(f"- {topic['subject']}: {topic['topic']} ({100 * topic['mastery']:.0f}% mastery)" for topic in weak_topics)
+
+
+def grade_weak_topic_lines(weak_topics: List[Dict[str, Any]]) -> str:
+    """Topics the student's grade struggles with, one prompt line each, from the cached grade heatmap"""
+    if not weak_topics:
+        return "No topics stand out for their grade yet"
+    return "\n".join(f"- {topic['subject']}: {topic['topic']} ({100 * topic['weak_share']:.0f}% of students weak)" for topic in weak_topics)
+
+
 def generate_knockout_questions(subject: str, grade_level: str, difficulty: str = "medium", num_questions: int = 5, user_id: Optional[int] = None) -> Dict[str, Any]:
     """
     Generate AI-powered questions for 1v1 knockout games
@@ -262,7 +286,8 @@ def generate_knockout_questions(subject: str, grade_level: str, difficulty: str
                     STUDENT PERFORMANCE CONTEXT:
                     - Current Score: {student_profile.get('score', 0)} points
                     - Grade Level: {student_profile.get('grade', grade_level)}
-                    - Platform Engagement: {'High' if len(user_data.get('posts', [])) + len(user_data.get('comments', [])) > 5 else 'Moderate' if len(user_data.get('posts', [])) + len(user_data.get('comments', [])) > 2 else 'Low'}
+                    - Platform Engagement: {(user_data.get('engagement') or {}).get('level', 'Unknown')}
+                    - Recent Knockout Accuracy: {knockout_accuracy(user_data.get('engagement'))}
                     
                     Adjust question difficulty and style based on this student's performance level.
                     """
@@ -270,48 +295,8 @@ def generate_knockout_questions(subject: str, grade_level: str, difficulty: str
             except Exception as e:
                 logger.warning(f"Failed to fetch user context for question generation: {e}")
     
-        # Define Egyptian curriculum-specific topics
-        curriculum_topics = {
-            "Middle 1": {
-                "Math": ["Integers", "Fractions", "Decimals", "Basic Algebra", "Geometry Basics"],
-                "Science": ["Matter States", "Simple Machines", "Plant Biology", "Solar System"],
-                "Arabic": ["Grammar Basics", "Reading Comprehension", "Poetry", "Composition"],
-                "English": ["Present Tense", "Vocabulary", "Reading", "Basic Writing"]
-            },
-            "Middle 2": {
-                "Math": ["Algebra", "Geometry", "Statistics", "Equations", "Functions"],
-                "Science": ["Chemistry Basics", "Physics Introduction", "Biology Systems"],
-                "Arabic": ["Advanced Grammar", "Literature", "Writing Skills"],
-                "English": ["Past Tenses", "Conditionals", "Advanced Vocabulary"]
-            },
-            "Middle 3": {
-                "Math": ["Advanced Algebra", "Geometry", "Probability", "Functions"],
-                "Science": ["Chemical Reactions", "Forces and Motion", "Genetics Basics"],
-                "Arabic": ["Poetry Analysis", "Essay Writing", "Classical Literature"],
-                "English": ["Complex Grammar", "Academic Writing", "Literature Analysis"]
-            },
-            "Senior 1": {
-                "Math": ["Calculus Basics", "Trigonometry", "Statistics", "Logarithms"],
-                "Physics": ["Mechanics", "Heat", "Sound", "Light"],
-                "Chemistry": ["Atomic Structure", "Chemical Bonding", "Acids and Bases"],
-                "Biology": ["Cell Biology", "Genetics", "Evolution"]
-            },
-            "Senior 2": {
-                "Math": ["Advanced Calculus", "Complex Numbers", "Matrices"],
-                "Physics": ["Electricity", "Magnetism", "Waves", "Modern Physics"],
-                "Chemistry": ["Organic Chemistry", "Chemical Equilibrium", "Thermodynamics"],
-                "Biology": ["Human Biology", "Ecology", "Molecular Biology"]
-            },
-            "Senior 3": {
-                "Math": ["University Prep Calculus", "Statistics", "Discrete Math"],
-                "Physics": ["Quantum Physics", "Relativity", "Nuclear Physics"],
-                "Chemistry": ["Advanced Organic", "Physical Chemistry", "Biochemistry"],
-                "Biology": ["Advanced Genetics", "Biotechnology", "Environmental Science"]
-            }
-        }
-        
         # Get relevant topics
-        topics = curriculum_topics.get(grade_level, {}).get(subject, ["General concepts"])
+        topics = CURRICULUM_TOPICS.get(grade_level, {}).get(subject, ["General concepts"])
         selected_topics = random.sample(topics, min(len(topics), 3))
         
         # Create AI prompt for question generation
@@ -595,6 +580,9 @@ def generate_study_recommendations(user_id: int, subject: Optional[str] = None)
         try:
             user_data = get_comprehensive_data(user_id)
             user_context = get_user_context(user_id)
+            weak_topics = mastery_matrix([user_id], subject).weak_topics(user_id)
+            grade_level = ((user_data or {}).get('student_profile') or {}).get('grade')
+            grade_weak = grade_weak_topics(grade_level, subject)
         except Exception as e:
             logger.error(f"Failed to fetch user data for recommendations: {e}")
             return {
@@ -626,6 +614,8 @@ def generate_study_recommendations(user_id: int, subject: Optional[str] = None)
         
         # Create AI prompt for study recommendations
         subject_focus = f"Focus specifically on {subject}." if subject else "Cover all relevant subjects for their grade level."
+        # Known weak spots narrow the content suggestions to a handful of topics instead of the whole curriculum
+        topic_focus = "Keep content suggestions to the topics listed above" if weak_topics or grade_weak else "Suggest content from across their curriculum"
         
         base_prompt = f"""You are an educational advisor for Egyptian students. Based on the student's profile and activity, 
 generate personalized study recommendations.
@@ -633,8 +623,16 @@ generate personalized study recommendations.
 STUDENT PROFILE:
 {user_context}
 
+WEAKEST TOPICS (from knockout game answers):
+{weak_topic_lines(weak_topics)}
+
+TOPICS THEIR GRADE STRUGGLES WITH:
+{grade_weak_topic_lines(grade_weak)}
+
 INSTRUCTIONS:
 - {subject_focus}
+- Put the weakest topics above first in focus_areas and aim most recommendations at them
+- {topic_focus}
 - Provide 5-8 specific, actionable study recommendations
 - Consider their grade level and current performance
 - Include both study techniques and content suggestions
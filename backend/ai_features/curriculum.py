@@ -0,0 +1,50 @@
+"""
+Egyptian curriculum topics per grade level and subject.
+
+Shared by the question generator and anything else that needs to relate
+content to a student's grade, such as feed ranking.
+"""
+
+CURRICULUM_TOPICS = {
+    "Middle 1": {
+        "Math": ["Integers", "Fractions", "Decimals", "Basic Algebra", "Geometry Basics"],
+        "Science": ["Matter States", "Simple Machines", "Plant Biology", "Solar System"],
+        "Arabic": ["Grammar Basics", "Reading Comprehension", "Poetry", "Composition"],
+        "English": ["Present Tense", "Vocabulary", "Reading", "Basic Writing"]
+    },
+    "Middle 2": {
+        "Math": ["Algebra", "Geometry", "Statistics", "Equations", "Functions"],
+        "Science": ["Chemistry Basics", "Physics Introduction", "Biology Systems"],
+        "Arabic": ["Advanced Grammar", "Literature", "Writing Skills"],
+        "English": ["Past Tenses", "Conditionals", "Advanced Vocabulary"]
+    },
+    "Middle 3": {
+        "Math": ["Advanced Algebra", "Geometry", "Probability", "Functions"],
+        "Science": ["Chemical Reactions", "Forces and Motion", "Genetics Basics"],
+        "Arabic": ["Poetry Analysis", "Essay Writing", "Classical Literature"],
+        "English": ["Complex Grammar", "Academic Writing", "Literature Analysis"]
+    },
+    "Senior 1": {
+        "Math": ["Calculus Basics", "Trigonometry", "Statistics", "Logarithms"],
+        "Physics": ["Mechanics", "Heat", "Sound", "Light"],
+        "Chemistry": ["Atomic Structure", "Chemical Bonding", "Acids and Bases"],
+        "Biology": ["Cell Biology", "Genetics", "Evolution"]
+    },
+    "Senior 2": {
+        "Math": ["Advanced Calculus", "Complex Numbers", "Matrices"],
+        "Physics": ["Electricity", "Magnetism", "Waves", "Modern Physics"],
+        "Chemistry": ["Organic Chemistry", "Chemical Equilibrium", "Thermodynamics"],
+        "Biology": ["Human Biology", "Ecology", "Molecular Biology"]
+    },
+    "Senior 3": {
+        "Math": ["University Prep Calculus", "Statistics", "Discrete Math"],
+        "Physics": ["Quantum Physics", "Relativity", "Nuclear Physics"],
+        "Chemistry": ["Advanced Organic", "Physical Chemistry", "Biochemistry"],
+        "Biology": ["Advanced Genetics", "Biotechnology", "Environmental Science"]
+    }
+}
+
+
+def grade_topics(grade_level):
+    """All topic names for a grade level across subjects."""
+    return [topic for topics in CURRICULUM_TOPICS.get(grade_level, {}).values() for topic in topics]
@@ -1,10 +1,14 @@
 import os
 import sys
+import uuid
 import django
 import logging
+import orjson
 from datetime import datetime
-from typing import Dict, List, Any, Optional
-from dataclasses import dataclass, asdict
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Tuple
+from dataclasses import dataclass
+from collections import defaultdict
+from itertools import islice
 from pathlib import Path
 
 # Configure logging
@@ -23,13 +27,22 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dof3a.settings.development')
 django.setup()
 # Import Django models after setup
 from django.contrib.auth import get_user_model
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from dof3a_base.models import Student, Post, Comment, StudyGroup, StudyGroupInvite
+from dof3a_base.rollups import ENGAGEMENT_DAYS, engagement
 from core.models import User
 
 # Get the custom User model
 User = get_user_model()
 
-@dataclass
+# Records are slotted so batch and caching paths don't pay for a per-instance
+# __dict__, and to_dict() builds the payload directly instead of going through
+# dataclasses.asdict(), which deep-copies every field recursively.
+# to_json() hands the record straight to orjson, which serialises slotted
+# dataclasses and datetimes natively.
+
+@dataclass(slots=True)
 class UserProfile:
     """User profile data structure matching Django User model only"""
     user_id: int
@@ -44,12 +57,23 @@ class UserProfile:
     is_superuser: bool
     
     def to_dict(self):
-        data = asdict(self)
-        data['date_joined'] = self.date_joined.isoformat()
-        data['last_login'] = self.last_login.isoformat() if self.last_login else None
-        return data
+        return {
+            'user_id': self.user_id,
+            'username': self.username,
+            'email': self.email,
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'date_joined': self.date_joined.isoformat(),
+            'last_login': self.last_login.isoformat() if self.last_login else None,
+            'is_active': self.is_active,
+            'is_staff': self.is_staff,
+            'is_superuser': self.is_superuser
+        }
+    
+    def to_json(self) -> bytes:
+        return orjson.dumps(self)
 
-@dataclass
+@dataclass(slots=True)
 class StudentProfile:
     """Student profile data structure matching Django Student model"""
     user_id: int
@@ -57,9 +81,16 @@ class StudentProfile:
     grade: str
     
     def to_dict(self):
-        return asdict(self)
+        return {
+            'user_id': self.user_id,
+            'score': self.score,
+            'grade': self.grade
+        }
+    
+    def to_json(self) -> bytes:
+        return orjson.dumps(self)
 
-@dataclass
+@dataclass(slots=True)
 class PostData:
     """Post data structure matching Django models"""
     id: int
@@ -70,9 +101,19 @@ class PostData:
     likes: int
     
     def to_dict(self):
-        return asdict(self)
+        return {
+            'id': self.id,
+            'author_id': self.author_id,
+            'author_username': self.author_username,
+            'caption': self.caption,
+            'description': self.description,
+            'likes': self.likes
+        }
+    
+    def to_json(self) -> bytes:
+        return orjson.dumps(self)
 
-@dataclass
+@dataclass(slots=True)
 class CommentData:
     """Comment data structure matching Django models"""
     id: int
@@ -82,12 +123,21 @@ class CommentData:
     likes: int
     
     def to_dict(self):
-        return asdict(self)
+        return {
+            'id': self.id,
+            'author_id': self.author_id,
+            'author_username': self.author_username,
+            'body': self.body,
+            'likes': self.likes
+        }
+    
+    def to_json(self) -> bytes:
+        return orjson.dumps(self)
 
-@dataclass
+@dataclass(slots=True)
 class StudyGroupData:
     """Study group data structure matching Django models"""
-    id: int
+    id: uuid.UUID
     host_id: int
     host_username: str
     topic: str
@@ -97,16 +147,25 @@ class StudyGroupData:
     is_active: bool
     
     def to_dict(self):
-        data = asdict(self)
-        data['created_at'] = self.created_at.isoformat()
-        data['scheduled_time'] = self.scheduled_time.isoformat()
-        return data
+        return {
+            'id': self.id,
+            'host_id': self.host_id,
+            'host_username': self.host_username,
+            'topic': self.topic,
+            'location': self.location,
+            'created_at': self.created_at.isoformat(),
+            'scheduled_time': self.scheduled_time.isoformat(),
+            'is_active': self.is_active
+        }
+    
+    def to_json(self) -> bytes:
+        return orjson.dumps(self)
 
-@dataclass
+@dataclass(slots=True)
 class StudyGroupInviteData:
     """Study group invite data structure matching Django models"""
     id: int
-    group_id: int
+    group_id: uuid.UUID
     group_topic: str
     student_id: int
     student_username: str
@@ -115,7 +174,19 @@ class StudyGroupInviteData:
     notified: bool
     
     def to_dict(self):
-        return asdict(self)
+        return {
+            'id': self.id,
+            'group_id': self.group_id,
+            'group_topic': self.group_topic,
+            'student_id': self.student_id,
+            'student_username': self.student_username,
+            'accepted': self.accepted,
+            'responded': self.responded,
+            'notified': self.notified
+        }
+    
+    def to_json(self) -> bytes:
+        return orjson.dumps(self)
 
 class DatabaseFetcher:
     """Database fetcher for the educational platform using Django ORM"""
@@ -159,6 +230,52 @@ class DatabaseFetcher:
         except Exception as e:
             logger.warning(f"Failed to sanitize string: {e}")
             return ""
+
+    def _validate_chunk_size(self, chunk_size: Any) -> int:
+        """Validate and sanitize chunk size for bulk fetches"""
+        if chunk_size is None:
+            return 500
+        
+        try:
+            chunk_size = int(chunk_size)
+            return max(1, min(chunk_size, 2000))  # Chunk between 1 and 2000 users
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Invalid chunk size: {chunk_size}, using default of 500")
+            return 500
+    
+    def _iter_user_id_chunks(self, user_ids: Iterable[Any], chunk_size: int) -> Iterator[List[int]]:
+        """
+        Split an iterable of user IDs into validated, de-duplicated chunks
+        
+        The input is consumed lazily, so a queryset iterator over a whole
+        grade never has to be materialised in memory at once.
+        """
+        iterator = iter(user_ids)
+        while True:
+            raw_chunk = list(islice(iterator, chunk_size))
+            if not raw_chunk:
+                return
+            
+            chunk = []
+            for raw_id in raw_chunk:
+                try:
+                    chunk.append(self._validate_user_id(raw_id))
+                except ValueError as e:
+                    logger.warning(f"Skipping invalid user ID in bulk fetch: {e}")
+            
+            if chunk:
+                # dict.fromkeys keeps the caller's order while dropping duplicates
+                yield list(dict.fromkeys(chunk))
+    
+    def _top_n_per_user(self, queryset, user_field: str, order_by, limit: int):
+        """Keep only the first `limit` rows per user using a ROW_NUMBER() window"""
+        return queryset.annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F(user_field)],
+                order_by=order_by
+            )
+        ).filter(row_number__lte=limit)
     
     def get_user_profile(self, user_id: int) -> Optional[UserProfile]:
         """
@@ -291,8 +408,7 @@ class DatabaseFetcher:
             user_id = self._validate_user_id(user_id)
             limit = self._validate_limit(limit)
             
-            # Prefetch liked_by to efficiently access the likes property
-            comments_qs = Comment.objects.filter(author_id=user_id).select_related('author').prefetch_related('liked_by').order_by('-id')[:limit]
+            comments_qs = Comment.objects.filter(author_id=user_id).select_related('author').order_by('-id')[:limit]
             
             comments = []
             for comment in comments_qs:
@@ -301,7 +417,7 @@ class DatabaseFetcher:
                     author_id=comment.author.id,
                     author_username=self._sanitize_string(comment.author.username),
                     body=self._sanitize_string(comment.body),
-                    likes=max(0, comment.likes)  # comment.likes is a property that returns liked_by.count()
+                    likes=max(0, comment.like_count)
                 )
                 comments.append(comment_data)
             
@@ -409,6 +525,139 @@ class DatabaseFetcher:
             logger.error(f"Error fetching study group invites: {e}")
             return []
 
+    def get_engagement(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a user's activity totals over the last ENGAGEMENT_DAYS days from the daily rollups
+        
+        Args:
+            user_id: User ID
+            
+        Returns:
+            Dictionary of totals with the engagement level, or None on error
+        """
+        try:
+            user_id = self._validate_user_id(user_id)
+            return engagement([user_id])[user_id]
+            
+        except Exception as e:
+            logger.error(f"Error fetching engagement for user {user_id}: {e}")
+            return None
+
+    def _get_user_profiles_bulk(self, user_ids: List[int]) -> Dict[int, UserProfile]:
+        """Fetch user profiles for a chunk of users in one query"""
+        profiles = {}
+        for user in User.objects.filter(id__in=user_ids, is_active=True):
+            profiles[user.id] = UserProfile(
+                user_id=user.id,
+                username=self._sanitize_string(user.username) or f"user_{user.id}",
+                email=self._sanitize_string(user.email) or "",
+                first_name=self._sanitize_string(user.first_name) or "",
+                last_name=self._sanitize_string(user.last_name) or "",
+                date_joined=user.date_joined,
+                last_login=user.last_login,
+                is_active=user.is_active,
+                is_staff=user.is_staff,
+                is_superuser=user.is_superuser
+            )
+        return profiles
+
+    def _get_student_profiles_bulk(self, user_ids: List[int]) -> Dict[int, StudentProfile]:
+        """Fetch student profiles for a chunk of users in one query"""
+        profiles = {}
+        for student in Student.objects.filter(user_id__in=user_ids):
+            profiles[student.user_id] = StudentProfile(
+                user_id=student.user_id,
+                score=max(0, int(student.score) if student.score is not None else 0),
+                grade=self._sanitize_string(student.grade) or "Please select an option"
+            )
+        return profiles
+
+    def _get_engagement_bulk(self, user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Fetch rolled up engagement for a chunk of users in one query"""
+        return engagement(user_ids)
+
+    def _get_user_posts_bulk(self, user_ids: List[int], limit: int) -> Dict[int, List[PostData]]:
+        """Fetch the latest `limit` posts of every user in the chunk in one query"""
+        posts_qs = self._top_n_per_user(
+            Post.objects.filter(author_id__in=user_ids).select_related('author'),
+            'author_id', F('id').desc(), limit
+        ).order_by('-id')
+        
+        posts = defaultdict(list)
+        for post in posts_qs:
+            posts[post.author_id].append(PostData(
+                id=post.id,
+                author_id=post.author_id,
+                author_username=self._sanitize_string(post.author.username),
+                caption=self._sanitize_string(post.caption),
+                description=self._sanitize_string(post.description),
+                likes=max(0, int(post.likes) if post.likes is not None else 0)
+            ))
+        return posts
+
+    def _get_user_comments_bulk(self, user_ids: List[int], limit: int) -> Dict[int, List[CommentData]]:
+        """Fetch the latest `limit` comments of every user in the chunk in one query"""
+        comments_qs = self._top_n_per_user(
+            Comment.objects.filter(author_id__in=user_ids).select_related('author'),
+            'author_id', F('id').desc(), limit
+        ).order_by('-id')
+        
+        comments = defaultdict(list)
+        for comment in comments_qs:
+            comments[comment.author_id].append(CommentData(
+                id=comment.id,
+                author_id=comment.author_id,
+                author_username=self._sanitize_string(comment.author.username),
+                body=self._sanitize_string(comment.body),
+                likes=max(0, comment.like_count)
+            ))
+        return comments
+
+    def _get_study_groups_bulk(self, user_ids: List[int], limit: int, active_only: bool = True) -> Dict[int, List[StudyGroupData]]:
+        """Fetch the latest `limit` study groups hosted by every user in the chunk in one query"""
+        query = StudyGroup.objects.filter(host_id__in=user_ids).select_related('host')
+        if active_only:
+            query = query.filter(is_active=True)
+        
+        groups_qs = self._top_n_per_user(
+            query, 'host_id', F('created_at').desc(), limit
+        ).order_by('-created_at')
+        
+        groups = defaultdict(list)
+        for group in groups_qs:
+            groups[group.host_id].append(StudyGroupData(
+                id=group.id,
+                host_id=group.host_id,
+                host_username=self._sanitize_string(group.host.username),
+                topic=self._sanitize_string(group.topic),
+                location=self._sanitize_string(group.location),
+                created_at=group.created_at,
+                scheduled_time=group.scheduled_time,
+                is_active=group.is_active
+            ))
+        return groups
+
+    def _get_study_group_invites_bulk(self, user_ids: List[int], limit: int) -> Dict[int, List[StudyGroupInviteData]]:
+        """Fetch the latest `limit` study group invites of every user in the chunk in one query"""
+        invites_qs = self._top_n_per_user(
+            StudyGroupInvite.objects.filter(student_id__in=user_ids).select_related('group', 'student'),
+            'student_id', F('id').desc(), limit
+        ).order_by('-id')
+        
+        invites = defaultdict(list)
+        for invite in invites_qs:
+            invites[invite.student_id].append(StudyGroupInviteData(
+                id=invite.id,
+                group_id=invite.group_id,
+                group_topic=self._sanitize_string(invite.group.topic),
+                student_id=invite.student_id,
+                student_username=self._sanitize_string(invite.student.username),
+                accepted=invite.accepted,
+                responded=invite.responded,
+                notified=invite.notified
+            ))
+        return invites
+
     def get_comprehensive_user_data(self, user_id: int) -> Dict[str, Any]:
         """
         Get all available user data (separated user and student data)
@@ -425,6 +674,7 @@ class DatabaseFetcher:
         comments = self.get_user_comments(user_id, 5)
         study_groups = self.get_study_groups(user_id, 5)
         study_invites = self.get_study_group_invites(user_id, 5)
+        activity = self.get_engagement(user_id)
         
         return {
             "user_profile": user_profile.to_dict() if user_profile else None,
@@ -433,6 +683,7 @@ class DatabaseFetcher:
             "comments": [comment.to_dict() for comment in comments],
             "study_groups": [group.to_dict() for group in study_groups],
             "study_invites": [invite.to_dict() for invite in study_invites],
+            "engagement": activity,
             "timestamp": datetime.now().isoformat()
         }
 
@@ -447,7 +698,72 @@ class DatabaseFetcher:
             Formatted string with user context
         """
         data = self.get_comprehensive_user_data(user_id)
+        return self._format_user_context(user_id, data)
+
+    def get_comprehensive_user_data_many(self, user_ids: Iterable[int], chunk_size: int = 500) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Get all available user data for many users, streamed chunk by chunk
+        
+        Each chunk costs seven queries in total (one per data category) instead
+        of seven per user. Per-user top-N is done in the database with ROW_NUMBER()
+        window functions and the rows are grouped in memory, so memory stays
+        bounded by the chunk size however many user IDs are passed in.
+        
+        Database errors propagate, as they do from get_comprehensive_user_data(),
+        rather than making every user in the chunk look like they have no data.
+        
+        Args:
+            user_ids: Iterable of user IDs (a list or a lazy queryset iterator)
+            chunk_size: Number of users fetched per round trip
+            
+        Yields:
+            (user_id, data) tuples in input order, where data has the same
+            shape as get_comprehensive_user_data()
+        """
+        chunk_size = self._validate_chunk_size(chunk_size)
+        
+        for chunk in self._iter_user_id_chunks(user_ids, chunk_size):
+            user_profiles = self._get_user_profiles_bulk(chunk)
+            student_profiles = self._get_student_profiles_bulk(chunk)
+            posts = self._get_user_posts_bulk(chunk, 5)
+            comments = self._get_user_comments_bulk(chunk, 5)
+            study_groups = self._get_study_groups_bulk(chunk, 5)
+            study_invites = self._get_study_group_invites_bulk(chunk, 5)
+            activity = self._get_engagement_bulk(chunk)
+            timestamp = datetime.now().isoformat()
+            
+            logger.info(f"Retrieved comprehensive data for a chunk of {len(chunk)} users")
+            
+            for user_id in chunk:
+                user_profile = user_profiles.get(user_id)
+                student_profile = student_profiles.get(user_id)
+                yield user_id, {
+                    "user_profile": user_profile.to_dict() if user_profile else None,
+                    "student_profile": student_profile.to_dict() if student_profile else None,
+                    "posts": [post.to_dict() for post in posts.get(user_id, [])],
+                    "comments": [comment.to_dict() for comment in comments.get(user_id, [])],
+                    "study_groups": [group.to_dict() for group in study_groups.get(user_id, [])],
+                    "study_invites": [invite.to_dict() for invite in study_invites.get(user_id, [])],
+                    "engagement": activity.get(user_id),
+                    "timestamp": timestamp
+                }
+
+    def get_formatted_user_context_many(self, user_ids: Iterable[int], chunk_size: int = 500) -> Iterator[Tuple[int, str]]:
+        """
+        Get formatted AI context strings for many users, streamed chunk by chunk
         
+        Args:
+            user_ids: Iterable of user IDs
+            chunk_size: Number of users fetched per round trip
+            
+        Yields:
+            (user_id, context) tuples in input order
+        """
+        for user_id, data in self.get_comprehensive_user_data_many(user_ids, chunk_size):
+            yield user_id, self._format_user_context(user_id, data)
+
+    def _format_user_context(self, user_id: int, data: Dict[str, Any]) -> str:
+        """Render comprehensive user data as the context string given to the AI"""
         if not data["user_profile"]:
             return f"User {user_id} not found in database."
         
@@ -488,8 +804,19 @@ Academic Focus: {'Foundation building and core concepts' if 'Middle' in student_
 Recent Posts: {len(data['posts'])} posts
 Recent Comments: {len(data['comments'])} comments
 Study Groups Hosted: {len(data['study_groups'])} groups
-Study Group Invites: {len(data['study_invites'])} invites
-Platform Engagement: {'High' if len(data['posts']) + len(data['comments']) + len(data['study_groups']) > 7 else 'Moderate' if len(data['posts']) + len(data['comments']) + len(data['study_groups']) > 3 else 'Low'}"""
+Study Group Invites: {len(data['study_invites'])} invites"""
+        
+        activity = data.get("engagement")
+        if activity:
+            accuracy = f"{100 * activity['correct_answers'] / activity['answers']:.0f}% correct" if activity['answers'] else "none answered"
+            context += f"""
+
+=== LAST {ENGAGEMENT_DAYS} DAYS ===
+Active Days: {activity['active_days']}
+Posts: {activity['posts']}, Comments: {activity['comments']}, Study Groups Created: {activity['groups']}
+Likes Given: {activity['likes_given']}, Likes Received: {activity['likes_received']}
+Knockout Games: {activity['games']} ({activity['answers']} questions, {accuracy})
+Platform Engagement: {activity['level']}"""
         
         return context.strip()
 
@@ -547,6 +874,14 @@ def get_comprehensive_data(user_id: int) -> Dict[str, Any]:
     """Get all user data (separated user/student) - convenience function"""
     return db_fetcher.get_comprehensive_user_data(user_id)
 
+def get_user_context_many(user_ids: Iterable[int], chunk_size: int = 500) -> Iterator[Tuple[int, str]]:
+    """Stream formatted user contexts for many users - convenience function"""
+    return db_fetcher.get_formatted_user_context_many(user_ids, chunk_size)
+
+def get_comprehensive_data_many(user_ids: Iterable[int], chunk_size: int = 500) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Stream all user data for many users - convenience function"""
+    return db_fetcher.get_comprehensive_user_data_many(user_ids, chunk_size)
+
 def get_user_posts(user_id: int, limit: int = 10) -> List[PostData]:
     """Get user posts - convenience function"""
     return db_fetcher.get_user_posts(user_id, limit)
@@ -677,7 +1012,7 @@ def fetch_comment_data(post_id=None, author_username=None):
     if post_id:
         try:
             post = Post.objects.get(id=post_id)
-            comments = Comment.objects.filter(post=post).select_related('author').prefetch_related('liked_by')
+            comments = Comment.objects.filter(post=post).select_related('author')
             if not comments:
                 print(f"No comments found for post ID {post_id}.")
                 return
@@ -689,7 +1024,7 @@ def fetch_comment_data(post_id=None, author_username=None):
     elif author_username:
         try:
             author = User.objects.get(username=author_username)
-            comments = Comment.objects.filter(author=author).select_related('post').prefetch_related('liked_by')
+            comments = Comment.objects.filter(author=author).select_related('post')
             if not comments:
                 print(f"No comments found by '{author_username}'.")
                 return
@@ -699,7 +1034,7 @@ def fetch_comment_data(post_id=None, author_username=None):
         except User.DoesNotExist:
             print(f"Author '{author_username}' not found.")
     else:
-        comments = Comment.objects.all().select_related('author', 'post').prefetch_related('liked_by')
+        comments = Comment.objects.all().select_related('author', 'post')
         if not comments:
             print("No comments found.")
             return
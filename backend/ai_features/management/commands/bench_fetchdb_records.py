@@ -0,0 +1,81 @@
+import sys
+import json
+import time
+import uuid
+from dataclasses import asdict, fields, make_dataclass
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+
+from ai_features.fetchdb import (
+    UserProfile, StudentProfile, PostData, CommentData, StudyGroupData, StudyGroupInviteData
+)
+
+
+def _legacy_class(cls):
+    """Plain (non-slotted) dataclass with the same fields, as the records were before"""
+    return make_dataclass(f'Legacy{cls.__name__}', [(f.name, f.type) for f in fields(cls)])
+
+
+def _legacy_to_dict(record):
+    """The old asdict()-then-patch serialisation path"""
+    data = asdict(record)
+    for key, value in data.items():
+        if isinstance(value, datetime):
+            data[key] = value.isoformat()
+    return data
+
+
+def _sample_kwargs():
+    now = datetime.now(timezone.utc)
+    return {
+        UserProfile: dict(user_id=1, username='student', email='student@example.com', first_name='Omar',
+                          last_name='Hassan', date_joined=now, last_login=now, is_active=True,
+                          is_staff=False, is_superuser=False),
+        StudentProfile: dict(user_id=1, score=1200, grade='Senior 2'),
+        PostData: dict(id=1, author_id=1, author_username='student', caption='Integration by parts',
+                       description='Can someone explain when to pick u and dv?' * 3, likes=12),
+        CommentData: dict(id=1, author_id=2, author_username='friend', body='Use LIATE as a rule of thumb.', likes=4),
+        StudyGroupData: dict(id=uuid.uuid4(), host_id=1, host_username='student', topic='Calculus',
+                             location='Library', created_at=now, scheduled_time=now, is_active=True),
+        StudyGroupInviteData: dict(id=1, group_id=uuid.uuid4(), group_topic='Calculus', student_id=2,
+                                   student_username='friend', accepted=False, responded=False, notified=True),
+    }
+
+
+def _per_record_ns(func, records):
+    start = time.perf_counter_ns()
+    for record in records:
+        func(record)
+    return (time.perf_counter_ns() - start) / len(records)
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark per-record serialisation cost of the fetchdb data classes (old vs new path)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=50000, help='Records per class per run')
+
+    def handle(self, *args, **options):
+        count = max(1, options['records'])
+
+        header = f"{'record':<22}{'bytes old':>10}{'bytes new':>10}{'asdict+json':>13}{'to_dict':>10}{'to_json':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for cls, kwargs in _sample_kwargs().items():
+            legacy_cls = _legacy_class(cls)
+            legacy_records = [legacy_cls(**kwargs) for _ in range(count)]
+            records = [cls(**kwargs) for _ in range(count)]
+
+            legacy_bytes = sys.getsizeof(legacy_records[0]) + sys.getsizeof(legacy_records[0].__dict__)
+            new_bytes = sys.getsizeof(records[0])
+
+            old_ns = _per_record_ns(lambda r: json.dumps(_legacy_to_dict(r), default=str), legacy_records)
+            to_dict_ns = _per_record_ns(lambda r: r.to_dict(), records)
+            to_json_ns = _per_record_ns(lambda r: r.to_json(), records)
+
+            self.stdout.write(
+                f"{cls.__name__:<22}{legacy_bytes:>10}{new_bytes:>10}"
+                f"{old_ns:>11.0f}ns{to_dict_ns:>8.0f}ns{to_json_ns:>8.0f}ns"
+            )
@@ -0,0 +1,103 @@
+import datetime
+import uuid
+from dataclasses import asdict
+from unittest import mock
+
+import orjson
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError
+from django.test import TestCase
+from django.utils import timezone
+
+from dof3a_base.models import Comment, Post, StudyGroup, StudyGroupInvite
+from .fetchdb import (
+    CommentData, DatabaseFetcher, PostData, StudentProfile, StudyGroupData, StudyGroupInviteData, UserProfile,
+)
+
+User = get_user_model()
+
+
+def make_users(count, prefix='user'):
+    return [
+        User.objects.create(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com')
+        for i in range(count)
+    ]
+
+
+class ComprehensiveDataManyTests(TestCase):
+    def setUp(self):
+        self.fetcher = DatabaseFetcher()
+        self.users = make_users(4)
+        for i, user in enumerate(self.users[:3]):
+            for j in range(i + 6):
+                post = Post.objects.create(author=user, caption=f'c{j}', description='d')
+                Comment.objects.create(author=self.users[(i + 1) % 4], post=post, body=f'b{j}')
+            group = StudyGroup.objects.create(host=user, topic=f'Topic {i}', location='Library',
+                                              scheduled_time=timezone.now())
+            StudyGroupInvite.objects.create(group=group, student=self.users[3], accepted=bool(i % 2))
+
+    def without_timestamp(self, data):
+        return {key: value for key, value in data.items() if key != 'timestamp'}
+
+    def test_matches_single_user_fetch(self):
+        user_ids = [user.pk for user in self.users] + [self.users[0].pk, 999999]
+        many = list(self.fetcher.get_comprehensive_user_data_many(user_ids, chunk_size=3))
+        # Input order, unknown users included; duplicates are only dropped within a chunk
+        self.assertEqual([user_id for user_id, _ in many], user_ids)
+        for user_id, data in many:
+            self.assertEqual(self.without_timestamp(data),
+                             self.without_timestamp(self.fetcher.get_comprehensive_user_data(user_id)))
+        self.assertEqual(len(many[0][1]['posts']), 5)
+
+    def test_queries_per_chunk(self):
+        user_ids = [user.pk for user in self.users]
+        # One query per data category for each chunk, however many users it holds
+        with self.assertNumQueries(7):
+            list(self.fetcher.get_comprehensive_user_data_many(user_ids, chunk_size=4))
+        with self.assertNumQueries(14):
+            list(self.fetcher.get_comprehensive_user_data_many(user_ids, chunk_size=2))
+
+    def test_database_errors_propagate(self):
+        with mock.patch.object(Post.objects, 'filter', side_effect=DatabaseError('gone')):
+            with self.assertRaises(DatabaseError):
+                list(self.fetcher.get_comprehensive_user_data_many([self.users[0].pk]))
+
+
+class RecordSerialisationTests(TestCase):
+    def setUp(self):
+        now = datetime.datetime(2026, 3, 1, 9, 30, 15, 123456, tzinfo=datetime.timezone.utc)
+        group = uuid.uuid4()
+        self.records = [
+            UserProfile(user_id=1, username='student', email='s@example.com', first_name='Omar', last_name='Hassan',
+                        date_joined=now, last_login=now, is_active=True, is_staff=False, is_superuser=False),
+            UserProfile(user_id=2, username='new', email='', first_name='', last_name='', date_joined=now,
+                        last_login=None, is_active=True, is_staff=True, is_superuser=False),
+            StudentProfile(user_id=1, score=1200, grade='Senior 2'),
+            PostData(id=1, author_id=1, author_username='student', caption='c', description='d', likes=12),
+            CommentData(id=1, author_id=2, author_username='friend', body='b', likes=4),
+            StudyGroupData(id=group, host_id=1, host_username='student', topic='Calculus', location='Library',
+                           created_at=now, scheduled_time=now + datetime.timedelta(days=1), is_active=True),
+            StudyGroupInviteData(id=3, group_id=group, group_topic='Calculus', student_id=2,
+                                 student_username='friend', accepted=False, responded=True, notified=False),
+        ]
+
+    def legacy_to_dict(self, record):
+        """What to_dict() returned when it went through asdict() and patched datetimes afterwards"""
+        data = asdict(record)
+        for key, value in data.items():
+            if isinstance(value, datetime.datetime):
+                data[key] = value.isoformat()
+        return data
+
+    def test_to_dict_matches_asdict(self):
+        for record in self.records:
+            with self.subTest(record=type(record).__name__):
+                self.assertEqual(record.to_dict(), self.legacy_to_dict(record))
+
+    def test_to_json_round_trips(self):
+        for record in self.records:
+            with self.subTest(record=type(record).__name__):
+                expected = {key: str(value) if isinstance(value, uuid.UUID) else value
+                            for key, value in record.to_dict().items()}
+                self.assertEqual(orjson.loads(record.to_json()), expected)
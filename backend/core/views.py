@@ -1,6 +1,25 @@
 from django.shortcuts import render
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.views import TokenObtainPairView
+
+from dof3a_base.activity import record as record_activity
 
 # Create your views here.
 
 def home_page(request):
-    return render(request, 'homepage.html')
\ No newline at end of file
+    return render(request, 'homepage.html')
+
+
+class LoginView(TokenObtainPairView):
+    """djoser's JWT create endpoint, also recording the login as activity."""
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as error:
+            raise InvalidToken(error.args[0])
+        record_activity(serializer.user.pk, 'login')
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
@@ -2,6 +2,10 @@
 ASGI config for dof3a project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django; WebSockets go to the knockout match engine, whose
+in-memory matches are checkpointed on lifespan shutdown. Matches live in
+one process, so serve /ws/knockout/ from a single worker or route it to
+sticky workers by game id.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +17,27 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dof3a.settings.development')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after setup so the app registry is ready for knockout's models
+from knockout.consumers import knockout_application  # noqa: E402
+from knockout.engine import engine  # noqa: E402
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engine.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        return await knockout_application(scope, receive, send)
+    if scope['type'] == 'lifespan':
+        return await lifespan(scope, receive, send)
+    return await django_application(scope, receive, send)
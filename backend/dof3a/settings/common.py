@@ -1,4 +1,5 @@
 import mimetypes
+import os
 import sys
 from pathlib import Path
 from datetime import timedelta
@@ -22,6 +23,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'ai_features',
     'dof3a_base',
+    'knockout',
     'djoser',
     'core',
 ]
@@ -105,4 +107,29 @@ DJOSER = {
     'SERIALIZERS': {
         'user_create': 'core.serializers.UserCreateSerializer'
     }
-}
\ No newline at end of file
+}
+
+# Run dof3a_base.background tasks inline instead of on the worker pool (tests, scripts)
+BACKGROUND_TASKS_EAGER = False
+
+# Authors with more friends than this are merged into feeds at read time
+# instead of being fanned out to every friend's timeline on write
+FEED_FANOUT_MAX_FRIENDS = 1000
+
+# Seconds buffered score deltas wait before being written together (0 writes at once)
+SCORE_FLUSH_INTERVAL = 0.5
+
+# Seconds buffered activity events wait before being written together (0 writes at once)
+ACTIVITY_FLUSH_INTERVAL = 1.0
+
+# Glicko-2 tau for knockout ratings: how fast a player's volatility may change (0.3 to 1.2)
+KNOCKOUT_RATING_TAU = 0.5
+
+# Shared by every web, ASGI and cron process: graph and leaderboard versions, streaks and
+# heatmaps are only seen by the other processes through it, so it can't be per-process
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    }
+}
@@ -1,12 +1,17 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from core.views import LoginView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('core.urls')),
     path('dof3a-api/', include('dof3a_base.urls')),
     path('api/ai/', include('ai_features.urls')),
+    path('api/knockout/', include('knockout.urls')),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls')),
+    # Ahead of djoser's own jwt/create/ so logins are recorded
+    path('auth/jwt/create/', LoginView.as_view(), name='jwt-create'),
     path('auth/', include('djoser.urls.jwt')),
 ]
\ No newline at end of file
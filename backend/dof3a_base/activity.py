@@ -0,0 +1,170 @@
+import atexit
+import logging
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import UserActivity
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# Events per INSERT when the buffer is flushed; reaching it also starts a flush early
+FLUSH_BATCH_SIZE = 1000
+# Events the buffer holds before whoever adds the next one has to write them out itself
+MAX_PENDING = 20000
+
+
+def flush_interval():
+    # Eager background tasks mean nothing should be left running behind the caller's back
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        return 0
+    return getattr(settings, 'ACTIVITY_FLUSH_INTERVAL', 1.0)
+
+
+def _write(events):
+    """
+    Insert one batch of events.
+
+    An event whose user was deleted while it waited fails the whole INSERT,
+    and retrying it would fail forever, so on an integrity error the batch
+    is written again without such events.
+    """
+    try:
+        UserActivity.objects.bulk_create(events)
+    except IntegrityError:
+        users = set(User.objects.filter(pk__in={event.user_id for event in events}).values_list('pk', flat=True))
+        kept = [event for event in events if event.user_id in users]
+        if len(kept) == len(events):
+            raise
+        logger.warning(f'Dropping {len(events) - len(kept)} activity events of deleted users')
+        UserActivity.objects.bulk_create(kept)
+
+
+class ActivityBuffer:
+    """
+    Collects activity events in memory and writes them with bulk_create().
+
+    Pending events are written once the flush interval passes or a full
+    batch has built up, whichever comes first, by a flusher thread. If
+    writes fall behind and MAX_PENDING events pile up, the thread adding one
+    flushes before returning, which slows producers to the database's pace
+    instead of growing the buffer without bound. Events a failed flush
+    didn't write go back in the buffer and are retried after another
+    interval, and whatever is left is written at exit, so every event is
+    written at least once.
+    """
+
+    def __init__(self, interval=None, batch_size=FLUSH_BATCH_SIZE, max_pending=MAX_PENDING):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._pending = []
+        self._lock = threading.Lock()
+        # Held while writing, so flushes don't interleave and exit waits for one in progress
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self._early = False
+
+    def _interval(self):
+        return flush_interval() if self.interval is None else self.interval
+
+    def add(self, event):
+        interval = self._interval()
+        with self._lock:
+            self._pending.append(event)
+            pending = len(self._pending)
+            if interval and pending < self.max_pending:
+                if pending >= self.batch_size and not self._early:
+                    self._early = True
+                    self._start_timer(0)
+                elif self._timer is None:
+                    self._start_timer(interval)
+        if not interval or pending >= self.max_pending:
+            self._flush_and_log()
+
+    def _start_timer(self, interval):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(interval, self._flush_in_thread)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Write everything pending now. Returns the number of events written."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                if self._timer is not None:
+                    self._timer.cancel()
+                self._timer = None
+                self._early = False
+
+            written = 0
+            try:
+                for start in range(0, len(pending), self.batch_size):
+                    _write(pending[start:start + self.batch_size])
+                    written += len(pending[start:start + self.batch_size])
+            except Exception:
+                # Put back what wasn't written, ahead of newer events, and retry it after
+                # another interval rather than leaving it until the next add() or exit
+                interval = self._interval()
+                with self._lock:
+                    self._pending[:0] = pending[written:]
+                    if interval and self._timer is None:
+                        self._start_timer(interval)
+                raise
+            return written
+
+    def _flush_and_log(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Flushing buffered activity failed')
+
+    def _flush_in_thread(self):
+        close_old_connections()
+        try:
+            self._flush_and_log()
+        finally:
+            connection.close()
+
+
+_buffer = ActivityBuffer()
+
+
+def record(user_id, activity_type, **metadata):
+    """
+    Queue an activity event for the user, written with other pending events.
+
+    The event is timestamped now but only enters the buffer once the
+    surrounding transaction commits, so rolled back work isn't recorded.
+    """
+    event = UserActivity(user_id=user_id, activity_type=activity_type, metadata=metadata, created_at=timezone.now())
+    transaction.on_commit(partial(_buffer.add, event))
+
+
+def record_many(user_ids, activity_type, **metadata):
+    """Queue the same event for several users, e.g. both players of a game."""
+    for user_id in user_ids:
+        record(user_id, activity_type, **metadata)
+
+
+def flush_activity():
+    return _buffer.flush()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        _buffer.flush()
+    except Exception:
+        logger.exception(f'Dropping {len(_buffer)} buffered activity events at exit')
@@ -1,18 +1,59 @@
 from django.contrib import admin
 from . import models
+from .likes import set_sharded_likes
 
 @admin.register(models.Student)
 class StudentAdmin(admin.ModelAdmin):
     list_display = ['user__email', 'score', 'grade']
     list_editable = ['grade']
     list_filter = ['grade']
+    # Kept by the score service and the friend signals with F() updates
+    COUNTERS = ['score', 'friend_count']
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # Write only what the form changed, so a counter read when the page
+        # loaded doesn't overwrite updates made since
+        fields = [name for name in form.changed_data if not obj._meta.get_field(name).many_to_many]
+        stale = [name for name in self.COUNTERS if name not in fields]
+        if stale:
+            # The leaderboard is told the saved score, so it has to be current
+            obj.refresh_from_db(fields=stale)
+        obj.save(update_fields=fields)
     
 @admin.register(models.Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ['caption', 'description', 'likes']
-    list_editable = ['likes']
+    list_display = ['caption', 'description', 'likes', 'sharded_likes']
+    # Both only change through dof3a_base.likes, which keeps the shards and the total consistent
+    readonly_fields = ['likes', 'sharded_likes']
+    actions = ['shard_likes', 'unshard_likes']
+
+    @admin.action(description='Count likes in shards')
+    def shard_likes(self, request, queryset):
+        for post in queryset:
+            set_sharded_likes(post, True)
+
+    @admin.action(description='Count likes on the post again, folding its shards')
+    def unshard_likes(self, request, queryset):
+        for post in queryset:
+            set_sharded_likes(post, False)
 
 @admin.register(models.FriendRequest)
 class PostAdmin(admin.ModelAdmin):
     list_display = ['from_student', 'to_student', 'is_accepted', 'timestamp']
     list_editable = ['is_accepted']
+
+@admin.register(models.UserActivity)
+class UserActivityAdmin(admin.ModelAdmin):
+    list_display = ['user', 'activity_type', 'created_at']
+    list_filter = ['activity_type']
+
+@admin.register(models.DailyActivity)
+class DailyActivityAdmin(admin.ModelAdmin):
+    list_display = ['user', 'day', 'posts', 'comments', 'likes_given', 'likes_received', 'games', 'answers']
+    list_filter = ['day']
+
+@admin.register(models.LearningStreak)
+class LearningStreakAdmin(admin.ModelAdmin):
+    list_display = ['user', 'current_streak', 'longest_streak', 'last_active_day']
@@ -6,4 +6,5 @@ class Dof3ABaseConfig(AppConfig):
     name = 'dof3a_base'
 
     def ready(self):
+        import dof3a_base.checks
         import dof3a_base.signals
\ No newline at end of file
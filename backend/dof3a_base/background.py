@@ -0,0 +1,33 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='dof3a-background')
+
+
+def run_in_background(func, *args, **kwargs):
+    """
+    Run `func` on the background worker pool once the current transaction commits.
+
+    With BACKGROUND_TASKS_EAGER the task runs inline on commit instead, which is
+    what tests and management commands want.
+    """
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        transaction.on_commit(lambda: func(*args, **kwargs))
+    else:
+        transaction.on_commit(lambda: _executor.submit(_run, func, args, kwargs))
+
+
+def _run(func, args, kwargs):
+    close_old_connections()
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception(f'Background task {func.__name__} failed')
+    finally:
+        # Worker threads outlive requests, so don't leave their connection open
+        connection.close()
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PER_PROCESS_CACHES = [
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+]
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """The default cache must be shared, or processes never see each other's graph, leaderboard and streak changes."""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PER_PROCESS_CACHES:
+        return [Error(
+            f"The default cache ({backend}) isn't shared between processes.",
+            hint='Point CACHES at Redis or Memcached, e.g. set REDIS_URL.',
+            id='dof3a_base.E001',
+        )]
+    return []
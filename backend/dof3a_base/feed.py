@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Student, Post, TimelineEntry
+
+# Posts copied into each side's timeline when two students become friends
+BACKFILL_POSTS = 50
+
+
+def fanout_limit():
+    return getattr(settings, 'FEED_FANOUT_MAX_FRIENDS', 1000)
+
+
+def fan_out_post(post_id):
+    """Write a new post into the author's timeline and every friend's (fan-out-on-write)."""
+    author = Student.objects.filter(user__post=post_id).values('pk', 'user_id', 'friend_count').first()
+    if author is None:
+        return
+
+    owner_ids = [author['user_id']]
+    if author['friend_count'] <= fanout_limit():
+        owner_ids.extend(Student.objects.filter(friends=author['pk']).values_list('user_id', flat=True))
+    # Otherwise friends pick the post up through feed_post_ids' read-time merge
+
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(owner_id=owner_id, post_id=post_id) for owner_id in owner_ids],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_author(student_id):
+    """
+    Write an author's recent posts into every friend's timeline.
+
+    Run when an author drops back under the fan-out limit: their posts from
+    while they were over it were only ever merged in at read time, and would
+    otherwise vanish from their friends' feeds.
+    """
+    author = Student.objects.filter(pk=student_id).values('user_id', 'friend_count').first()
+    if author is None or author['friend_count'] > fanout_limit():
+        return
+
+    post_ids = list(Post.objects.filter(author_id=author['user_id']).order_by('-id').values_list('id', flat=True)[:BACKFILL_POSTS])
+    friend_user_ids = Student.objects.filter(friends=student_id).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(owner_id=owner_id, post_id=post_id) for owner_id in friend_user_ids for post_id in post_ids],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_friendship(student_id, friend_ids):
+    """Copy each side's recent posts into the other's timeline after friends are added."""
+    students = dict(Student.objects.filter(pk__in=[student_id, *friend_ids]).values_list('pk', 'user_id'))
+    user_id = students.get(student_id)
+    if user_id is None:
+        return
+
+    entries = []
+    own_posts = list(Post.objects.filter(author_id=user_id).order_by('-id').values_list('id', flat=True)[:BACKFILL_POSTS])
+    for friend_id in friend_ids:
+        friend_user_id = students.get(friend_id)
+        if friend_user_id is None:
+            continue
+        friend_posts = Post.objects.filter(author_id=friend_user_id).order_by('-id').values_list('id', flat=True)[:BACKFILL_POSTS]
+        entries.extend(TimelineEntry(owner_id=user_id, post_id=post_id) for post_id in friend_posts)
+        entries.extend(TimelineEntry(owner_id=friend_user_id, post_id=post_id) for post_id in own_posts)
+
+    TimelineEntry.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+
+
+def prune_friendship(student_id, friend_ids):
+    """Drop each side's posts from the other's timeline after friends are removed."""
+    students = dict(Student.objects.filter(pk__in=[student_id, *friend_ids]).values_list('pk', 'user_id'))
+    user_id = students.pop(student_id, None)
+    if user_id is None:
+        return
+
+    friend_user_ids = list(students.values())
+    TimelineEntry.objects.filter(
+        Q(owner_id=user_id, post__author_id__in=friend_user_ids) |
+        Q(owner_id__in=friend_user_ids, post__author_id=user_id)
+    ).delete()
+
+
+def high_fanout_friend_ids(user):
+    """User IDs of the user's friends who are over the fan-out limit."""
+    return list(
+        Student.objects
+        .filter(friend_count__gt=fanout_limit(), friends__user=user)
+        .values_list('user_id', flat=True)
+    )
+
+
+def feed_post_ids(user, before=None, limit=20):
+    """
+    Newest-first post IDs for one page of the user's home feed.
+
+    The page is read straight off the (owner, post) timeline index, then
+    merged with the latest posts of any high-fan-out friends, which were never
+    written to the timeline.
+    """
+    timeline = TimelineEntry.objects.filter(owner=user)
+    if before is not None:
+        timeline = timeline.filter(post_id__lt=before)
+    post_ids = list(timeline.order_by('-post_id').values_list('post_id', flat=True)[:limit])
+
+    heavy_friend_ids = high_fanout_friend_ids(user)
+    if heavy_friend_ids:
+        live = Post.objects.filter(author_id__in=heavy_friend_ids)
+        if before is not None:
+            live = live.filter(id__lt=before)
+        post_ids.extend(live.order_by('-id').values_list('id', flat=True)[:limit])
+        post_ids = sorted(set(post_ids), reverse=True)[:limit]
+
+    return post_ids
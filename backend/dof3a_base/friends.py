@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models import Q
+
+from .models import FriendRequest
+
+# Upper bound on request ids accepted or rejected in one call
+MAX_BULK_REQUESTS = 100
+
+
+def accept_friend_requests(student, request_ids):
+    """
+    Accept the given requests sent to `student` in one transaction.
+
+    Requests that don't exist or were sent to someone else are skipped.
+    Returns the ids of the accepted requests in id order; rows are locked
+    in that order too, so overlapping calls can't deadlock on each other.
+    """
+    with transaction.atomic():
+        accepted = dict(
+            FriendRequest.objects.select_for_update()
+            .filter(pk__in=request_ids, to_student=student)
+            .order_by('pk')
+            .values_list('pk', 'from_student_id')
+        )
+        if accepted:
+            # friends is symmetrical, so one add() writes both directions
+            student.friends.add(*accepted.values())
+            # Requests the student had sent the other way are settled too
+            FriendRequest.objects.filter(
+                Q(pk__in=accepted) | Q(from_student=student, to_student__in=accepted.values())
+            ).delete()
+    return list(accepted)
+
+
+def reject_friend_requests(student, request_ids):
+    """Delete the given requests sent to `student`, returning the ids that were removed in id order."""
+    with transaction.atomic():
+        rejected = list(
+            FriendRequest.objects.select_for_update()
+            .filter(pk__in=request_ids, to_student=student)
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        if rejected:
+            FriendRequest.objects.filter(pk__in=rejected).delete()
+    return rejected
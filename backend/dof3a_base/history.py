@@ -0,0 +1,130 @@
+import datetime
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Student, ScoreHistory
+
+EVENT_DTYPE = np.dtype([('second', '<u4'), ('delta', '<i4')])
+SCORE_DTYPE = np.dtype('<i4')
+MAX_CHART_POINTS = 366
+
+
+def days_in_year(year):
+    return 366 if (year % 4 == 0 and year % 100 != 0) or year % 400 == 0 else 365
+
+
+def new_year(year, opening_score):
+    """Daily scores for a year with no changes yet, all at opening_score."""
+    return np.full(days_in_year(year), opening_score, dtype=SCORE_DTYPE)
+
+
+def append_changes(daily_scores, events, day, second, score, deltas):
+    """
+    Record changes in a year's packed arrays, returning the new (daily_scores, events) bytes.
+
+    Every day from `day` on closes at `score` until a later change says otherwise.
+    """
+    daily = np.frombuffer(daily_scores, dtype=SCORE_DTYPE).copy()
+    daily[day:] = score
+    logged = np.empty(len(deltas), dtype=EVENT_DTYPE)
+    logged['second'], logged['delta'] = second, deltas
+    return daily.tobytes(), bytes(events) + logged.tobytes()
+
+
+def downsample(closes, points):
+    """
+    Split daily closes into at most `points` buckets.
+
+    Returns each bucket's last index and its close, low and high scores.
+    """
+    edges = np.linspace(0, len(closes), min(points, len(closes)) + 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:] - 1
+    return ends, closes[ends], np.minimum.reduceat(closes, starts), np.maximum.reduceat(closes, starts)
+
+
+def record_changes(changes, at=None):
+    """Append score_changed rows to each student's history for the year of `at`."""
+    at = timezone.localtime(at or timezone.now())
+    year = at.year
+    day = at.timetuple().tm_yday - 1
+    second = int((at - at.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)).total_seconds())
+
+    deltas = {}
+    for student_id, _, _, delta in changes:
+        deltas[student_id] = deltas.get(student_id, 0) + delta
+
+    with transaction.atomic():
+        # Events from concurrent writers can arrive out of order, so days close
+        # at the score as it is now rather than the score carried by the event
+        current = dict(Student.objects.filter(pk__in=deltas).values_list('pk', 'score'))
+        # Deltas can be floored at zero, so a new row's opening score is a best guess
+        ScoreHistory.objects.bulk_create(
+            [
+                ScoreHistory(student_id=student_id, year=year,
+                             daily_scores=new_year(year, max(score - deltas[student_id], 0)).tobytes())
+                for student_id, score in current.items()
+            ],
+            ignore_conflicts=True,
+        )
+        rows = list(ScoreHistory.objects.select_for_update().filter(year=year, student_id__in=current))
+        for row in rows:
+            row.daily_scores, row.events = append_changes(
+                row.daily_scores, row.events, day, second, current[row.student_id],
+                [delta for student_id, _, _, delta in changes if student_id == row.student_id],
+            )
+        ScoreHistory.objects.bulk_update(rows, ['daily_scores', 'events'])
+
+
+def _opening_score(student_id, year):
+    """Score carried into `year`: the last close before it, else the first known, else the current score."""
+    earlier = (
+        ScoreHistory.objects.filter(student_id=student_id, year__lt=year)
+        .order_by('-year').values_list('daily_scores', flat=True).first()
+    )
+    if earlier is not None:
+        return int(np.frombuffer(earlier, dtype=SCORE_DTYPE)[-1])
+    later = (
+        ScoreHistory.objects.filter(student_id=student_id, year__gt=year)
+        .order_by('year').values_list('daily_scores', flat=True).first()
+    )
+    if later is not None:
+        return int(np.frombuffer(later, dtype=SCORE_DTYPE)[0])
+    return Student.objects.values_list('score', flat=True).get(pk=student_id)
+
+
+def score_chart(student_id, start, end, points=60):
+    """
+    A student's daily closing score from `start` to `end` (dates, inclusive).
+
+    Reads only the daily rollups of the years involved and downsamples them to
+    at most `points` buckets, each with its close, low and high.
+    """
+    end = min(end, timezone.localdate())
+    if start > end:
+        return []
+
+    years = dict(
+        ScoreHistory.objects.filter(student_id=student_id, year__range=(start.year, end.year))
+        .values_list('year', 'daily_scores')
+    )
+    chunks, carried = [], None
+    for year in range(start.year, end.year + 1):
+        if year in years:
+            daily = np.frombuffer(years[year], dtype=SCORE_DTYPE)
+        else:
+            if carried is None:
+                carried = _opening_score(student_id, year)
+            daily = np.full(days_in_year(year), carried, dtype=SCORE_DTYPE)
+        first = (start - datetime.date(year, 1, 1)).days if year == start.year else 0
+        last = (end - datetime.date(year, 1, 1)).days if year == end.year else len(daily) - 1
+        chunks.append(daily[first:last + 1])
+        carried = int(daily[-1])
+
+    closes = np.concatenate(chunks)
+    ends, close, low, high = downsample(closes, max(1, min(points, MAX_CHART_POINTS)))
+    return [
+        {'date': start + datetime.timedelta(days=int(day)), 'score': int(c), 'low': int(lo), 'high': int(hi)}
+        for day, c, lo, hi in zip(ends, close, low, high)
+    ]
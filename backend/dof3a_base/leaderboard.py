@@ -0,0 +1,307 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from .models import Student
+
+GLOBAL = 'global'
+# Keys per bucket of a RankedList; buckets split once they reach twice this
+BUCKET_SIZE = 512
+LEADERBOARD_VERSION_KEY = 'leaderboard:version'
+# Rebuild at least this often, so a change whose version bump was missed or evicted doesn't last
+LEADERBOARD_MAX_AGE = 300  # seconds
+
+
+class RankedList:
+    """
+    A sorted list of keys with O(log n) add, remove and rank lookups.
+
+    Keys are kept in sorted buckets of at most 2 * BUCKET_SIZE. A Fenwick tree
+    over the bucket lengths answers "how many keys sit in buckets before this one"
+    and "which bucket holds position p" in log time.
+
+    copy() shares the buckets between the two lists, and either list copies
+    a shared bucket the first time it changes it.
+    """
+
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self._buckets = [keys[i:i + BUCKET_SIZE] for i in range(0, len(keys), BUCKET_SIZE)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._len = len(keys)
+        # ids of buckets another list may still hold
+        self._shared = frozenset()
+        self._build_index()
+
+    def copy(self):
+        """An equal list in O(buckets) rather than O(n)."""
+        other = RankedList.__new__(RankedList)
+        other._buckets, other._maxes, other._tree = list(self._buckets), list(self._maxes), list(self._tree)
+        other._len = self._len
+        self._shared = other._shared = frozenset(map(id, self._buckets))
+        return other
+
+    def _own(self, i):
+        """Bucket i, copied first if another list may still hold it."""
+        bucket = self._buckets[i]
+        if id(bucket) in self._shared:
+            bucket = self._buckets[i] = bucket[:]
+        return bucket
+
+    def __len__(self):
+        return self._len
+
+    def _build_index(self):
+        tree = [0] * (len(self._buckets) + 1)
+        for i, bucket in enumerate(self._buckets, 1):
+            tree[i] += len(bucket)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _index_add(self, bucket, delta):
+        i = bucket + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _keys_before(self, bucket):
+        total, i = 0, bucket
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, position):
+        """Bucket index and offset of the key at `position`."""
+        bucket, step = 0, 1 << (len(self._buckets).bit_length() - 1)
+        while step:
+            if bucket + step <= len(self._buckets) and self._tree[bucket + step] <= position:
+                bucket += step
+                position -= self._tree[bucket]
+            step >>= 1
+        return bucket, position
+
+    def add(self, key):
+        if not self._buckets:
+            self._buckets, self._maxes = [[key]], [key]
+            self._len = 1
+            self._build_index()
+            return
+
+        i = min(bisect_left(self._maxes, key), len(self._buckets) - 1)
+        bucket = self._own(i)
+        insort(bucket, key)
+        self._maxes[i] = bucket[-1]
+        self._len += 1
+        if len(bucket) >= 2 * BUCKET_SIZE:
+            self._buckets[i:i + 1] = [bucket[:BUCKET_SIZE], bucket[BUCKET_SIZE:]]
+            self._maxes[i:i + 1] = [bucket[BUCKET_SIZE - 1], bucket[-1]]
+            self._build_index()
+        else:
+            self._index_add(i, 1)
+
+    def remove(self, key):
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            raise ValueError(f'{key!r} not in list')
+        bucket = self._buckets[i]
+        position = bisect_left(bucket, key)
+        if bucket[position] != key:
+            raise ValueError(f'{key!r} not in list')
+
+        bucket = self._own(i)
+        del bucket[position]
+        self._len -= 1
+        if bucket:
+            self._maxes[i] = bucket[-1]
+            self._index_add(i, -1)
+        else:
+            del self._buckets[i], self._maxes[i]
+            self._build_index()
+
+    def rank(self, key):
+        """How many keys sort before `key`, whether or not it is in the list."""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            return self._len
+        return self._keys_before(i) + bisect_left(self._buckets[i], key)
+
+    def slice(self, start, stop):
+        start, stop = max(start, 0), min(stop, self._len)
+        if start >= stop:
+            return []
+        i, offset = self._locate(start)
+        keys = []
+        while len(keys) < stop - start:
+            keys.extend(self._buckets[i][offset:offset + stop - start - len(keys)])
+            i, offset = i + 1, 0
+        return keys
+
+
+def _key(student_id, score):
+    # Highest score first, lower student id first among equal scores
+    return (-score, student_id)
+
+
+class Leaderboard:
+    """
+    Global and per-grade boards of (student, score).
+
+    Ranks are competition ranks: students on equal scores share a rank.
+    The process-wide boards are never changed once published: changes are
+    made to a copy() that then replaces them, so readers never see one half
+    applied.
+    """
+
+    def __init__(self, rows=(), version=None):
+        self.entries = {}
+        by_board = defaultdict(list)
+        for student_id, grade, score in rows:
+            self.entries[student_id] = (grade, score)
+            by_board[GLOBAL].append(_key(student_id, score))
+            by_board[grade].append(_key(student_id, score))
+        self.boards = defaultdict(RankedList, {board: RankedList(keys) for board, keys in by_board.items()})
+        self.version = version
+        self.built_at = time.monotonic()
+
+    def copy(self):
+        """Boards to change without disturbing readers of these ones."""
+        other = Leaderboard.__new__(Leaderboard)
+        other.entries = dict(self.entries)
+        other.boards = defaultdict(RankedList, {name: board.copy() for name, board in self.boards.items()})
+        other.version, other.built_at = self.version, self.built_at
+        return other
+
+    def _board(self, name):
+        # Not self.boards[name]: a reader mustn't add boards to a published Leaderboard
+        return self.boards.get(name) or RankedList()
+
+    @classmethod
+    def load(cls):
+        """Cold rebuild from the database, read in (grade, score) index order."""
+        cache.add(LEADERBOARD_VERSION_KEY, 0, None)
+        version = cache.get(LEADERBOARD_VERSION_KEY)
+        rows = Student.objects.order_by('grade', '-score', 'pk').values_list('pk', 'grade', 'score')
+        return cls(rows.iterator(chunk_size=5000), version)
+
+    def update(self, student_id, grade, score):
+        current = self.entries.get(student_id)
+        if current == (grade, score):
+            return
+        if current is not None:
+            self.remove(student_id)
+        self.entries[student_id] = (grade, score)
+        self.boards[GLOBAL].add(_key(student_id, score))
+        self.boards[grade].add(_key(student_id, score))
+
+    def remove(self, student_id):
+        grade, score = self.entries.pop(student_id)
+        self.boards[GLOBAL].remove(_key(student_id, score))
+        self.boards[grade].remove(_key(student_id, score))
+
+    def _row(self, board, key):
+        return {'rank': board.rank((key[0], 0)) + 1, 'student': key[1], 'score': -key[0]}
+
+    def top(self, board_name, limit):
+        board = self._board(board_name)
+        return [self._row(board, key) for key in board.slice(0, limit)]
+
+    def around(self, board_name, student_id, radius):
+        """The student's row plus up to `radius` rows either side, or [] if they aren't ranked."""
+        if student_id not in self.entries:
+            return []
+        board = self._board(board_name)
+        position = board.rank(_key(student_id, self.entries[student_id][1]))
+        return [self._row(board, key) for key in board.slice(position - radius, position + radius + 1)]
+
+    def among(self, student_ids):
+        """Rank an arbitrary set of students, such as someone's friends, against each other."""
+        keys = sorted(_key(pk, self.entries[pk][1]) for pk in student_ids if pk in self.entries)
+        rows, rank = [], 0
+        for position, key in enumerate(keys):
+            if position == 0 or key[0] != keys[position - 1][0]:
+                rank = position + 1
+            rows.append({'rank': rank, 'student': key[1], 'score': -key[0]})
+        return rows
+
+
+_leaderboard = None
+_leaderboard_lock = threading.Lock()
+# Held by the one thread rebuilding the boards, so others don't rebuild them again meanwhile
+_load_lock = threading.Lock()
+
+
+def _is_stale(leaderboard):
+    return (
+        leaderboard is None
+        or leaderboard.version != cache.get(LEADERBOARD_VERSION_KEY)
+        or time.monotonic() - leaderboard.built_at > LEADERBOARD_MAX_AGE
+    )
+
+
+def get_leaderboard():
+    """
+    The process-wide Leaderboard, rebuilt when another process has changed scores or it is LEADERBOARD_MAX_AGE old.
+
+    The rebuild runs outside _leaderboard_lock and is swapped in when done;
+    while one thread rebuilds, the others keep reading the boards they
+    have, and only wait when there are none yet.
+    """
+    global _leaderboard
+    leaderboard = _leaderboard
+    if not _is_stale(leaderboard):
+        return leaderboard
+    if not _load_lock.acquire(blocking=leaderboard is None):
+        return leaderboard
+    try:
+        leaderboard = _leaderboard
+        if _is_stale(leaderboard):
+            loaded = Leaderboard.load()
+            with _leaderboard_lock:
+                # Keep the current boards if changes applied while loading made them fresh again
+                if _is_stale(_leaderboard):
+                    _leaderboard = loaded
+                leaderboard = _leaderboard
+        return leaderboard
+    finally:
+        _load_lock.release()
+
+
+def record_score(student_id, grade, score):
+    """Apply a committed score or grade change to this process's boards and tell the others."""
+    _record(lambda board: board.update(student_id, grade, score))
+
+
+def record_scores(changes):
+    """Batch form of record_score() for scores.score_changed events."""
+    def apply(board):
+        for student_id, grade, score, _ in changes:
+            board.update(student_id, grade, score)
+    _record(apply)
+
+
+def record_removal(student_id):
+    _record(lambda board: board.entries.get(student_id) and board.remove(student_id))
+
+
+def _record(change):
+    global _leaderboard
+    with _leaderboard_lock:
+        cache.add(LEADERBOARD_VERSION_KEY, 0, None)
+        version = cache.incr(LEADERBOARD_VERSION_KEY)
+        if _leaderboard is None:
+            return
+        if _leaderboard.version is not None and version == _leaderboard.version + 1:
+            # Readers may be using the current boards, so change a copy and swap it in
+            leaderboard = _leaderboard.copy()
+            change(leaderboard)
+            leaderboard.version = version
+            _leaderboard = leaderboard
+        else:
+            # Some other process changed scores too; rebuild on next use
+            _leaderboard = None
@@ -0,0 +1,72 @@
+import random
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Post, PostLike, PostLikeShard
+
+# Number of counter rows a sharded post spreads its likes over. Concurrent
+# likers only contend when they pick the same shard.
+LIKE_SHARDS = 16
+
+
+def like_post(post, user):
+    """Record a like from `user`. Returns False if they had already liked the post."""
+    with transaction.atomic():
+        _, created = PostLike.objects.get_or_create(post=post, user=user)
+        if created:
+            _apply_like_delta(post, 1)
+    return created
+
+
+def unlike_post(post, user):
+    """Remove `user`'s like. Returns False if there was nothing to remove."""
+    with transaction.atomic():
+        deleted, _ = PostLike.objects.filter(post=post, user=user).delete()
+        if deleted:
+            _apply_like_delta(post, -1)
+    return bool(deleted)
+
+
+def get_like_count(post):
+    """
+    Current like total, including any increments still sitting in shards.
+
+    Shards are summed whether or not the post is sharded now: a post
+    switched back keeps its shard totals until they are folded, and a liker
+    that read the flag just before the switch can still write to a shard.
+    """
+    return Post.objects.with_like_totals().values_list('like_total', flat=True).get(pk=post.pk)
+
+
+def fold_like_shards(post):
+    """Move the shard totals into Post.likes and zero the shards."""
+    with transaction.atomic():
+        shards = list(PostLikeShard.objects.select_for_update().filter(post=post))
+        pending = sum(shard.count for shard in shards)
+        if pending:
+            Post.objects.filter(pk=post.pk).update(likes=F('likes') + pending)
+            PostLikeShard.objects.filter(pk__in=[shard.pk for shard in shards]).update(count=0)
+    return pending
+
+
+def set_sharded_likes(post, enabled):
+    """Switch a post in or out of sharded counting, folding shards when leaving it."""
+    Post.objects.filter(pk=post.pk).update(sharded_likes=enabled)
+    post.sharded_likes = enabled
+    if not enabled:
+        fold_like_shards(post)
+
+
+def _apply_like_delta(post, delta):
+    if not post.sharded_likes:
+        Post.objects.filter(pk=post.pk).update(likes=F('likes') + delta)
+        return
+
+    shard = random.randrange(LIKE_SHARDS)
+    updated = PostLikeShard.objects.filter(post=post, shard=shard).update(count=F('count') + delta)
+    if not updated:
+        # First hit on this shard: create the row, then apply the delta with
+        # F() so a concurrent creator's increment isn't overwritten.
+        PostLikeShard.objects.get_or_create(post=post, shard=shard)
+        PostLikeShard.objects.filter(post=post, shard=shard).update(count=F('count') + delta)
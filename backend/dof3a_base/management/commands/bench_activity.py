@@ -0,0 +1,92 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from dof3a_base.activity import ActivityBuffer
+from dof3a_base.models import UserActivity
+
+User = get_user_model()
+
+PREFIX = 'activity-bench-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Write synthetic activity events from several producer threads, one INSERT per event and through '
+        'the activity buffer, and report events per second for each. Synthetic users are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--producers', type=int, default=8)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        # Per-row inserts are only timed up to this many events
+        parser.add_argument('--row-limit', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        User.objects.bulk_create([
+            User(username=f'{PREFIX}{i}', email=f'{PREFIX}{i}@example.com') for i in range(options['users'])
+        ])
+        user_ids = list(User.objects.filter(username__startswith=PREFIX).values_list('pk', flat=True))
+        header = f"{'events':>9}{'per row':>11}{'rows/s':>10}{'buffered':>11}{'events/s':>11}{'speedup':>9}{'backlog':>9}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        try:
+            for events in options['events']:
+                self._bench(events, user_ids, options)
+        finally:
+            UserActivity.objects.filter(user_id__in=user_ids).delete()
+            User.objects.filter(username__startswith=PREFIX).delete()
+
+    def _produce(self, events, user_ids, producers, write):
+        """Call write(event) from `producers` threads, `events` times in all. Returns the seconds taken."""
+        def producer(offset):
+            try:
+                for i in range(offset, events, producers):
+                    write(UserActivity(user_id=user_ids[i % len(user_ids)], activity_type='login', metadata={'n': i}))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=producer, args=(offset,)) for offset in range(producers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+    def _bench(self, events, user_ids, options):
+        per_row, rows_per_second, speedup, row_seconds = '-', '-', '-', None
+        if events <= options['row_limit']:
+            row_seconds = self._produce(events, user_ids, options['producers'], lambda event: event.save())
+            per_row = f'{row_seconds:.2f}s'
+            rows_per_second = f'{events / row_seconds:,.0f}'
+        UserActivity.objects.filter(user_id__in=user_ids).delete()
+
+        buffer = ActivityBuffer(interval=0.2, batch_size=options['batch_size'])
+        backlog = 0
+
+        def write(event):
+            nonlocal backlog
+            buffer.add(event)
+            backlog = max(backlog, len(buffer))
+
+        started = time.perf_counter()
+        self._produce(events, user_ids, options['producers'], write)
+        buffer.flush()
+        # Until the last event is in the database, not just in the buffer
+        seconds_written = time.perf_counter() - started
+        written = UserActivity.objects.filter(user_id__in=user_ids).count()
+        assert written == events, f'{written} of {events} events written'
+        if row_seconds is not None:
+            speedup = f'{row_seconds / seconds_written:.0f}x'
+        UserActivity.objects.filter(user_id__in=user_ids).delete()
+
+        self.stdout.write(
+            f'{events:>9}{per_row:>11}{rows_per_second:>10}{seconds_written:>10.2f}s'
+            f'{events / seconds_written:>11,.0f}{speedup:>9}{backlog:>9}'
+        )
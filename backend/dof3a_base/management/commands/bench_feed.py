@@ -0,0 +1,80 @@
+import time
+import statistics
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dof3a_base.feed import feed_post_ids
+from dof3a_base.models import Student, Post, TimelineEntry
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Benchmark home-feed read latency (timeline vs. join on friends) as friend counts grow. '
+            'Synthetic data is written inside a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--friends', type=int, nargs='+', default=[10, 100, 1000, 5000])
+        parser.add_argument('--posts-per-friend', type=int, default=10)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--runs', type=int, default=50)
+
+    def handle(self, *args, **options):
+        header = f"{'friends':>8}{'posts':>10}{'timeline p50':>15}{'timeline p95':>15}{'join p50':>12}{'join p95':>12}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for friend_count in options['friends']:
+            with transaction.atomic():
+                reader = self._seed(friend_count, options['posts_per_friend'])
+                timeline = self._time(lambda: feed_post_ids(reader, limit=options['page_size']), options)
+                join = self._time(
+                    lambda: list(
+                        Post.objects.filter(author__student__friends__user=reader)
+                        .order_by('-id').values_list('id', flat=True)[:options['page_size']]
+                    ),
+                    options,
+                )
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f"{friend_count:>8}{friend_count * options['posts_per_friend']:>10}"
+                f"{timeline[0]:>13.2f}ms{timeline[1]:>13.2f}ms{join[0]:>10.2f}ms{join[1]:>10.2f}ms"
+            )
+
+    def _seed(self, friend_count, posts_per_friend):
+        tag = f'benchfeed{time.time_ns()}'
+        users = User.objects.bulk_create([
+            User(username=f'{tag}_{i}', email=f'{tag}_{i}@example.com') for i in range(friend_count + 1)
+        ])
+        students = Student.objects.bulk_create([Student(user=user, score=0, friend_count=1) for user in users])
+        reader, friends = students[0], students[1:]
+        Student.objects.filter(pk=reader.pk).update(friend_count=friend_count)
+
+        through = Student.friends.through
+        through.objects.bulk_create(
+            [through(from_student=reader, to_student=friend) for friend in friends] +
+            [through(from_student=friend, to_student=reader) for friend in friends],
+            batch_size=5000,
+        )
+        posts = Post.objects.bulk_create(
+            [Post(author_id=friend.user_id, caption='bench', description='...')
+             for _ in range(posts_per_friend) for friend in friends],
+            batch_size=5000,
+        )
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(owner_id=reader.user_id, post_id=post.pk) for post in posts],
+            batch_size=5000,
+        )
+        return users[0]
+
+    def _time(self, read_page, options):
+        samples = []
+        for _ in range(options['runs']):
+            start = time.perf_counter()
+            read_page()
+            samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
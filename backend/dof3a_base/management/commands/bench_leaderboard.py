@@ -0,0 +1,49 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from dof3a_base.leaderboard import GLOBAL, Leaderboard
+from dof3a_base.models import Student
+
+GRADES = [grade for grade, _ in Student.STUDENT_GRADE]
+
+
+class Command(BaseCommand):
+    help = 'Report leaderboard build, query and update times on synthetic boards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--samples', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        header = f"{'students':>9}{'build':>11}{'top 50':>11}{'my rank':>11}{'around':>11}{'update':>11}{'sort':>11}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for students in options['students']:
+            rows = [(pk, rng.choice(GRADES), rng.randrange(100_000)) for pk in range(1, students + 1)]
+            start = time.perf_counter()
+            board = Leaderboard(rows)
+            build_ms = (time.perf_counter() - start) * 1000
+
+            sample = [rng.randrange(1, students + 1) for _ in range(options['samples'])]
+            top_ms = self._time(lambda: [board.top(GLOBAL, 50) for _ in sample], len(sample))
+            rank_ms = self._time(lambda: [board.around(GLOBAL, pk, 0) for pk in sample], len(sample))
+            around_ms = self._time(lambda: [board.around(row[1], row[0], 5) for row in (rows[pk - 1] for pk in sample)], len(sample))
+            update_ms = self._time(
+                lambda: [board.update(pk, board.entries[pk][0], rng.randrange(100_000)) for pk in sample], len(sample))
+            # What every call paid before: sorting the whole board
+            scores = [score for _, _, score in rows]
+            sort_ms = self._time(lambda: sorted(scores, reverse=True)[:50], 1)
+
+            self.stdout.write(
+                f'{students:>9}{build_ms:>9.0f}ms{top_ms:>9.4f}ms{rank_ms:>9.4f}ms{around_ms:>9.4f}ms'
+                f'{update_ms:>9.4f}ms{sort_ms:>9.1f}ms'
+            )
+
+    def _time(self, func, calls):
+        start = time.perf_counter()
+        func()
+        return (time.perf_counter() - start) * 1000 / calls
@@ -0,0 +1,72 @@
+import math
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from dof3a_base.ranking import score_candidates, topic_match, WEIGHTS, RECENCY_HALF_LIFE_HOURS
+
+SAMPLE_TEXTS = [
+    'help with fractions and decimals homework',
+    'anyone revising organic chemistry tonight?',
+    'study group for trigonometry at the library',
+    'funny thing happened in class today',
+]
+
+
+def score_with_loop(age_hours, likes, comments, is_friend, same_grade, topic):
+    """Per-post Python loop, for comparison with the vectorised score_candidates()"""
+    scores = []
+    for i in range(len(age_hours)):
+        scores.append(
+            WEIGHTS['recency'] * 2 ** (-age_hours[i] / RECENCY_HALF_LIFE_HOURS)
+            + WEIGHTS['likes'] * math.log1p(likes[i])
+            + WEIGHTS['comments'] * math.log1p(comments[i])
+            + WEIGHTS['friend'] * is_friend[i]
+            + WEIGHTS['same_grade'] * same_grade[i]
+            + WEIGHTS['topic'] * topic[i]
+        )
+    return sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+
+
+class Command(BaseCommand):
+    help = 'Report feed ranking time per candidate set size (vectorised vs. per-post loop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 300, 1000, 10000, 100000])
+        parser.add_argument('--runs', type=int, default=20)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        header = f"{'candidates':>11}{'topic match':>14}{'score+sort':>13}{'python loop':>14}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for size in options['sizes']:
+            features = dict(
+                age_hours=rng.exponential(24.0, size),
+                likes=rng.poisson(5, size).astype(np.float64),
+                comments=rng.poisson(2, size).astype(np.float64),
+                is_friend=rng.integers(0, 2, size).astype(np.float64),
+                same_grade=rng.integers(0, 2, size).astype(np.float64),
+            )
+            texts = np.array([SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] for i in range(size)])
+
+            topic_ms = self._time(lambda: topic_match(texts, 'Senior 1'), options['runs'])
+            topic = topic_match(texts, 'Senior 1')
+            vector_ms = self._time(
+                lambda: np.argsort(-score_candidates(topic_match=topic, **features), kind='stable'),
+                options['runs'],
+            )
+            loop_ms = self._time(
+                lambda: score_with_loop(topic=topic.tolist(), **{k: v.tolist() for k, v in features.items()}),
+                max(1, options['runs'] // 4),
+            )
+
+            self.stdout.write(f"{size:>11}{topic_ms:>12.3f}ms{vector_ms:>11.3f}ms{loop_ms:>12.3f}ms")
+
+    def _time(self, func, runs):
+        start = time.perf_counter()
+        for _ in range(runs):
+            func()
+        return (time.perf_counter() - start) * 1000 / runs
@@ -0,0 +1,62 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from dof3a_base.history import EVENT_DTYPE, SCORE_DTYPE, days_in_year, downsample
+
+SECONDS_PER_DAY = 86400
+
+
+def daily_closes(events, days):
+    """Closing score per day from an event log, carrying the last close over days without events."""
+    scores = np.maximum(np.cumsum(events['delta']), 0)
+    # Index of each day's last event, or -1 before the first
+    last_event = np.full(days, -1, dtype=np.int64)
+    last_event[events['second'] // SECONDS_PER_DAY] = np.arange(len(events))
+    last_event = np.maximum.accumulate(last_event)
+    return np.where(last_event >= 0, scores[last_event], 0)
+
+
+class Command(BaseCommand):
+    help = 'Report score history bytes per student-year and chart time against scanning raw events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events-per-day', type=float, nargs='+', default=[1, 10, 50])
+        parser.add_argument('--points', type=int, default=52)
+        parser.add_argument('--runs', type=int, default=200)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        days = days_in_year(2025)
+        header = f"{'events/day':>11}{'rollup':>10}{'events':>10}{'total':>10}{'chart':>11}{'scan':>11}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for per_day in options['events_per_day']:
+            count = int(per_day * days)
+            events = np.empty(count, dtype=EVENT_DTYPE)
+            events['second'] = np.sort(rng.integers(0, days * SECONDS_PER_DAY, count))
+            events['delta'] = rng.integers(-5, 20, count)
+
+            event_bytes = events.tobytes()
+            daily_bytes = daily_closes(events, days).astype(SCORE_DTYPE).tobytes()
+
+            chart_ms = self._time(
+                lambda: downsample(np.frombuffer(daily_bytes, dtype=SCORE_DTYPE), options['points']), options['runs'])
+            scan_ms = self._time(lambda: self.chart_from_events(event_bytes, days, options['points']), options['runs'])
+
+            self.stdout.write(
+                f'{per_day:>11g}{len(daily_bytes):>9}B{len(event_bytes):>9}B{len(daily_bytes) + len(event_bytes):>9}B'
+                f'{chart_ms:>9.4f}ms{scan_ms:>9.4f}ms'
+            )
+
+    def chart_from_events(self, event_bytes, days, points):
+        """The same chart rebuilt from the raw event log, for comparison."""
+        return downsample(daily_closes(np.frombuffer(event_bytes, dtype=EVENT_DTYPE), days), points)
+
+    def _time(self, func, runs):
+        start = time.perf_counter()
+        for _ in range(runs):
+            func()
+        return (time.perf_counter() - start) * 1000 / runs
@@ -0,0 +1,70 @@
+import time
+from collections import Counter
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from dof3a_base.suggestions import FriendGraph, NO_GRADE
+
+
+def random_friendships(students, degree, rng):
+    """Symmetric random friendship edges giving each student about `degree` friends."""
+    src = rng.integers(1, students + 1, students * degree // 2)
+    dst = rng.integers(1, students + 1, len(src))
+    keep = src != dst
+    src, dst = np.concatenate([src[keep], dst[keep]]), np.concatenate([dst[keep], src[keep]])
+    keys = np.unique((src << 32) | dst)
+    return keys >> 32, keys & 0xFFFFFFFF
+
+
+class Command(BaseCommand):
+    help = 'Report friend-of-friend candidate time on synthetic graphs (CSR arrays vs. Python sets)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--degrees', type=int, nargs='+', default=[20, 100, 300])
+        parser.add_argument('--samples', type=int, default=200)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        header = f"{'students':>9}{'friends':>9}{'build':>11}{'csr':>11}{'sets':>11}{'applied':>11}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for students in options['students']:
+            for degree in options['degrees']:
+                src, dst = random_friendships(students, degree, rng)
+                student_ids = np.arange(1, students + 1, dtype=np.int64)
+                grades = np.full(students, NO_GRADE, dtype=np.int8)
+
+                start = time.perf_counter()
+                graph = FriendGraph.from_edges(student_ids, grades, src, dst)
+                build_ms = (time.perf_counter() - start) * 1000
+
+                adjacency = {}
+                for a, b in zip(src.tolist(), dst.tolist()):
+                    adjacency.setdefault(a, set()).add(b)
+
+                sample = rng.integers(1, students + 1, options['samples']).tolist()
+                csr_ms = self._time(lambda: [graph.mutual_counts(pk) for pk in sample], len(sample))
+                sets_ms = self._time(lambda: [self.mutual_counts_with_sets(adjacency, pk) for pk in sample], len(sample))
+
+                # Same lookups with a full batch of pending, uncompacted changes
+                changed = graph
+                for pk in rng.integers(1, students + 1, 100).tolist():
+                    changed = changed.with_changes(pk, rng.integers(1, students + 1, 5), added=True)
+                applied_ms = self._time(lambda: [changed.mutual_counts(pk) for pk in sample], len(sample))
+
+                self.stdout.write(
+                    f'{students:>9}{degree:>9}{build_ms:>9.1f}ms{csr_ms:>9.3f}ms{sets_ms:>9.3f}ms{applied_ms:>9.3f}ms'
+                )
+
+    def mutual_counts_with_sets(self, adjacency, student_id):
+        friends = adjacency.get(student_id, set())
+        counts = Counter(pk for friend in friends for pk in adjacency.get(friend, ()))
+        return {pk: n for pk, n in counts.items() if pk != student_id and pk not in friends}
+
+    def _time(self, func, calls):
+        start = time.perf_counter()
+        func()
+        return (time.perf_counter() - start) * 1000 / calls
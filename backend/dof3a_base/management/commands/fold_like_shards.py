@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from dof3a_base.likes import fold_like_shards
+from dof3a_base.models import Post, PostLikeShard
+
+
+class Command(BaseCommand):
+    help = (
+        'Fold the like shards of every post holding any into Post.likes. '
+        'Run it periodically from cron so shards stay small and unsharded posts give theirs back.'
+    )
+
+    def handle(self, *args, **options):
+        folded = 0
+        for post in Post.objects.filter(pk__in=PostLikeShard.objects.exclude(count=0).values('post')).only('pk', 'likes'):
+            folded += fold_like_shards(post)
+        self.stdout.write(self.style.SUCCESS(f'Folded {folded} likes from shards.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dof3a_base.models import Comment
+
+
+class Command(BaseCommand):
+    help = 'Rebuild Comment.like_count from the liked_by M2M table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Comments updated per UPDATE statement, walked in primary key order')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        last_pk = 0
+        updated = 0
+
+        while True:
+            pks = list(
+                Comment.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+
+            with transaction.atomic():
+                updated += Comment.objects.filter(pk__gte=pks[0], pk__lte=pks[-1]).sync_like_counts()
+            last_pk = pks[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt like counts for {updated} comments.'))
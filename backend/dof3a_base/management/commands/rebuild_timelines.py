@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from dof3a_base.feed import fan_out_post
+from dof3a_base.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Fan existing posts out into home-feed timelines (idempotent)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since-id', type=int, default=0, help='Only fan out posts with a larger id')
+
+    def handle(self, *args, **options):
+        post_ids = Post.objects.filter(pk__gt=options['since_id']).order_by('pk').values_list('pk', flat=True)
+        total = 0
+        for post_id in post_ids.iterator(chunk_size=2000):
+            fan_out_post(post_id)
+            total += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Fanned out {total} posts.'))
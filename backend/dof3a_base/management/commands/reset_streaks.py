@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from dof3a_base.streaks import reset_broken_streaks, update_streaks
+
+
+class Command(BaseCommand):
+    help = (
+        'Count any outstanding activity towards streaks, then reset the streaks of everyone who missed '
+        'yesterday. Run it nightly from cron, after midnight.'
+    )
+
+    def handle(self, *args, **options):
+        update_streaks()
+        reset = reset_broken_streaks()
+        self.stdout.write(self.style.SUCCESS(f'Reset {reset} broken streaks'))
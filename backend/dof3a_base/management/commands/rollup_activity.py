@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from dof3a_base.rollups import rollup
+from dof3a_base.streaks import update_streaks
+
+
+class Command(BaseCommand):
+    help = (
+        'Add activity events and post likes recorded since the last run to the per-user daily rollups '
+        'and learning streaks. Run it every few minutes from cron.'
+    )
+
+    def handle(self, *args, **options):
+        read = rollup()
+        read['streak'] = update_streaks()
+        self.stdout.write(self.style.SUCCESS(
+            'Rolled up ' + ', '.join(f'{count} {source} rows' for source, count in read.items())
+        ))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_like_count(apps, schema_editor):
+    Comment = apps.get_model("dof3a_base", "Comment")
+    like_totals = (
+        Comment.liked_by.through.objects.filter(comment=OuterRef("pk"))
+        .order_by()
+        .values("comment")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    Comment.objects.update(like_count=Coalesce(Subquery(like_totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dof3a_base", "0005_alter_studygroup_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="like_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_like_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.4 on 2026-10-19 03:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_friend_count(apps, schema_editor):
+    Student = apps.get_model("dof3a_base", "Student")
+    friend_totals = (
+        Student.friends.through.objects.filter(from_student=OuterRef("pk"))
+        .order_by()
+        .values("from_student")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    Student.objects.update(friend_count=Coalesce(Subquery(friend_totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dof3a_base", "0007_post_likes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="student",
+            name="friend_count",
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.CreateModel(
+            name="TimelineEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to="dof3a_base.post",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("owner", "post")},
+            },
+        ),
+        migrations.RunPython(populate_friend_count, migrations.RunPython.noop),
+    ]
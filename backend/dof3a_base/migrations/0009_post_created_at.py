@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:41
+
+import datetime
+
+from django.db import migrations, models
+
+# Existing posts have no creation time on record. Giving them the migration
+# time would rank every one of them as brand new, so they get a date old
+# enough that recency gives them nothing.
+EXISTING_POSTS_CREATED_AT = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dof3a_base", "0008_timelineentry_student_friend_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="created_at",
+            field=models.DateTimeField(
+                auto_now_add=True,
+                db_index=True,
+                default=EXISTING_POSTS_CREATED_AT,
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-19 03:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dof3a_base", "0009_post_created_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="student",
+            index=models.Index(
+                fields=["grade", "-score"], name="student_grade_score_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="student",
+            index=models.Index(fields=["-score"], name="student_score_idx"),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-19 03:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dof3a_base", "0010_student_score_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScoreHistory",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("year", models.PositiveSmallIntegerField()),
+                ("daily_scores", models.BinaryField()),
+                ("events", models.BinaryField(default=b"")),
+                (
+                    "student",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="score_history",
+                        to="dof3a_base.student",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("student", "year")},
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.4 on 2026-10-19 04:46
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dof3a_base", "0011_scorehistory"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserActivity",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "activity_type",
+                    models.CharField(
+                        choices=[
+                            ("login", "Login"),
+                            ("post_create", "Post Created"),
+                            ("comment_create", "Comment Created"),
+                            ("knockout_join", "Joined Knockout"),
+                            ("knockout_complete", "Completed Knockout"),
+                            ("group_create", "Created Study Group"),
+                            ("profile_update", "Profile Updated"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("metadata", models.JSONField(blank=True, default=dict)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="activities",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "created_at"],
+                        name="dof3a_base__user_id_2f55ba_idx",
+                    )
+                ],
+            },
+        ),
+    ]
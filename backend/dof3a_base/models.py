@@ -1,9 +1,26 @@
 from django.db import models
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery, Sum, Window
+from django.db.models.functions import Coalesce, RowNumber
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 import uuid
 
 User = get_user_model()
 
+class StudentQuerySet(models.QuerySet):
+    def sync_friend_counts(self):
+        """Rebuild friend_count from the friends table in a single UPDATE."""
+        friend_totals = (
+            Student.friends.through.objects
+            .filter(from_student=OuterRef('pk'))
+            .order_by()
+            .values('from_student')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return self.update(friend_count=Coalesce(Subquery(friend_totals), 0))
+
+
 class Student(models.Model):
     OPTION_SELECT = 'Please select an option'
     MIDDLE_ONE = 'Middle 1'
@@ -28,6 +45,17 @@ class Student(models.Model):
     score = models.PositiveIntegerField()
     grade = models.CharField(max_length=50, choices=STUDENT_GRADE, default=OPTION_SELECT)
     friends = models.ManyToManyField('self', blank=True)
+    # Denormalised len(friends), kept in sync by signals.sync_friend_counts
+    friend_count = models.PositiveIntegerField(default=0, db_index=True)
+
+    objects = StudentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Cold leaderboard rebuilds and per-grade top-N read in index order
+            models.Index(fields=['grade', '-score'], name='student_grade_score_idx'),
+            models.Index(fields=['-score'], name='student_score_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'{self.user.username}'
@@ -44,24 +72,126 @@ class FriendRequest(models.Model):
     class Meta:
         unique_together = ('from_student', 'to_student')
 
+class PostQuerySet(models.QuerySet):
+    def with_like_totals(self):
+        """Annotate like_total: Post.likes plus whatever is still held in shards."""
+        shard_totals = (
+            PostLikeShard.objects
+            .filter(post=OuterRef('pk'))
+            .order_by()
+            .values('post')
+            .annotate(total=Sum('count'))
+            .values('total')
+        )
+        return self.annotate(like_total=F('likes') + Coalesce(Subquery(shard_totals), 0))
+
+    def with_counts(self):
+        """Annotate like_total (shards included) and comment_count without joins."""
+        comment_totals = (
+            Comment.objects
+            .filter(post=OuterRef('pk'))
+            .order_by()
+            .values('post')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return self.with_like_totals().annotate(comment_count=Coalesce(Subquery(comment_totals), 0))
+
+    def with_top_comments(self, limit):
+        """Prefetch the newest `limit` comments per post into post.top_comments."""
+        top_comments = Comment.objects.annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('post_id')],
+                order_by=F('id').desc()
+            )
+        ).filter(row_number__lte=limit).order_by('-id')
+        return self.prefetch_related(Prefetch('comments', queryset=top_comments, to_attr='top_comments'))
+
+
 class Post(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     caption = models.CharField(max_length=200)
     description = models.TextField()
     likes = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Hot posts spread like increments over PostLikeShard rows instead of
+    # serialising every like on this row's lock; see dof3a_base.likes.
+    sharded_likes = models.BooleanField(default=False)
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return f'{self.caption}, likes ({self.likes})'
 
+
+class PostLike(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='post_likes')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='post_likes')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('post', 'user')
+
+
+class PostLikeShard(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='like_shards')
+    shard = models.PositiveSmallIntegerField()
+    # Signed: an unlike can land on a different shard than the like it undoes
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('post', 'shard')
+
+class CommentQuerySet(models.QuerySet):
+    def sync_like_counts(self):
+        """Rebuild like_count from the liked_by table in a single UPDATE."""
+        like_totals = (
+            Comment.liked_by.through.objects
+            .filter(comment=OuterRef('pk'))
+            .order_by()
+            .values('comment')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return self.update(like_count=Coalesce(Subquery(like_totals), 0))
+
+
+class TimelineEntry(models.Model):
+    """A post materialised into a user's home feed; written by dof3a_base.feed."""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+
+    class Meta:
+        unique_together = ('owner', 'post')
+
+
+class ScoreHistory(models.Model):
+    """One student's score changes over one calendar year as packed arrays; see dof3a_base.history."""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='score_history')
+    year = models.PositiveSmallIntegerField()
+    # Little-endian int32 closing score for every day of the year
+    daily_scores = models.BinaryField()
+    # (uint32 seconds into the year, int32 delta) for every change, oldest first
+    events = models.BinaryField(default=b'')
+
+    class Meta:
+        unique_together = ('student', 'year')
+
+
 class Comment(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     body = models.TextField()
     liked_by = models.ManyToManyField(User, related_name='liked_comments', blank=True)
+    # Denormalised len(liked_by), kept in sync by signals.sync_comment_like_count
+    like_count = models.PositiveIntegerField(default=0)
+
+    objects = CommentQuerySet.as_manager()
 
     @property
     def likes(self):
-        return self.liked_by.count()
+        return self.like_count
 
 class StudyGroup(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -77,4 +207,62 @@ class StudyGroupInvite(models.Model):
     student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='studygroup_invites')
     accepted = models.BooleanField(default=False)
     responded = models.BooleanField(default=False)
-    notified = models.BooleanField(default=False)
\ No newline at end of file
+    notified = models.BooleanField(default=False)
+
+
+class UserActivity(models.Model):
+    """One thing a user did, written in batches by dof3a_base.activity."""
+    ACTIVITY_TYPES = [
+        ('login', 'Login'),
+        ('post_create', 'Post Created'),
+        ('comment_create', 'Comment Created'),
+        ('knockout_join', 'Joined Knockout'),
+        ('knockout_complete', 'Completed Knockout'),
+        ('group_create', 'Created Study Group'),
+        ('profile_update', 'Profile Updated'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities')
+    activity_type = models.CharField(max_length=20, choices=ACTIVITY_TYPES)
+    metadata = models.JSONField(default=dict, blank=True)
+    # When it happened, not when the buffer wrote it
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_at'])]
+
+    def __str__(self):
+        return f'{self.user} {self.activity_type} at {self.created_at}'
+
+
+class DailyActivity(models.Model):
+    """One user's activity totals for one day, rolled up by dof3a_base.rollups."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_activity')
+    day = models.DateField()
+    posts = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+    likes_given = models.PositiveIntegerField(default=0)
+    likes_received = models.PositiveIntegerField(default=0)
+    groups = models.PositiveIntegerField(default=0)
+    games = models.PositiveIntegerField(default=0)
+    answers = models.PositiveIntegerField(default=0)
+    correct_answers = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'day')
+
+
+class RollupWatermark(models.Model):
+    """The last primary key of a source table that a rollup has counted."""
+    source = models.CharField(max_length=50, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class LearningStreak(models.Model):
+    """Consecutive days a user has been active, kept by dof3a_base.streaks."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='learning_streak')
+    current_streak = models.PositiveIntegerField(default=0)
+    longest_streak = models.PositiveIntegerField(default=0)
+    last_active_day = models.DateField(null=True, blank=True, db_index=True)
+
@@ -0,0 +1,98 @@
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from ai_features.curriculum import grade_topics
+from .feed import feed_post_ids
+from .models import Student, Post
+
+# How many of the newest feed posts are considered for ranking
+CANDIDATE_POOL = 300
+RANKED_FEED_TTL = 60  # seconds
+RECENCY_HALF_LIFE_HOURS = 24.0
+
+WEIGHTS = {
+    'recency': 3.0,
+    'likes': 1.0,
+    'comments': 1.5,
+    'friend': 1.0,
+    'same_grade': 0.5,
+    'topic': 2.0,
+}
+
+
+def score_candidates(age_hours, likes, comments, is_friend, same_grade, topic_match, weights=WEIGHTS):
+    """
+    Blend per-candidate feature arrays into one score array.
+
+    Every argument is a 1-D array with one entry per candidate, so the whole
+    set is scored in a handful of vectorised passes.
+    """
+    return (
+        weights['recency'] * np.exp2(-age_hours / RECENCY_HALF_LIFE_HOURS)
+        + weights['likes'] * np.log1p(likes)
+        + weights['comments'] * np.log1p(comments)
+        + weights['friend'] * is_friend
+        + weights['same_grade'] * same_grade
+        + weights['topic'] * topic_match
+    )
+
+
+def topic_match(texts, grade_level):
+    """Fraction of the grade's curriculum topics (capped at 3) mentioned in each text."""
+    topics = np.array([topic.lower() for topic in grade_topics(grade_level)])
+    if not topics.size or not texts.size:
+        return np.zeros(texts.shape, dtype=np.float64)
+
+    hits = np.char.find(texts[:, None], topics[None, :]) >= 0
+    return np.minimum(hits.sum(axis=1), 3) / 3.0
+
+
+def rank_feed(user):
+    """Rank the user's newest feed candidates, returning post IDs best first."""
+    post_ids = feed_post_ids(user, limit=CANDIDATE_POOL)
+    if not post_ids:
+        return []
+
+    viewer_grade = Student.objects.filter(user=user).values_list('grade', flat=True).first()
+    if viewer_grade == Student.OPTION_SELECT:
+        # The unselected placeholder isn't a grade; it would match everyone else who hasn't picked one
+        viewer_grade = None
+    rows = list(
+        Post.objects.filter(id__in=post_ids)
+        .with_counts()
+        .order_by('-id')
+        .values_list('id', 'author_id', 'author__student__grade', 'created_at',
+                     'like_total', 'comment_count', 'caption', 'description')
+    )
+
+    now = timezone.now()
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    authors = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    grades = np.array([row[2] or '' for row in rows])
+    age_hours = np.fromiter(((now - row[3]).total_seconds() / 3600 for row in rows), dtype=np.float64, count=len(rows))
+    likes = np.fromiter((row[4] for row in rows), dtype=np.float64, count=len(rows))
+    comments = np.fromiter((row[5] for row in rows), dtype=np.float64, count=len(rows))
+    texts = np.array([f'{row[6]} {row[7]}'.lower() for row in rows])
+
+    scores = score_candidates(
+        age_hours=np.maximum(age_hours, 0.0),
+        likes=likes,
+        comments=comments,
+        is_friend=(authors != user.pk).astype(np.float64),
+        same_grade=(grades == viewer_grade).astype(np.float64) if viewer_grade else np.zeros(len(rows)),
+        topic_match=topic_match(texts, viewer_grade),
+    )
+    # Stable sort on -score keeps newer posts first among ties
+    order = np.argsort(-scores, kind='stable')
+    return ids[order].tolist()
+
+
+def ranked_post_ids(user):
+    """Cached rank_feed(); pages of one ranking stay consistent for RANKED_FEED_TTL."""
+    key = f'ranked_feed:{user.pk}'
+    ranked = cache.get(key)
+    if ranked is None:
+        ranked = rank_feed(user)
+        cache.set(key, ranked, RANKED_FEED_TTL)
+    return ranked
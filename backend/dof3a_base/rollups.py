@@ -0,0 +1,150 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import DailyActivity, PostLike, RollupWatermark, UserActivity
+
+COUNTERS = ['posts', 'comments', 'likes_given', 'likes_received', 'groups', 'games', 'answers', 'correct_answers']
+# The DailyActivity counter each activity type adds one to
+ACTIVITY_COUNTERS = {
+    'post_create': 'posts',
+    'comment_create': 'comments',
+    'group_create': 'groups',
+    'knockout_complete': 'games',
+}
+# Source rows rolled up per transaction
+CHUNK_SIZE = 10000
+# Rows newer than this are left for the next run, so a slower transaction can still commit
+# rows with lower primary keys before the watermark passes them
+SETTLE_SECONDS = 60
+# Engagement is judged over this many days up to today
+ENGAGEMENT_DAYS = 30
+# (level, days active, actions) from the top: a user reaching either threshold gets the level
+ENGAGEMENT_LEVELS = [('High', 12, 40), ('Moderate', 4, 10)]
+
+
+def _activity_totals(rows):
+    totals = defaultdict(lambda: defaultdict(int))
+    for _, user_id, created_at, activity_type, metadata in rows:
+        counter = ACTIVITY_COUNTERS.get(activity_type)
+        if counter is None:
+            continue
+        day = totals[user_id, timezone.localdate(created_at)]
+        day[counter] += 1
+        if activity_type == 'knockout_complete':
+            day['answers'] += metadata.get('answers', 0)
+            day['correct_answers'] += metadata.get('correct', 0)
+    return totals
+
+
+def _like_totals(rows):
+    totals = defaultdict(lambda: defaultdict(int))
+    for _, user_id, created_at, author_id in rows:
+        day = timezone.localdate(created_at)
+        totals[user_id, day]['likes_given'] += 1
+        totals[author_id, day]['likes_received'] += 1
+    return totals
+
+
+# Sources for consume(), each with what its rows add to the daily totals
+SOURCES = {
+    'activity': (
+        lambda: UserActivity.objects.values_list('pk', 'user_id', 'created_at', 'activity_type', 'metadata'),
+        _activity_totals,
+    ),
+    'post_likes': (
+        lambda: PostLike.objects.values_list('pk', 'user_id', 'created_at', 'post__author_id'),
+        _like_totals,
+    ),
+}
+
+
+def _merge(totals):
+    """
+    Add {(user_id, day): {counter: n}} to the daily rows.
+
+    Missing rows are inserted empty, skipping any another run inserted
+    first, and counters are then incremented with F() expressions, one
+    UPDATE per distinct set of increments touching only the counters that
+    changed. Nothing read is written back, so the activity and post like
+    rollups can run at the same time without losing each other's counts.
+    """
+    DailyActivity.objects.bulk_create(
+        [DailyActivity(user_id=user_id, day=day) for user_id, day in totals], batch_size=1000, ignore_conflicts=True,
+    )
+    pks = {
+        (user_id, day): pk for pk, user_id, day in DailyActivity.objects.filter(
+            user_id__in={user_id for user_id, _ in totals}, day__in={day for _, day in totals},
+        ).values_list('pk', 'user_id', 'day')
+    }
+    groups = defaultdict(list)
+    for key, counts in totals.items():
+        groups[tuple(sorted(counts.items()))].append(pks[key])
+    for increments, ids in groups.items():
+        DailyActivity.objects.filter(pk__in=ids).update(**{counter: F(counter) + count for counter, count in increments})
+
+
+def consume(source, queryset, apply, chunk_size=CHUNK_SIZE, now=None):
+    """
+    Pass rows of `queryset` added since the source's watermark to apply(rows), a chunk at a time. Returns rows read.
+
+    Rows are (pk, user id, created_at, ...) in primary key order, up to the
+    first one younger than SETTLE_SECONDS. apply() and the watermark move
+    together in one transaction, and the watermark row is locked while they
+    do, so concurrent or interrupted runs of the same source never see a row
+    twice. Runs of different sources aren't serialised, so apply() mustn't
+    overwrite what another source's run may be writing.
+    """
+    cutoff = (now or timezone.now()) - timedelta(seconds=SETTLE_SECONDS)
+    RollupWatermark.objects.get_or_create(source=source)
+    read = 0
+    while True:
+        with transaction.atomic():
+            mark = RollupWatermark.objects.select_for_update().get(source=source)
+            rows = list(queryset.filter(pk__gt=mark.position).order_by('pk')[:chunk_size])
+            rows = rows[:next((i for i, row in enumerate(rows) if row[2] >= cutoff), len(rows))]
+            if not rows:
+                return read
+            apply(rows)
+            mark.position = rows[-1][0]
+            mark.save(update_fields=['position', 'updated_at'])
+        read += len(rows)
+
+
+def rollup(chunk_size=CHUNK_SIZE, now=None):
+    """Add everything new in the activity stream and post likes to the daily rows. Returns rows read per source."""
+    return {
+        source: consume(source, queryset(), lambda rows, totals=totals: _merge(totals(rows)), chunk_size, now)
+        for source, (queryset, totals) in SOURCES.items()
+    }
+
+
+def engagement_level(totals):
+    actions = totals['posts'] + totals['comments'] + totals['groups'] + totals['games']
+    for level, days, minimum in ENGAGEMENT_LEVELS:
+        if totals['active_days'] >= days or actions >= minimum:
+            return level
+    return 'Low'
+
+
+def engagement(user_ids, days=ENGAGEMENT_DAYS, today=None):
+    """
+    Each user's totals over the last `days` days, with the days they were active and their engagement level.
+
+    One aggregate query over the daily rows however many users are asked
+    for; users with no activity get zeros.
+    """
+    today = today or timezone.localdate()
+    rows = (
+        DailyActivity.objects.filter(user_id__in=user_ids, day__gt=today - timedelta(days=days))
+        .values('user_id').annotate(active_days=Count('pk'), **{counter: Sum(counter) for counter in COUNTERS})
+    )
+    totals = {user_id: dict.fromkeys(COUNTERS + ['active_days'], 0) for user_id in user_ids}
+    for row in rows:
+        totals[row.pop('user_id')] = row
+    for user_totals in totals.values():
+        user_totals['level'] = engagement_level(user_totals)
+    return totals
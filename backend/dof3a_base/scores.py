@@ -0,0 +1,160 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, connection, models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Least
+from django.dispatch import Signal
+
+from .models import Student
+
+logger = logging.getLogger(__name__)
+
+# Sent once scores are written, with changes=[(student_id, grade, new_score, delta), ...]
+score_changed = Signal()
+
+# Students per batched UPDATE when the buffer is flushed
+FLUSH_BATCH_SIZE = 500
+
+
+def flush_interval():
+    return getattr(settings, 'SCORE_FLUSH_INTERVAL', 0.5)
+
+
+def _score_plus(delta):
+    """score + delta as an expression, floored at zero without going negative on the way."""
+    if delta >= 0:
+        return F('score') + Value(delta)
+    # MySQL rejects an unsigned column dipping below zero even inside GREATEST()
+    return F('score') - Least(F('score'), Value(-delta), output_field=models.PositiveIntegerField())
+
+
+def _apply_deltas(deltas):
+    """Write {student_id: delta} in one UPDATE and return the resulting (id, grade, score, delta) rows."""
+    with transaction.atomic():
+        if len(deltas) == 1:
+            [(student_id, delta)] = deltas.items()
+            score = _score_plus(delta)
+        else:
+            score = Case(
+                *(When(pk=student_id, then=_score_plus(delta)) for student_id, delta in deltas.items()),
+                default=F('score'),
+                output_field=models.PositiveIntegerField(),
+            )
+        Student.objects.filter(pk__in=deltas).update(score=score)
+        rows = Student.objects.filter(pk__in=deltas).values_list('pk', 'grade', 'score')
+        return [(student_id, grade, score, deltas[student_id]) for student_id, grade, score in rows]
+
+
+def _send(changes):
+    if changes:
+        score_changed.send(sender=Student, changes=changes)
+
+
+def add_points(student_id, delta):
+    """
+    Atomically add `delta` (which may be negative) to one student's score, now.
+
+    Returns the new score. score_changed is sent once the surrounding
+    transaction commits.
+    """
+    changes = _apply_deltas({student_id: delta})
+    transaction.on_commit(partial(_send, changes))
+    return changes[0][2] if changes else None
+
+
+class ScoreBuffer:
+    """
+    Collects bursts of small score deltas per student and writes them together.
+
+    Deltas for the same student are summed, and everything pending is written
+    FLUSH_BATCH_SIZE students per UPDATE ... CASE once the flush interval passes.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def _interval(self):
+        return flush_interval() if self.interval is None else self.interval
+
+    def _arm(self, interval):
+        """Start the flush timer unless one is already running. Called with the lock held."""
+        if self._timer is None:
+            self._timer = threading.Timer(interval, self._flush_in_thread)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def add(self, student_id, delta):
+        interval = self._interval()
+        with self._lock:
+            self._pending[student_id] += delta
+            if interval:
+                self._arm(interval)
+        if not interval:
+            self.flush()
+
+    def flush(self):
+        """Write everything pending now. Returns the number of students updated."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._timer = None
+
+        deltas = [(student_id, delta) for student_id, delta in pending.items() if delta]
+        changes = []
+        try:
+            for start in range(0, len(deltas), FLUSH_BATCH_SIZE):
+                changes.extend(_apply_deltas(dict(deltas[start:start + FLUSH_BATCH_SIZE])))
+        except Exception:
+            # Put back what wasn't written and retry it after another interval,
+            # rather than leaving it until the next add() or exit
+            interval = self._interval()
+            with self._lock:
+                for student_id, delta in deltas[start:]:
+                    self._pending[student_id] += delta
+                if interval:
+                    self._arm(interval)
+            raise
+        finally:
+            _send(changes)
+        return len(changes)
+
+    def _flush_in_thread(self):
+        close_old_connections()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Flushing buffered score deltas failed')
+        finally:
+            connection.close()
+
+
+_buffer = ScoreBuffer()
+
+
+def buffer_points(student_id, delta):
+    """
+    Queue `delta` for the student's score, written with other pending deltas.
+
+    Use this for frequent small awards; the delta only enters the buffer once
+    the surrounding transaction commits.
+    """
+    transaction.on_commit(partial(_buffer.add, student_id, delta))
+
+
+def flush_scores():
+    return _buffer.flush()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        _buffer.flush()
+    except Exception:
+        logger.exception('Dropping buffered score deltas at exit')
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Student, Post, Comment, FriendRequest, StudyGroup
+from .friends import MAX_BULK_REQUESTS
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -12,10 +13,17 @@ class SimpleUserSerializer(serializers.ModelSerializer):
 
 class StudentSerializer(serializers.ModelSerializer):
     user = SimpleUserSerializer()
+    mutual_friends = serializers.SerializerMethodField()
 
     class Meta:
         model = Student
-        fields = ['id', 'user', 'grade', 'score']
+        fields = ['id', 'user', 'grade', 'score', 'friend_count', 'mutual_friends']
+        # Scores only change through dof3a_base.scores
+        read_only_fields = ['score', 'friend_count']
+
+    def get_mutual_friends(self, obj):
+        # Batch-computed by the view; None where it wasn't asked for
+        return self.context.get('mutual_friends', {}).get(obj.pk)
 
 class SimpleCommentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -24,11 +32,15 @@ class SimpleCommentSerializer(serializers.ModelSerializer):
 
 
 class PostSerializer(serializers.ModelSerializer):
-    comments = SimpleCommentSerializer(many=True)
+    # Expects PostViewSet's queryset: with_counts() annotations and the
+    # top_comments prefetch. The rest are served by PostViewSet.more_comments.
+    comments = SimpleCommentSerializer(many=True, source='top_comments')
+    likes = serializers.IntegerField(source='like_total', read_only=True)
+    comment_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Post
-        fields = ['id', 'author', 'caption', 'description', 'comments']
+        fields = ['id', 'author', 'caption', 'description', 'likes', 'comment_count', 'comments']
 
 
 class CreatePostSerialier(serializers.ModelSerializer):
@@ -43,9 +55,12 @@ class CreatePostSerialier(serializers.ModelSerializer):
 
 
 class CommentSerializer(serializers.ModelSerializer):
+    # Annotated by CommentViewSet.get_queryset; omitted on freshly created comments
+    liked_by_me = serializers.BooleanField(read_only=True)
+
     class Meta:
         model = Comment
-        fields = ['id', 'author', 'post', 'body', 'likes']
+        fields = ['id', 'author', 'post', 'body', 'likes', 'liked_by_me']
         read_only_fields = ['id', 'author', 'post', 'likes']
 
     def create(self, validated_data):
@@ -55,7 +70,6 @@ class CommentSerializer(serializers.ModelSerializer):
 
         validated_data['author'] = author
         validated_data['post'] = post
-        validated_data['likes'] = 0
 
         return super().create(validated_data)
 
@@ -68,10 +82,19 @@ class StudentUserSerializer(serializers.ModelSerializer):
 
 class FriendRequestSerializer(serializers.ModelSerializer):
     from_student = StudentUserSerializer(source='from_student.user', read_only=True)
+    friend_count = serializers.IntegerField(source='from_student.friend_count', read_only=True)
+    mutual_friends = serializers.SerializerMethodField()
 
     class Meta:
         model = FriendRequest
-        fields = ['id', 'from_student', 'timestamp']
+        fields = ['id', 'from_student', 'friend_count', 'mutual_friends', 'timestamp']
+
+    def get_mutual_friends(self, obj):
+        return self.context.get('mutual_friends', {}).get(obj.from_student_id)
+
+class FriendRequestIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=MAX_BULK_REQUESTS)
 
 class StudyGroupSerializer(serializers.ModelSerializer):
     class Meta:
@@ -1,11 +1,152 @@
-from django.db.models.signals import post_save
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import Student
+from djoser.signals import user_updated
+from .models import Student, Post, Comment, FriendRequest, StudyGroup
+from .background import run_in_background
+from .scores import score_changed
+from django.utils import timezone
+
+from . import activity, feed, history, leaderboard, suggestions
 
 User = get_user_model()
 
 @receiver(post_save, sender=User)
 def create_student_instance_on_creating_user(sender, instance, created, **kwargs):
     if created:
-        Student.objects.create(user=instance, score=0)
\ No newline at end of file
+        Student.objects.create(user=instance, score=0)
+
+@receiver(m2m_changed, sender=Comment.liked_by.through)
+def sync_comment_like_count(sender, instance, action, reverse, pk_set, **kwargs):
+    # The count is recomputed from the through table rather than incremented, so
+    # duplicate adds, removals of likes that never existed and concurrent writers
+    # can't push it out of step with liked_by.
+    if action == 'pre_clear' and reverse:
+        # user.liked_comments.clear() doesn't report which comments it touched
+        instance._cleared_comment_ids = list(instance.liked_comments.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        comment_ids = [instance.pk]
+    elif action == 'post_clear':
+        comment_ids = getattr(instance, '_cleared_comment_ids', [])
+    else:
+        comment_ids = list(pk_set or [])
+
+    if comment_ids:
+        Comment.objects.filter(pk__in=comment_ids).sync_like_counts()
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        run_in_background(feed.fan_out_post, instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def record_post_activity(sender, instance, created, **kwargs):
+    if created:
+        activity.record(instance.author_id, 'post_create', post=instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def record_comment_activity(sender, instance, created, **kwargs):
+    if created:
+        activity.record(instance.author_id, 'comment_create', post=instance.post_id, comment=instance.pk)
+
+
+@receiver(post_save, sender=StudyGroup)
+def record_group_activity(sender, instance, created, **kwargs):
+    if created:
+        activity.record(instance.host_id, 'group_create', group=str(instance.pk))
+
+
+@receiver(user_updated)
+def record_profile_activity(sender, user, **kwargs):
+    # Profiles are edited through djoser's /auth/users/me/
+    activity.record(user.pk, 'profile_update')
+
+
+@receiver(m2m_changed, sender=Student.friends.through)
+def sync_friend_counts(sender, instance, action, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance._cleared_friend_ids = list(instance.friends.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if action == 'post_clear':
+        student_ids = [instance.pk, *getattr(instance, '_cleared_friend_ids', [])]
+    else:
+        student_ids = [instance.pk, *(pk_set or [])]
+
+    # friend_count still holds the old totals here, so this finds who may drop under the fan-out limit
+    over_limit = []
+    if action != 'post_add':
+        over_limit = list(
+            Student.objects.filter(pk__in=student_ids, friend_count__gt=feed.fanout_limit()).values_list('pk', flat=True)
+        )
+    Student.objects.filter(pk__in=student_ids).sync_friend_counts()
+    if over_limit:
+        for student_id in Student.objects.filter(pk__in=over_limit, friend_count__lte=feed.fanout_limit()).values_list('pk', flat=True):
+            run_in_background(feed.fan_out_author, student_id)
+
+
+@receiver(m2m_changed, sender=Student.friends.through)
+def sync_timelines_with_friendships(sender, instance, action, pk_set, **kwargs):
+    # friends is symmetrical, so one signal covers both directions
+    if action == 'post_add' and pk_set:
+        run_in_background(feed.backfill_friendship, instance.pk, list(pk_set))
+    elif action == 'post_remove' and pk_set:
+        run_in_background(feed.prune_friendship, instance.pk, list(pk_set))
+
+
+@receiver(m2m_changed, sender=Student.friends.through)
+def sync_friend_graph(sender, instance, action, pk_set, **kwargs):
+    if action == 'post_clear':
+        friend_ids = getattr(instance, '_cleared_friend_ids', [])
+    elif action in ('post_add', 'post_remove'):
+        friend_ids = list(pk_set or [])
+    else:
+        return
+    if friend_ids:
+        # Only committed friendships reach the in-memory graph
+        transaction.on_commit(partial(
+            suggestions.record_friendship_change, instance.pk, friend_ids, added=action == 'post_add'))
+
+
+@receiver(post_save, sender=FriendRequest)
+def drop_suggestions_on_request(sender, instance, created, **kwargs):
+    # Pending requests are excluded from suggestions on both sides
+    if created:
+        cache.delete_many([
+            suggestions.suggestions_key(instance.from_student_id),
+            suggestions.suggestions_key(instance.to_student_id),
+        ])
+
+
+@receiver(post_save, sender=Student)
+def sync_leaderboard(sender, instance, **kwargs):
+    transaction.on_commit(partial(leaderboard.record_score, instance.pk, instance.grade, instance.score))
+
+
+@receiver(post_delete, sender=Student)
+def drop_from_leaderboard(sender, instance, **kwargs):
+    transaction.on_commit(partial(leaderboard.record_removal, instance.pk))
+
+
+@receiver(score_changed)
+def sync_leaderboard_scores(sender, changes, **kwargs):
+    # Score service writes are queryset updates, which don't send post_save
+    leaderboard.record_scores(changes)
+
+
+@receiver(score_changed)
+def record_score_history(sender, changes, **kwargs):
+    run_in_background(history.record_changes, changes, timezone.now())
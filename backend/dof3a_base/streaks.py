@@ -0,0 +1,101 @@
+from collections import defaultdict
+from datetime import timedelta
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import LearningStreak, UserActivity
+from .rollups import CHUNK_SIZE, consume
+
+# Activity that keeps a streak going; logging in or editing a profile doesn't
+LEARNING_ACTIVITIES = ['post_create', 'comment_create', 'group_create', 'knockout_join', 'knockout_complete']
+STREAK_TTL = 3600  # seconds
+
+
+def streak_key(user_id):
+    return f'learning_streak:{user_id}'
+
+
+def _apply(rows):
+    """
+    Move the streaks of everyone active in `rows` forward, one UPDATE per day they cover.
+
+    Days go oldest first and each UPDATE only touches rows last active
+    before its day, so a user's row is written at most once per day however
+    many events they had, and a day already counted is never counted again.
+    The new streaks are written to the shared cache once the transaction
+    commits.
+    """
+    days = defaultdict(set)
+    for _, user_id, created_at in rows:
+        days[timezone.localdate(created_at)].add(user_id)
+    user_ids = set().union(*days.values())
+    LearningStreak.objects.bulk_create(
+        [LearningStreak(user_id=user_id) for user_id in user_ids], batch_size=1000, ignore_conflicts=True,
+    )
+    for day in sorted(days):
+        continued = Case(
+            When(last_active_day=day - timedelta(days=1), then=F('current_streak') + 1),
+            default=Value(1),
+        )
+        LearningStreak.objects.filter(
+            Q(last_active_day__isnull=True) | Q(last_active_day__lt=day), user_id__in=days[day],
+        ).update(current_streak=continued, longest_streak=Greatest('longest_streak', continued), last_active_day=day)
+    streaks = {streak_key(user_id): streak for user_id, streak in _read(user_ids).items()}
+    transaction.on_commit(partial(cache.set_many, streaks, STREAK_TTL))
+
+
+def update_streaks(chunk_size=CHUNK_SIZE, now=None):
+    """Count learning activity recorded since the last run towards streaks. Returns the events read."""
+    events = UserActivity.objects.filter(activity_type__in=LEARNING_ACTIVITIES).values_list('pk', 'user_id', 'created_at')
+    return consume('streaks', events, _apply, chunk_size, now)
+
+
+def reset_broken_streaks(today=None):
+    """Zero the current streak of everyone who missed a day, in one statement. Returns the streaks reset."""
+    today = today or timezone.localdate()
+    return LearningStreak.objects.filter(last_active_day__lt=today - timedelta(days=1), current_streak__gt=0).update(
+        current_streak=0,
+    )
+
+
+def _read(user_ids):
+    found = {
+        user_id: {'current': current, 'longest': longest, 'last_active_day': last_active_day}
+        for user_id, current, longest, last_active_day in LearningStreak.objects.filter(user_id__in=user_ids)
+        .values_list('user_id', 'current_streak', 'longest_streak', 'last_active_day')
+    }
+    return {user_id: found.get(user_id, {'current': 0, 'longest': 0, 'last_active_day': None}) for user_id in user_ids}
+
+
+def get_streaks(user_ids, today=None):
+    """
+    {user id: {'current': ..., 'longest': ..., 'last_active_day': ...}}, from the cache where possible.
+
+    Misses are read in one query and only cached where nothing newer has
+    been cached since, so a read racing update_streaks() can't put back a
+    streak it has moved on. A streak broken since it was cached reads as 0
+    without waiting for the nightly reset.
+    """
+    today = today or timezone.localdate()
+    keys = {streak_key(user_id): user_id for user_id in user_ids}
+    cached = cache.get_many(keys)
+    streaks = {keys[key]: streak for key, streak in cached.items()}
+    missing = [user_id for key, user_id in keys.items() if key not in cached]
+    if missing:
+        fetched = _read(missing)
+        for user_id, streak in fetched.items():
+            cache.add(streak_key(user_id), streak, STREAK_TTL)
+        streaks.update(fetched)
+    for user_id, streak in streaks.items():
+        if streak['last_active_day'] is None or streak['last_active_day'] < today - timedelta(days=1):
+            streaks[user_id] = {**streak, 'current': 0}
+    return streaks
+
+
+def get_streak(user_id, today=None):
+    return get_streaks([user_id], today)[user_id]
@@ -0,0 +1,322 @@
+import copy
+import threading
+import time
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Student, FriendRequest, StudyGroup, StudyGroupInvite
+
+SUGGESTION_LIMIT = 20
+SUGGESTIONS_TTL = 600  # seconds
+# Rebuild the in-memory graph at least this often so grade changes and new students show up
+GRAPH_MAX_AGE = 900  # seconds
+# Edge changes held beside the CSR arrays before they are folded in
+MAX_PENDING_EDGES = 1024
+GRAPH_VERSION_KEY = 'friend_graph:version'
+
+WEIGHTS = {
+    'mutual': 1.0,
+    'shared_groups': 1.0,
+    'same_grade': 0.5,
+}
+
+# Grades are stored as small ints; the unselected placeholder never counts as a match
+GRADE_CODES = {grade: code for code, (grade, _) in enumerate(Student.STUDENT_GRADE)}
+NO_GRADE = GRADE_CODES[Student.OPTION_SELECT]
+
+
+def _edge_keys(src, dst):
+    return (np.asarray(src, dtype=np.int64) << 32) | np.asarray(dst, dtype=np.int64)
+
+
+class FriendGraph:
+    """
+    The friendship graph as CSR arrays.
+
+    The friends of student_ids[i] are neighbours[indptr[i]:indptr[i + 1]], sorted.
+    Friendships changed since the arrays were built are kept as encoded edge keys:
+    `added` holds edges missing from the arrays and `removed` edges present in them,
+    until compacted() folds them in.
+    """
+
+    def __init__(self, student_ids, grades, indptr, neighbours, version=None):
+        self.student_ids = student_ids
+        self.grades = grades
+        self.indptr = indptr
+        self.neighbours = neighbours
+        self.version = version
+        self.added = set()
+        self.removed = set()
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def from_edges(cls, student_ids, grades, src, dst, version=None):
+        # One sort of packed keys orders edges by (source, friend)
+        keys = np.sort(_edge_keys(src, dst))
+        src, dst = keys >> 32, keys & 0xFFFFFFFF
+        rows = np.searchsorted(student_ids, src)
+        indptr = np.zeros(len(student_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(student_ids)), out=indptr[1:])
+        return cls(student_ids, grades, indptr, dst, version)
+
+    @classmethod
+    def load(cls):
+        """Build the graph from the database in two queries."""
+        # Read the version first so changes made while loading leave the graph stale
+        cache.add(GRAPH_VERSION_KEY, 0, None)
+        version = cache.get(GRAPH_VERSION_KEY)
+
+        students = list(Student.objects.order_by('pk').values_list('pk', 'grade'))
+        student_ids = np.fromiter((pk for pk, _ in students), dtype=np.int64, count=len(students))
+        grades = np.fromiter((GRADE_CODES.get(grade, NO_GRADE) for _, grade in students), dtype=np.int8, count=len(students))
+
+        edges = np.array(
+            list(Student.friends.through.objects.values_list('from_student_id', 'to_student_id')),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        # Drop edges to students created after the first query
+        edges = edges[np.isin(edges, student_ids).all(axis=1)]
+        return cls.from_edges(student_ids, grades, edges[:, 0], edges[:, 1], version)
+
+    @property
+    def pending(self):
+        return len(self.added) + len(self.removed)
+
+    def edges_from(self, sources):
+        """All (source, friend) pairs for the given student ids, as two arrays."""
+        sources = np.unique(np.asarray(sources, dtype=np.int64))
+        rows = np.searchsorted(self.student_ids, sources)
+        known = rows < len(self.student_ids)
+        known[known] = self.student_ids[rows[known]] == sources[known]
+        rows = rows[known]
+
+        # Gather the CSR slices of every source row without a Python loop
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        src = np.repeat(sources[known], lengths)
+        dst = self.neighbours[positions]
+
+        if self.removed:
+            keep = ~np.isin(_edge_keys(src, dst), np.fromiter(self.removed, dtype=np.int64))
+            src, dst = src[keep], dst[keep]
+        if self.added:
+            added = np.fromiter(self.added, dtype=np.int64)
+            added = added[np.isin(added >> 32, sources)]
+            src, dst = np.concatenate([src, added >> 32]), np.concatenate([dst, added & 0xFFFFFFFF])
+        return src, dst
+
+    def _in_arrays(self, key):
+        src, dst = key >> 32, key & 0xFFFFFFFF
+        row = np.searchsorted(self.student_ids, src)
+        if row == len(self.student_ids) or self.student_ids[row] != src:
+            return False
+        friends = self.neighbours[self.indptr[row]:self.indptr[row + 1]]
+        position = np.searchsorted(friends, dst)
+        return position < len(friends) and friends[position] == dst
+
+    def friends_of(self, student_id):
+        return self.edges_from([student_id])[1]
+
+    def grades_of(self, student_ids):
+        rows = np.searchsorted(self.student_ids, student_ids)
+        known = rows < len(self.student_ids)
+        known[known] = self.student_ids[rows[known]] == student_ids[known]
+        grades = np.full(len(student_ids), NO_GRADE, dtype=np.int8)
+        grades[known] = self.grades[rows[known]]
+        return grades
+
+    def mutual_counts(self, student_id):
+        """Friends-of-friends of the student with how many friends each shares with them."""
+        friends = self.friends_of(student_id)
+        _, friends_of_friends = self.edges_from(friends)
+        candidates, counts = np.unique(friends_of_friends, return_counts=True)
+        keep = ~np.isin(candidates, friends) & (candidates != student_id)
+        return candidates[keep], counts[keep]
+
+    def with_changes(self, student_id, friend_ids, added):
+        """
+        A graph with friendships added or removed since the arrays were built.
+
+        Graphs are never changed in place, so readers holding the old one are unaffected.
+        """
+        # friends is symmetrical, so record both directions
+        keys = set(np.concatenate([_edge_keys(student_id, friend_ids), _edge_keys(friend_ids, student_id)]).tolist())
+        in_arrays = {key for key in keys if self._in_arrays(key)}
+        graph = copy.copy(self)
+        if added:
+            graph.added, graph.removed = self.added | (keys - in_arrays), self.removed - keys
+        else:
+            graph.added, graph.removed = self.added - keys, self.removed | in_arrays
+        if graph.pending > MAX_PENDING_EDGES:
+            graph = graph.compacted()
+        return graph
+
+    def compacted(self):
+        """Fold pending edge changes into fresh CSR arrays without touching the database."""
+        src = np.repeat(self.student_ids, np.diff(self.indptr))
+        keys = _edge_keys(src, self.neighbours)
+        if self.removed:
+            keys = keys[~np.isin(keys, np.fromiter(self.removed, dtype=np.int64))]
+        if self.added:
+            keys = np.concatenate([keys, np.fromiter(self.added, dtype=np.int64)])
+        src, dst = keys >> 32, keys & 0xFFFFFFFF
+
+        # Friendships can involve students created after the last load
+        student_ids = np.union1d(self.student_ids, src)
+        graph = FriendGraph.from_edges(student_ids, self.grades_of(student_ids), src, dst, self.version)
+        # Compacting isn't a reload, so keep counting towards GRAPH_MAX_AGE
+        graph.built_at = self.built_at
+        return graph
+
+
+_graph = None
+_graph_lock = threading.Lock()
+# Held by the one thread reloading the graph, so others don't load it again meanwhile
+_load_lock = threading.Lock()
+
+
+def _is_stale(graph):
+    return (
+        graph is None
+        or graph.version != cache.get(GRAPH_VERSION_KEY)
+        or time.monotonic() - graph.built_at > GRAPH_MAX_AGE
+    )
+
+
+def get_graph():
+    """
+    The process-wide FriendGraph, reloaded when another process has changed friendships.
+
+    The reload runs outside _graph_lock and is swapped in when done; while
+    one thread reloads, the others keep reading the graph they have, and
+    only wait when there is none yet.
+    """
+    global _graph
+    graph = _graph
+    if not _is_stale(graph):
+        return graph
+    if not _load_lock.acquire(blocking=graph is None):
+        return graph
+    try:
+        graph = _graph
+        if _is_stale(graph):
+            loaded = FriendGraph.load()
+            with _graph_lock:
+                # Keep the current graph if changes applied while loading made it fresh again
+                if _is_stale(_graph):
+                    _graph = loaded
+                graph = _graph
+        return graph
+    finally:
+        _load_lock.release()
+
+
+def record_friendship_change(student_id, friend_ids, added):
+    """Apply a committed friendship change to this process's graph and tell the others."""
+    global _graph
+    friend_ids = np.asarray(list(friend_ids), dtype=np.int64)
+    with _graph_lock:
+        cache.add(GRAPH_VERSION_KEY, 0, None)
+        version = cache.incr(GRAPH_VERSION_KEY)
+        if _graph is not None:
+            if _graph.version is not None and version == _graph.version + 1:
+                _graph = _graph.with_changes(student_id, friend_ids, added)
+                _graph.version = version
+            else:
+                # Some other process changed friendships too; reload on next use
+                _graph = None
+    cache.delete_many([suggestions_key(pk) for pk in [student_id, *friend_ids.tolist()]])
+
+
+def mutual_friend_counts(student_id, other_ids):
+    """How many friends the student shares with each of other_ids, from one sorted-array intersection."""
+    graph = get_graph()
+    src, dst = graph.edges_from(other_ids)
+    shared = np.isin(dst, graph.friends_of(student_id))
+    counts = dict.fromkeys(other_ids, 0)
+    ids, totals = np.unique(src[shared], return_counts=True)
+    counts.update(zip(ids.tolist(), totals.tolist()))
+    return counts
+
+
+def suggestions_key(student_id):
+    return f'friend_suggestions:{student_id}'
+
+
+def shared_group_counts(user_id):
+    """Student ids sharing study groups with the user, hosted or accepted, and how many each."""
+    group_ids = StudyGroup.objects.filter(
+        Q(host=user_id) | Q(invites__student=user_id, invites__accepted=True)
+    ).values('pk')
+    members = StudyGroupInvite.objects.filter(group__in=group_ids, accepted=True).values_list('group_id', 'student__student')
+    hosts = StudyGroup.objects.filter(pk__in=group_ids).values_list('pk', 'host__student')
+
+    per_student = {}
+    for group_id, student_id in {*members, *hosts}:
+        if student_id is not None:
+            per_student[student_id] = per_student.get(student_id, 0) + 1
+    return per_student
+
+
+def suggest_friends(student, limit=SUGGESTION_LIMIT):
+    """
+    Rank people the student may know.
+
+    Candidates are friends-of-friends and study group co-members, scored by
+    mutual friends, shared groups and same grade. Current friends and anyone
+    with a pending request either way are left out.
+    """
+    graph = get_graph()
+    candidates, mutual = graph.mutual_counts(student.pk)
+
+    groups = shared_group_counts(student.user_id)
+    groups.pop(student.pk, None)
+    if groups:
+        group_members = np.fromiter(groups, dtype=np.int64, count=len(groups))
+        extra = group_members[~np.isin(group_members, candidates)]
+        candidates = np.concatenate([candidates, extra])
+        mutual = np.concatenate([mutual, np.zeros(len(extra), dtype=mutual.dtype)])
+        order = np.argsort(candidates)
+        candidates, mutual = candidates[order], mutual[order]
+    shared = np.fromiter((groups.get(pk, 0) for pk in candidates.tolist()), dtype=np.int64, count=len(candidates))
+
+    requested = FriendRequest.objects.filter(Q(from_student=student) | Q(to_student=student)).values_list('from_student', 'to_student')
+    excluded = np.array([pk for pair in requested for pk in pair] + [student.pk], dtype=np.int64)
+    keep = ~np.isin(candidates, excluded) & ~np.isin(candidates, graph.friends_of(student.pk))
+    candidates, mutual, shared = candidates[keep], mutual[keep], shared[keep]
+
+    own_grade = GRADE_CODES.get(student.grade, NO_GRADE)
+    same_grade = (graph.grades_of(candidates) == own_grade) & (own_grade != NO_GRADE)
+    scores = (
+        WEIGHTS['mutual'] * mutual
+        + WEIGHTS['shared_groups'] * shared
+        + WEIGHTS['same_grade'] * same_grade
+    )
+
+    if len(scores) > limit:
+        top = np.argpartition(-scores, limit - 1)[:limit]
+    else:
+        top = np.arange(len(scores))
+    # Best score first, lower student id first among ties so the order is stable
+    top = top[np.lexsort((candidates[top], -scores[top]))]
+    return [
+        {
+            'student': int(candidates[i]),
+            'mutual_friends': int(mutual[i]),
+            'shared_groups': int(shared[i]),
+            'same_grade': bool(same_grade[i]),
+        }
+        for i in top
+    ]
+
+
+def cached_suggestions(student):
+    key = suggestions_key(student.pk)
+    suggestions = cache.get(key)
+    if suggestions is None:
+        suggestions = suggest_friends(student)
+        cache.set(key, suggestions, SUGGESTIONS_TTL)
+    return suggestions
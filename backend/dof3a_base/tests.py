@@ -1 +1,984 @@
-from django.test import TestCase
\ No newline at end of file
+import datetime
+import io
+import random
+import sys
+import threading
+import unittest
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+from django.db import DatabaseError, connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .likes import like_post, get_like_count, fold_like_shards, set_sharded_likes
+from .models import Student, Post, PostLike, Comment, TimelineEntry, ScoreHistory, FriendRequest, StudyGroup, StudyGroupInvite, UserActivity, DailyActivity, LearningStreak
+from . import activity, checks, history, rollups, leaderboard, scores, streaks, suggestions
+from .views import PostViewSet
+
+User = get_user_model()
+
+
+def make_users(count, prefix='user'):
+    return [
+        User.objects.create(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com')
+        for i in range(count)
+    ]
+
+
+class PostLikeTests(TestCase):
+    def setUp(self):
+        self.author, self.reader = make_users(2)
+        self.post = Post.objects.create(author=self.author, caption='Limits', description='...')
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        self.url = f'/dof3a-api/posts/{self.post.pk}/'
+
+    def test_like_is_idempotent(self):
+        response = self.client.post(self.url + 'like/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['likes'], 1)
+
+        response = self.client.post(self.url + 'like/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(get_like_count(self.post), 1)
+
+    def test_unlike_removes_like(self):
+        self.client.post(self.url + 'like/')
+
+        response = self.client.post(self.url + 'unlike/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['likes'], 0)
+        self.assertFalse(PostLike.objects.filter(post=self.post).exists())
+
+        response = self.client.post(self.url + 'unlike/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_sharded_count_folds_back_into_post(self):
+        set_sharded_likes(self.post, True)
+        for user in make_users(5, prefix='fan'):
+            like_post(self.post, user)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes, 0)
+        self.assertEqual(get_like_count(self.post), 5)
+
+        set_sharded_likes(self.post, False)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes, 5)
+        self.assertEqual(fold_like_shards(self.post), 0)
+
+    def test_shards_count_after_unsharding_until_folded(self):
+        # A liker that read the flag before the switch still writes to a shard
+        set_sharded_likes(self.post, True)
+        stale = Post.objects.get(pk=self.post.pk)
+        set_sharded_likes(self.post, False)
+        like_post(stale, self.reader)
+        self.assertEqual(get_like_count(self.post), 1)
+        self.assertEqual(Post.objects.with_counts().get(pk=self.post.pk).like_total, 1)
+
+        call_command('fold_like_shards', stdout=io.StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes, get_like_count(self.post)), (1, 1))
+
+    def test_admin_toggle_folds_shards(self):
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='x')
+        self.client.force_login(admin_user)
+        changelist = '/admin/dof3a_base/post/'
+        self.client.post(changelist, {'action': 'shard_likes', '_selected_action': [self.post.pk]})
+        like_post(Post.objects.get(pk=self.post.pk), self.reader)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.sharded_likes, self.post.likes), (True, 0))
+        self.client.post(changelist, {'action': 'unshard_likes', '_selected_action': [self.post.pk]})
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.sharded_likes, self.post.likes), (False, 1))
+
+
+@unittest.skipIf(connection.vendor == 'sqlite', 'SQLite serialises writers with a database-wide lock')
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class PostLikeConcurrencyTests(TransactionTestCase):
+    workers = 24
+
+    def setUp(self):
+        self.users = make_users(self.workers)
+        self.post = Post.objects.create(author=self.users[0], caption='Viral', description='...')
+
+    def like_concurrently(self, likes_per_user):
+        barrier = threading.Barrier(self.workers)
+        errors = []
+
+        def worker(user):
+            try:
+                post = Post.objects.get(pk=self.post.pk)
+                barrier.wait()
+                for _ in range(likes_per_user):
+                    like_post(post, user)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(user,)) for user in self.users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_no_likes_lost_on_single_row(self):
+        self.like_concurrently(likes_per_user=2)
+        self.assertEqual(PostLike.objects.filter(post=self.post).count(), self.workers)
+        self.assertEqual(get_like_count(self.post), self.workers)
+
+    def test_no_likes_lost_when_sharded(self):
+        set_sharded_likes(self.post, True)
+        self.post.refresh_from_db()
+        self.like_concurrently(likes_per_user=2)
+        self.assertEqual(get_like_count(self.post), self.workers)
+
+        fold_like_shards(self.post)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes, self.workers)
+
+
+class PostListTests(TestCase):
+    def setUp(self):
+        self.users = make_users(3)
+        self.posts = []
+        for i in range(5):
+            post = Post.objects.create(author=self.users[0], caption=f'Post {i}', description='...')
+            for j in range(6):
+                comment = Comment.objects.create(author=self.users[j % 3], post=post, body=f'Comment {j}')
+                comment.liked_by.add(*self.users[:j % 3])
+            self.posts.append(post)
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[1])
+
+    def test_list_is_paginated_with_top_comments_in_two_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/dof3a-api/posts/', {'page_size': 2})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data['next'])
+        first = response.data['results'][0]
+        self.assertEqual(first['id'], self.posts[-1].pk)
+        self.assertEqual(first['comment_count'], 6)
+        self.assertEqual(len(first['comments']), PostViewSet.top_comments)
+        self.assertEqual(
+            [comment['likes'] for comment in first['comments']],
+            [Comment.objects.get(pk=comment['id']).liked_by.count() for comment in first['comments']]
+        )
+
+    def test_more_comments_returns_the_rest(self):
+        post = self.posts[0]
+        embedded = self.client.get(f'/dof3a-api/posts/{post.pk}/').data['comments']
+        response = self.client.get(f'/dof3a-api/posts/{post.pk}/more_comments/')
+
+        remaining = [comment['id'] for comment in response.data['results']]
+        self.assertEqual(len(remaining), 6 - PostViewSet.top_comments)
+        self.assertTrue(set(remaining).isdisjoint(comment['id'] for comment in embedded))
+
+
+class CommentListTests(TestCase):
+    def setUp(self):
+        self.author, self.viewer, self.other = make_users(3)
+        self.post = Post.objects.create(author=self.author, caption='Vectors', description='...')
+        self.comments = [
+            Comment.objects.create(author=self.author, post=self.post, body=f'Comment {i}')
+            for i in range(30)
+        ]
+        for comment in self.comments[::3]:
+            comment.liked_by.add(self.viewer, self.other)
+        for comment in self.comments[1::3]:
+            comment.liked_by.add(self.other)
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+        self.url = f'/dof3a-api/posts/{self.post.pk}/comments/'
+
+    def test_query_budget_does_not_grow_with_page_size(self):
+        for page_size in (5, 25):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url, {'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), page_size)
+            self.assertLessEqual(len(queries), 2)
+
+    def test_likes_and_liked_by_me_are_per_viewer(self):
+        response = self.client.get(self.url, {'page_size': 30})
+        results = {comment['id']: comment for comment in response.data['results']}
+
+        for i, comment in enumerate(self.comments):
+            self.assertEqual(results[comment.pk]['liked_by_me'], i % 3 == 0)
+            self.assertEqual(results[comment.pk]['likes'], 2 if i % 3 == 0 else 1 if i % 3 == 1 else 0)
+
+
+class CommentLikeCountTests(TestCase):
+    def setUp(self):
+        self.author, self.fan, self.other = make_users(3)
+        post = Post.objects.create(author=self.author, caption='Vectors', description='...')
+        self.first, self.second = [Comment.objects.create(author=self.author, post=post, body=f'b{i}') for i in range(2)]
+        self.url = f'/dof3a-api/posts/{post.pk}/comments/{self.first.pk}/'
+
+    def counts(self):
+        return [Comment.objects.get(pk=comment.pk).like_count for comment in (self.first, self.second)]
+
+    def test_forward_changes_keep_the_count(self):
+        self.first.liked_by.add(self.fan, self.other)
+        self.first.liked_by.add(self.fan)
+        self.assertEqual(self.counts(), [2, 0])
+        self.first.liked_by.remove(self.other, self.author)
+        self.assertEqual(self.counts(), [1, 0])
+        self.first.liked_by.clear()
+        self.assertEqual(self.counts(), [0, 0])
+
+    def test_reverse_changes_keep_the_count(self):
+        self.fan.liked_comments.add(self.first, self.second)
+        self.other.liked_comments.add(self.first)
+        self.assertEqual(self.counts(), [2, 1])
+        self.fan.liked_comments.remove(self.second)
+        self.assertEqual(self.counts(), [2, 0])
+        self.fan.liked_comments.add(self.second)
+        self.fan.liked_comments.clear()
+        self.assertEqual(self.counts(), [1, 0])
+
+    def test_like_and_unlike_comment(self):
+        client = APIClient()
+        client.force_authenticate(self.fan)
+        self.assertEqual(client.post(self.url + 'like_comment/').data, {'likes': 1})
+        self.assertEqual(client.post(self.url + 'like_comment/').status_code, 400)
+        self.assertEqual(client.post(self.url + 'unlike_comment/').data, {'likes': 0})
+        self.assertEqual(client.post(self.url + 'unlike_comment/').status_code, 400)
+        self.assertEqual(self.counts(), [0, 0])
+
+    def test_rebuild_command_repairs_drifted_counts(self):
+        self.first.liked_by.add(self.fan, self.other)
+        Comment.objects.update(like_count=7)
+        call_command('rebuild_comment_like_counts', batch_size=1, stdout=io.StringIO())
+        self.assertEqual(self.counts(), [2, 0])
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True, FEED_FANOUT_MAX_FRIENDS=2)
+class FeedTests(TestCase):
+    def setUp(self):
+        self.me, self.friend, self.popular, self.stranger, *self.fans = make_users(6)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.me.student.friends.add(self.friend.student, self.popular.student)
+            self.popular.student.friends.add(*(fan.student for fan in self.fans))
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def publish(self, author, caption):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(author=author, caption=caption, description='...')
+
+    def feed_ids(self, **params):
+        return [post['id'] for post in self.client.get('/dof3a-api/feed/', params).data['results']]
+
+    def test_posts_fan_out_to_friends_only(self):
+        mine = self.publish(self.me, 'mine')
+        friends = self.publish(self.friend, 'friend')
+        self.publish(self.stranger, 'stranger')
+
+        self.assertEqual(self.feed_ids(), [friends.pk, mine.pk])
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.friend, post=mine).exists())
+
+    def test_high_fanout_author_is_merged_on_read(self):
+        popular = self.publish(self.popular, 'popular')
+        friends = self.publish(self.friend, 'friend')
+
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.me, post=popular).exists())
+        self.assertEqual(self.feed_ids(), [friends.pk, popular.pk])
+        self.assertEqual(self.feed_ids(page_size=1), [friends.pk])
+        self.assertEqual(self.feed_ids(before=friends.pk), [popular.pk])
+
+    def test_author_dropping_under_the_limit_is_fanned_out(self):
+        popular = self.publish(self.popular, 'popular')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.popular.student.friends.remove(self.fans[0].student)
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.me, post=popular).exists())
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.fans[1], post=popular).exists())
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.fans[0], post=popular).exists())
+        self.assertEqual(self.feed_ids(), [popular.pk])
+
+    def test_friend_counts_follow_friendships(self):
+        self.popular.student.refresh_from_db()
+        self.assertEqual(self.popular.student.friend_count, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.popular.student.friends.clear()
+        self.me.student.refresh_from_db()
+        self.assertEqual(self.me.student.friend_count, 1)
+
+    def test_friendship_changes_backfill_and_prune(self):
+        post = self.publish(self.stranger, 'stranger')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.me.student.friends.add(self.stranger.student)
+        self.assertIn(post.pk, self.feed_ids())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.me.student.friends.remove(self.stranger.student)
+        self.assertNotIn(post.pk, self.feed_ids())
+
+    def test_ranked_feed_prefers_engaged_on_topic_posts(self):
+        self.me.student.grade = 'Senior 1'
+        self.me.student.save()
+        plain = self.publish(self.friend, 'weekend plans')
+        on_topic = self.publish(self.friend, 'Trigonometry identities cheat sheet')
+        liked = self.publish(self.friend, 'old but popular')
+        Post.objects.filter(pk=liked.pk).update(likes=500)
+        cache.clear()
+
+        ranked = [post['id'] for post in self.client.get('/dof3a-api/feed/ranked/').data['results']]
+        self.assertEqual(ranked, [liked.pk, on_topic.pk, plain.pk])
+
+    def test_ranked_feed_ignores_the_grade_placeholder(self):
+        self.friend.student.grade = 'Senior 1'
+        self.friend.student.save()
+        # Neither the viewer nor this author has picked a grade, which isn't a shared grade
+        no_grade = self.publish(self.popular, 'no grade')
+        graded = self.publish(self.friend, 'graded')
+        cache.clear()
+
+        ranked = [post['id'] for post in self.client.get('/dof3a-api/feed/ranked/').data['results']]
+        self.assertEqual(ranked, [graded.pk, no_grade.pk])
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class FriendSuggestionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me, self.close, self.far, self.classmate, self.requested, *self.friends = make_users(7)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.me.student.friends.add(*(friend.student for friend in self.friends))
+            for friend in self.friends:
+                friend.student.friends.add(self.close.student, self.requested.student)
+            self.friends[0].student.friends.add(self.far.student)
+        FriendRequest.objects.create(from_student=self.me.student, to_student=self.requested.student)
+
+        group = StudyGroup.objects.create(host=self.me, topic='Algebra', location='Library', scheduled_time=timezone.now())
+        StudyGroupInvite.objects.create(group=group, student=self.classmate, accepted=True, responded=True)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def suggested(self):
+        response = self.client.get('/dof3a-api/students/suggestions/')
+        return [(row['student']['id'], row['mutual_friends'], row['shared_groups']) for row in response.data]
+
+    def test_ranks_by_mutual_friends_and_groups(self):
+        self.assertEqual(self.suggested(), [
+            (self.close.student.pk, 2, 0),
+            (self.far.student.pk, 1, 0),
+            (self.classmate.student.pk, 0, 1),
+        ])
+
+    def test_friendship_changes_update_the_loaded_graph(self):
+        self.suggested()
+        graph = suggestions.get_graph()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.me.student.friends.add(self.close.student)
+
+        self.assertEqual([row[0] for row in self.suggested()], [self.far.student.pk, self.classmate.student.pk])
+        # Applied from the signal, not reloaded from the database
+        self.assertIs(suggestions.get_graph().student_ids, graph.student_ids)
+
+    def test_readers_keep_the_current_graph_while_another_thread_reloads(self):
+        graph = suggestions.get_graph()
+        cache.incr(suggestions.GRAPH_VERSION_KEY)
+        with suggestions._load_lock:
+            self.assertIs(suggestions.get_graph(), graph)
+        reloaded = suggestions.get_graph()
+        self.assertIsNot(reloaded, graph)
+        self.assertEqual(reloaded.version, graph.version + 1)
+
+    def test_deploy_check_requires_a_shared_cache(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([error.id for error in checks.check_shared_cache(None)], ['dof3a_base.E001'])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379/1'}}):
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class FriendCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me, self.other, *self.friends = make_users(4)
+        self.crowd = make_users(46, prefix='crowd')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.me.student.friends.add(*(friend.student for friend in self.friends))
+            self.other.student.friends.add(*(friend.student for friend in self.friends[:2]))
+            self.other.student.friends.add(*(user.student for user in self.crowd))
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def test_student_list_has_counts_in_a_fixed_query_budget(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/dof3a-api/students/')
+        students = {student['id']: student for student in response.data}
+
+        self.assertEqual(len(students), 50)
+        # viewer's student, the list, and the friend graph on a cold cache
+        self.assertLessEqual(len(queries), 4)
+        self.assertEqual(students[self.other.student.pk]['friend_count'], 48)
+        self.assertEqual(students[self.other.student.pk]['mutual_friends'], 2)
+        self.assertEqual(students[self.crowd[0].student.pk]['mutual_friends'], 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/dof3a-api/students/')
+        self.assertLessEqual(len(queries), 2)
+
+    def test_friend_requests_show_sender_counts(self):
+        FriendRequest.objects.create(from_student=self.other.student, to_student=self.me.student)
+        response = self.client.get('/dof3a-api/friend-requests/')
+
+        self.assertEqual(response.data[0]['friend_count'], 48)
+        self.assertEqual(response.data[0]['mutual_friends'], 2)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class FriendRequestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me, self.outsider, *self.senders = make_users(12)
+        self.requests = [
+            FriendRequest.objects.create(from_student=sender.student, to_student=self.me.student)
+            for sender in self.senders
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def test_inbox_query_budget_does_not_grow(self):
+        self.client.get('/dof3a-api/friend-requests/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/dof3a-api/friend-requests/')
+        self.assertEqual(len(response.data), 10)
+        self.assertLessEqual(len(queries), 3)
+
+    def test_bulk_accept_is_one_transaction_of_fixed_size(self):
+        # A request the other way is settled by accepting
+        FriendRequest.objects.create(from_student=self.me.student, to_student=self.senders[0].student)
+        foreign = FriendRequest.objects.create(from_student=self.senders[0].student, to_student=self.outsider.student)
+        budgets = []
+        for batch in (self.requests[:2], self.requests[2:]):
+            ids = sorted(friend_request.pk for friend_request in batch)
+            with CaptureQueriesContext(connection) as queries:
+                # Accepted ids come back in id order whatever order they were sent in
+                response = self.client.post('/dof3a-api/friend-requests/accept/', {'ids': [foreign.pk, *reversed(ids)]}, format='json')
+            self.assertEqual(response.data, {'accepted': ids, 'not_found': [foreign.pk]})
+            budgets.append(len(queries))
+
+        self.assertEqual(budgets[0], budgets[1])
+        self.assertEqual(set(self.me.student.friends.values_list('user', flat=True)), {sender.pk for sender in self.senders})
+        self.assertEqual(set(FriendRequest.objects.values_list('pk', flat=True)), {foreign.pk})
+
+    def test_bulk_reject(self):
+        ids = sorted(friend_request.pk for friend_request in self.requests[:3])
+        with self.assertNumQueries(4):
+            response = self.client.post('/dof3a-api/friend-requests/reject/', {'ids': ids[::-1]}, format='json')
+        self.assertEqual(response.data['rejected'], ids)
+        self.assertEqual(FriendRequest.objects.count(), 7)
+        self.assertFalse(self.me.student.friends.exists())
+
+        response = self.client.post('/dof3a-api/friend-requests/reject/', {'ids': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+
+class RankedListTests(TestCase):
+    def test_matches_a_sorted_list(self):
+        rng = random.Random(7)
+        ranked, expected = leaderboard.RankedList(), []
+        for _ in range(3000):
+            key = (rng.randrange(-500, 0), rng.randrange(10_000))
+            if expected and rng.random() < 0.3:
+                key = expected[rng.randrange(len(expected))]
+                ranked.remove(key)
+                expected.remove(key)
+            elif key not in expected:
+                ranked.add(key)
+                expected.append(key)
+                expected.sort()
+            probe = (rng.randrange(-500, 0), 0)
+            self.assertEqual(ranked.rank(probe), sum(existing < probe for existing in expected))
+
+        self.assertEqual(len(ranked), len(expected))
+        self.assertEqual(ranked.slice(0, len(expected)), expected)
+        self.assertEqual(ranked.slice(1000, 1010), expected[1000:1010])
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = make_users(6)
+        with self.captureOnCommitCallbacks(execute=True):
+            for user, (grade, score) in zip(self.users, [
+                ('Senior 1', 50), ('Senior 1', 80), ('Senior 2', 80), ('Senior 1', 10), ('Senior 2', 30), ('Senior 1', 0),
+            ]):
+                user.student.grade, user.student.score = grade, score
+                user.student.save()
+            self.users[0].student.friends.add(self.users[2].student, self.users[3].student)
+        self.me = self.users[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def board(self, path='', **params):
+        return self.client.get(f'/dof3a-api/leaderboard/{path}', params).data
+
+    def test_boards(self):
+        self.assertEqual(
+            [(row['rank'], row['username'], row['score']) for row in self.board(limit=4)],
+            [(1, 'user1', 80), (1, 'user2', 80), (3, 'user0', 50), (4, 'user4', 30)],
+        )
+        self.assertEqual([row['username'] for row in self.board(board='grade')], ['user1', 'user0', 'user3', 'user5'])
+        self.assertEqual([row['username'] for row in self.board(board='friends')], ['user2', 'user0', 'user3'])
+
+    def test_my_rank_and_neighbours(self):
+        mine = self.board('me/', board='grade', radius=1)
+        self.assertEqual(mine['rank'], 2)
+        self.assertEqual([row['username'] for row in mine['neighbours']], ['user1', 'user0', 'user3'])
+
+    def test_score_changes_move_students_without_a_rebuild(self):
+        self.board()
+        loaded = leaderboard.get_leaderboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.me.student.score = 100
+            self.me.student.save()
+
+        with mock.patch.object(leaderboard.Leaderboard, 'load') as load:
+            self.assertEqual(self.board('me/')['rank'], 1)
+            self.assertEqual(self.board('me/', board='friends')['rank'], 1)
+        load.assert_not_called()
+        # Applied to a copy, so the boards readers already had are unchanged
+        self.assertEqual(loaded.around(leaderboard.GLOBAL, self.me.student.pk, 0)[0]['rank'], 3)
+
+    def test_boards_are_rebuilt_once_too_old(self):
+        loaded = leaderboard.get_leaderboard()
+        # A write the version bump never announced, e.g. a bulk update
+        Student.objects.filter(pk=self.me.student.pk).update(score=100)
+        self.assertIs(leaderboard.get_leaderboard(), loaded)
+
+        loaded.built_at -= leaderboard.LEADERBOARD_MAX_AGE + 1
+        with leaderboard._load_lock:
+            # Another thread is rebuilding, so this one keeps the boards it has
+            self.assertIs(leaderboard.get_leaderboard(), loaded)
+        self.assertEqual(self.board('me/')['rank'], 1)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class ScoreServiceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = make_users(3)
+        self.students = [user.student for user in self.users]
+        self.events = []
+        scores.score_changed.connect(self.record_event)
+        self.addCleanup(scores.score_changed.disconnect, self.record_event)
+
+    def record_event(self, sender, changes, **kwargs):
+        self.events.append(sorted(changes))
+
+    def scores(self):
+        return [student.score for student in Student.objects.filter(pk__in=[s.pk for s in self.students]).order_by('pk')]
+
+    def test_add_points_is_atomic_and_floored_at_zero(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(scores.add_points(self.students[0].pk, 30), 30)
+            self.assertEqual(scores.add_points(self.students[0].pk, -50), 0)
+        self.assertEqual(self.scores(), [0, 0, 0])
+        self.assertEqual(len(self.events), 2)
+
+    def test_buffer_merges_deltas_into_one_update(self):
+        buffer = scores.ScoreBuffer(interval=60)
+        for _ in range(20):
+            for i, student in enumerate(self.students):
+                buffer.add(student.pk, i + 1)
+
+        with self.assertNumQueries(4):  # savepoint, UPDATE ... CASE, read back, release
+            self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(self.scores(), [20, 40, 60])
+        self.assertEqual(self.events, [[(s.pk, s.grade, 20 * (i + 1), 20 * (i + 1)) for i, s in enumerate(self.students)]])
+        self.assertEqual(buffer.flush(), 0)
+
+    @override_settings(SCORE_FLUSH_INTERVAL=0)
+    def test_events_keep_the_leaderboard_current(self):
+        leaderboard.get_leaderboard()
+        with mock.patch.object(leaderboard.Leaderboard, 'load') as load:
+            with self.captureOnCommitCallbacks(execute=True):
+                scores.buffer_points(self.students[2].pk, 5)
+            self.assertEqual(leaderboard.get_leaderboard().top(leaderboard.GLOBAL, 1)[0]['student'], self.students[2].pk)
+        load.assert_not_called()
+
+    def test_failed_flush_is_retried_after_another_interval(self):
+        buffer = scores.ScoreBuffer(interval=60)
+        buffer.add(self.students[0].pk, 5)
+        with mock.patch.object(scores, '_apply_deltas', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                buffer.flush()
+        self.assertIsNotNone(buffer._timer)
+        buffer._timer.cancel()
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(self.scores(), [5, 0, 0])
+
+    def test_admin_grade_edit_only_writes_the_grade(self):
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='x')
+        self.client.force_login(admin_user)
+        student = self.students[0]
+        scores.add_points(student.pk, 40)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/admin/dof3a_base/student/', {
+                'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1, 'form-0-id': student.pk, 'form-0-grade': 'Senior 2', '_save': 'Save',
+            })
+        # Scores and friend counts changed by others since the page loaded aren't overwritten
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE') and 'dof3a_base_student' in query['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('score', updates[0])
+        self.assertNotIn('friend_count', updates[0])
+        student.refresh_from_db()
+        self.assertEqual((student.grade, student.score), ('Senior 2', 40))
+        self.assertEqual(leaderboard.get_leaderboard().entries[student.pk], ('Senior 2', 40))
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class LeaderboardConcurrencyTests(TestCase):
+    @mock.patch.object(leaderboard, 'BUCKET_SIZE', 4)
+    def test_readers_never_see_a_change_half_applied(self):
+        cache.clear()
+        rng = random.Random(3)
+        rows = [(pk, 'Senior 1' if pk % 2 else 'Senior 2', rng.randrange(1000)) for pk in range(1, 2001)]
+        cache.add(leaderboard.LEADERBOARD_VERSION_KEY, 0, None)
+        # Small buckets so changes keep splitting and emptying them
+        leaderboard._leaderboard = leaderboard.Leaderboard(rows, version=0)
+        self.addCleanup(setattr, leaderboard, '_leaderboard', None)
+        # Switch threads as often as possible so reads land in the middle of writes
+        self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+        sys.setswitchinterval(1e-6)
+        done = threading.Event()
+        errors = []
+
+        def writer():
+            writes = random.Random(4)
+            try:
+                for _ in range(300):
+                    leaderboard.record_scores([
+                        (pk, grade, writes.randrange(1000), 0) for pk, grade, _ in writes.sample(rows, 20)
+                    ])
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                done.set()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        reads = 0
+        while not done.is_set() or not reads:
+            board = leaderboard.get_leaderboard()
+            top = board.top(leaderboard.GLOBAL, 50)
+            self.assertEqual(len({row['student'] for row in top}), 50)
+            self.assertEqual([row['score'] for row in top], sorted((row['score'] for row in top), reverse=True))
+            pk = rng.randrange(1, 2001)
+            around = board.around('Senior 1' if pk % 2 else 'Senior 2', pk, 3)
+            self.assertIn(pk, [row['student'] for row in around])
+            self.assertEqual(len(board.among(range(1, 101))), 100)
+            reads += 1
+        thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(leaderboard.get_leaderboard().version, 300)
+
+
+@unittest.skipIf(connection.vendor == 'sqlite', 'SQLite serialises writers with a database-wide lock')
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class ScoreConcurrencyTests(TransactionTestCase):
+    workers = 16
+
+    def test_no_points_lost(self):
+        student = make_users(1)[0].student
+        barrier = threading.Barrier(self.workers)
+        errors = []
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(5):
+                    scores.add_points(student.pk, 2)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        student.refresh_from_db()
+        self.assertEqual(student.score, self.workers * 10)
+
+        row = ScoreHistory.objects.get(student=student)
+        self.assertEqual(len(row.events), self.workers * 5 * history.EVENT_DTYPE.itemsize)
+        self.assertEqual(history.score_chart(student.pk, timezone.localdate(), timezone.localdate())[0]['score'], student.score)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class ScoreHistoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_users(1)[0]
+        self.student = self.user.student
+        self.year = timezone.localdate().year - 1
+        for day, delta in [(1, 10), (5, 5)]:
+            Student.objects.filter(pk=self.student.pk).update(score=F('score') + delta)
+            moment = datetime.datetime(self.year, 3, day, 12, tzinfo=datetime.timezone.utc)
+            history.record_changes([(self.student.pk, self.student.grade, None, delta)], at=moment)
+        Student.objects.filter(pk=self.student.pk).update(score=0)
+
+    def chart(self, start, end, points):
+        return [(row['date'], row['score'], row['low'], row['high'])
+                for row in history.score_chart(self.student.pk, start, end, points)]
+
+    def test_daily_closes_and_downsampling(self):
+        start, end = datetime.date(self.year, 2, 28), datetime.date(self.year, 3, 6)
+        self.assertEqual([row[1] for row in self.chart(start, end, 10)], [0, 10, 10, 10, 10, 15, 15])
+        self.assertEqual(self.chart(start, end, 2), [
+            (datetime.date(self.year, 3, 2), 10, 0, 10),
+            (end, 15, 10, 15),
+        ])
+
+        row = ScoreHistory.objects.get(student=self.student)
+        self.assertEqual(len(row.daily_scores), 4 * history.days_in_year(self.year))
+        self.assertEqual(len(row.events), 2 * history.EVENT_DTYPE.itemsize)
+
+    def test_years_without_changes_carry_the_last_close(self):
+        start, end = datetime.date(self.year, 12, 31), datetime.date(self.year + 1, 1, 2)
+        with self.assertNumQueries(1):
+            self.assertEqual([row[1] for row in self.chart(start, end, 3)], [15, 15, 15])
+        # Before any recorded change the opening score is carried backwards
+        self.assertEqual([row[1] for row in self.chart(datetime.date(self.year - 1, 6, 1), datetime.date(self.year - 1, 6, 2), 2)], [0, 0])
+
+    def test_score_service_events_are_recorded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            scores.add_points(self.student.pk, 7)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(f'/dof3a-api/students/{self.student.pk}/score_history/', {'points': 1})
+        self.assertEqual(response.data[-1]['score'], 7)
+        self.assertEqual(response.data[-1]['date'], timezone.localdate())
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class ActivityTests(TestCase):
+    def setUp(self):
+        self.user = make_users(1)[0]
+        # Flushes are driven by the tests rather than the flusher thread
+        timer = mock.patch.object(activity.ActivityBuffer, '_start_timer')
+        timer.start()
+        self.addCleanup(timer.stop)
+
+    def events(self, count):
+        return [UserActivity(user=self.user, activity_type='login', metadata={'n': i}) for i in range(count)]
+
+    def test_buffer_writes_in_batches(self):
+        buffer = activity.ActivityBuffer(interval=60, batch_size=2)
+        for event in self.events(5):
+            buffer.add(event)
+        self.assertEqual(len(buffer), 5)
+        with self.assertNumQueries(3):
+            self.assertEqual(buffer.flush(), 5)
+        self.assertEqual(sorted(UserActivity.objects.values_list('metadata__n', flat=True)), [0, 1, 2, 3, 4])
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_failed_flush_keeps_unwritten_events(self):
+        buffer = activity.ActivityBuffer(interval=60, batch_size=2)
+        for event in self.events(5):
+            buffer.add(event)
+        batches = []
+
+        def write_one_batch(events):
+            if batches:
+                raise OSError
+            batches.append(UserActivity.objects.bulk_create(events))
+
+        with mock.patch.object(activity, '_write', write_one_batch):
+            with self.assertRaises(OSError):
+                buffer.flush()
+        self.assertEqual([event.metadata['n'] for event in buffer._pending], [2, 3, 4])
+        # The flusher is started again to retry them
+        activity.ActivityBuffer._start_timer.assert_called_with(60)
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(UserActivity.objects.count(), 5)
+
+    def test_full_buffer_is_written_by_the_producer(self):
+        buffer = activity.ActivityBuffer(interval=60, max_pending=3)
+        for event in self.events(3):
+            buffer.add(event)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(UserActivity.objects.count(), 3)
+
+    def test_views_and_signals_record_activity(self):
+        self.user.set_password('secret-password')
+        self.user.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(author=self.user, caption='c', description='d')
+            Comment.objects.create(author=self.user, post=post, body='b')
+            response = APIClient().post('/auth/jwt/create/', {'username': self.user.username, 'password': 'secret-password'})
+            client = APIClient()
+            client.force_authenticate(self.user)
+            client.patch('/auth/users/me/', {'first_name': 'Sam'})
+            # Reading a profile isn't activity
+            client.get('/dof3a-api/students/my_profile/')
+        self.assertIn('access', response.data)
+        self.assertEqual(
+            sorted(UserActivity.objects.filter(user=self.user).values_list('activity_type', flat=True)),
+            ['comment_create', 'login', 'post_create', 'profile_update'],
+        )
+
+
+class ActivityWriteTests(TransactionTestCase):
+    def test_events_of_deleted_users_are_dropped(self):
+        user, gone = make_users(2)
+        buffer = activity.ActivityBuffer(interval=60)
+        for user_id in (user.pk, gone.pk, user.pk):
+            buffer.add(UserActivity(user_id=user_id, activity_type='login'))
+        gone.delete()
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(list(UserActivity.objects.values_list('user', flat=True)), [user.pk] * 2)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user, self.fan = make_users(2)
+        self.now = timezone.now()
+
+    def add(self, activity_type, hours_ago=1, **metadata):
+        UserActivity.objects.create(user=self.user, activity_type=activity_type, metadata=metadata,
+                                    created_at=self.now - datetime.timedelta(hours=hours_ago))
+
+    def totals(self):
+        return rollups.engagement([self.user.pk, self.fan.pk], today=timezone.localdate(self.now))
+
+    def test_merge_only_increments_the_counters_it_changes(self):
+        day = timezone.localdate(self.now)
+        DailyActivity.objects.create(user=self.user, day=day, likes_given=2)
+        with CaptureQueriesContext(connection) as queries:
+            rollups._merge({(self.user.pk, day): {'posts': 1}, (self.fan.pk, day): {'posts': 1}})
+        # A post like rollup writing the same row at the same time keeps its counts
+        [update] = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertNotIn('likes_given', update)
+        rows = DailyActivity.objects.order_by('user_id').values_list('user_id', 'posts', 'likes_given')
+        self.assertEqual(list(rows), [(self.user.pk, 1, 2), (self.fan.pk, 1, 0)])
+
+    def test_rollup_counts_each_row_once(self):
+        self.add('post_create')
+        self.add('comment_create')
+        self.add('knockout_complete', answers=5, correct=3)
+        self.add('login')
+        post = Post.objects.create(author=self.user, caption='c', description='d')
+        PostLike.objects.create(post=post, user=self.fan)
+
+        # The like is too fresh to count yet
+        self.assertEqual(rollups.rollup(now=self.now), {'activity': 4, 'post_likes': 0})
+        later = self.now + datetime.timedelta(minutes=5)
+        self.assertEqual(rollups.rollup(now=later), {'activity': 0, 'post_likes': 1})
+        self.assertEqual(rollups.rollup(now=later), {'activity': 0, 'post_likes': 0})
+
+        self.add('post_create', hours_ago=0.5)
+        rollups.rollup(now=later)
+        totals = self.totals()
+        mine = {key: totals[self.user.pk][key] for key in ('posts', 'comments', 'games', 'answers', 'correct_answers',
+                                                           'likes_received', 'likes_given')}
+        self.assertEqual(mine, {'posts': 2, 'comments': 1, 'games': 1, 'answers': 5, 'correct_answers': 3,
+                                'likes_received': 1, 'likes_given': 0})
+        self.assertEqual(totals[self.fan.pk]['likes_given'], 1)
+        self.assertLessEqual(DailyActivity.objects.filter(user=self.user).count(), 2)
+
+    def test_engagement_levels(self):
+        self.assertEqual(self.totals()[self.user.pk]['level'], 'Low')
+        for day in range(4):
+            self.add('comment_create', hours_ago=24 * day + 1)
+        rollups.rollup(now=self.now)
+        self.assertEqual(self.totals()[self.user.pk]['level'], 'Moderate')
+        with self.assertNumQueries(1):
+            self.totals()
+
+
+
+class StreakTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user, self.other = make_users(2)
+        self.now = timezone.make_aware(datetime.datetime(2026, 3, 10, 12))
+        self.today = timezone.localdate(self.now)
+
+    def add(self, user, activity_type, days_ago, count=1):
+        UserActivity.objects.bulk_create([
+            UserActivity(user=user, activity_type=activity_type,
+                         created_at=self.now - datetime.timedelta(days=days_ago, hours=1))
+            for _ in range(count)
+        ])
+
+    def test_streaks_move_once_per_day(self):
+        for days_ago in (5, 2, 1, 0):
+            self.add(self.user, 'comment_create', days_ago, count=3)
+        self.add(self.other, 'login', 0)
+        # Logins don't count towards a streak
+        self.assertEqual(streaks.update_streaks(now=self.now), 12)
+        streak = LearningStreak.objects.get(user=self.user)
+        self.assertEqual((streak.current_streak, streak.longest_streak, streak.last_active_day), (3, 3, self.today))
+        self.assertFalse(LearningStreak.objects.filter(user=self.other).exists())
+
+        # Already counted today: more events and reruns change nothing
+        self.add(self.user, 'post_create', 0)
+        streaks.update_streaks(now=self.now)
+        self.assertEqual(streaks.update_streaks(now=self.now), 0)
+        streak.refresh_from_db()
+        self.assertEqual(streak.current_streak, 3)
+
+    def test_nightly_reset_and_cached_reads(self):
+        self.add(self.user, 'knockout_complete', 3)
+        self.add(self.user, 'knockout_complete', 2)
+        self.add(self.other, 'post_create', 0)
+        streaks.update_streaks(now=self.now)
+
+        with self.assertNumQueries(1):
+            read = streaks.get_streaks([self.user.pk, self.other.pk], today=self.today)
+        # Broken since the day before yesterday, so it reads as 0 before the sweep resets it
+        self.assertEqual(read[self.user.pk]['current'], 0)
+        self.assertEqual(read[self.user.pk]['longest'], 2)
+        self.assertEqual(read[self.other.pk]['current'], 1)
+        with self.assertNumQueries(0):
+            streaks.get_streaks([self.user.pk, self.other.pk], today=self.today)
+
+        self.assertEqual(streaks.reset_broken_streaks(self.today), 1)
+        self.assertEqual(LearningStreak.objects.get(user=self.user).current_streak, 0)
+        self.assertEqual(streaks.reset_broken_streaks(self.today), 0)
+
+        # New activity replaces the cached streak once counted
+        self.add(self.user, 'post_create', 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            streaks.update_streaks(now=self.now)
+        with self.assertNumQueries(0):
+            self.assertEqual(streaks.get_streak(self.user.pk, today=self.today), {
+                'current': 1, 'longest': 2, 'last_active_day': self.today,
+            })
+
+    def test_read_racing_an_update_keeps_the_newer_streak(self):
+        self.add(self.user, 'post_create', 1)
+        streaks.update_streaks(now=self.now)
+        read = streaks._read
+
+        def racing_read(user_ids):
+            stale = read(user_ids)
+            # update_streaks() commits and caches a newer streak while this read is in flight
+            self.add(self.user, 'post_create', 0)
+            with mock.patch.object(streaks, '_read', read), self.captureOnCommitCallbacks(execute=True):
+                streaks.update_streaks(now=self.now)
+            return stale
+
+        with mock.patch.object(streaks, '_read', racing_read):
+            self.assertEqual(streaks.get_streak(self.user.pk, today=self.today)['current'], 1)
+        self.assertEqual(streaks.get_streak(self.user.pk, today=self.today)['current'], 2)
@@ -1,9 +1,11 @@
 from rest_framework_nested import routers
-from .views import StudentViewSet, PostViewSet, CommentViewSet, FriendRequestViewSet, StudyGroupViewSet
+from .views import StudentViewSet, PostViewSet, FeedViewSet, LeaderboardViewSet, CommentViewSet, FriendRequestViewSet, StudyGroupViewSet
 
 router = routers.DefaultRouter()
 router.register(r'students', StudentViewSet, basename='students')
 router.register(r'posts', PostViewSet, basename='posts')
+router.register(r'feed', FeedViewSet, basename='feed')
+router.register(r'leaderboard', LeaderboardViewSet, basename='leaderboard')
 router.register(r'friend-requests', FriendRequestViewSet, basename='friend-request')
 router.register(r'studygroups', StudyGroupViewSet, basename='study-groups')
 
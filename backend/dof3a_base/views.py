@@ -1,18 +1,46 @@
+from datetime import timedelta
+
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from rest_framework import status, permissions, mixins, viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from .serializers import StudentSerializer, PostSerializer, CreatePostSerialier, CommentSerializer, FriendRequestSerializer, StudyGroupSerializer
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.urls import replace_query_param
+from .serializers import StudentSerializer, PostSerializer, SimpleCommentSerializer, CreatePostSerialier, CommentSerializer, FriendRequestSerializer, FriendRequestIdsSerializer, StudyGroupSerializer
 from .models import Student, Post, Comment, FriendRequest, StudyGroup
 from .permissions.comment_perms import IsCommentAuthor
+from .likes import like_post, unlike_post, get_like_count
+from .pagination import PostCursorPagination, CommentCursorPagination
+from .feed import feed_post_ids
+from .friends import accept_friend_requests, reject_friend_requests
+from .ranking import ranked_post_ids
+from .suggestions import cached_suggestions, get_graph, mutual_friend_counts
+from .leaderboard import GLOBAL, get_leaderboard
+from .history import score_chart
+from .streaks import get_streak
 
 class StudentViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Student.objects.all()
+    queryset = Student.objects.select_related('user')
     serializer_class = StudentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_serializer_context(self):
-        return {'request': self.request}
+        # Filled in per response by list()/retrieve() so the serializer never queries per student
+        return {'request': self.request, 'mutual_friends': getattr(self, 'mutual_friends', {})}
+
+    def list(self, request, *args, **kwargs):
+        students = list(self.filter_queryset(self.get_queryset()))
+        self.mutual_friends = mutual_friend_counts(request.user.student.pk, [student.pk for student in students])
+        return Response(self.get_serializer(students, many=True).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        student = self.get_object()
+        self.mutual_friends = mutual_friend_counts(request.user.student.pk, [student.pk])
+        return Response(self.get_serializer(student).data)
 
     @action(detail=False, methods=['GET'], url_path='my_profile')
     def my_profile(self, request):
@@ -29,6 +57,35 @@ class StudentViewSet(viewsets.ReadOnlyModelViewSet):
                 return Response(serializer.data)
         except Student.DoesNotExist:
             return Response({'detail': 'No user found with this ID.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=['GET'], url_path='score_history')
+    def score_history(self, request, pk=None):
+        """Daily score chart: ?start=&end= (YYYY-MM-DD, default the last 90 days) and ?points=."""
+        student = self.get_object()
+        try:
+            end = parse_date(request.query_params.get('end', '')) or timezone.localdate()
+            start = parse_date(request.query_params.get('start', '')) or end - timedelta(days=89)
+            points = int(request.query_params.get('points', 90))
+        except ValueError:
+            return Response({'detail': 'start and end must be YYYY-MM-DD dates and points an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(score_chart(student.pk, start, end, points))
+
+    @action(detail=True, methods=['GET'])
+    def streak(self, request, pk=None):
+        student = self.get_object()
+        return Response(get_streak(student.user_id))
+
+    @action(detail=False, methods=['GET'])
+    def suggestions(self, request):
+        suggestions = cached_suggestions(request.user.student)
+        students = Student.objects.select_related('user').in_bulk([suggestion['student'] for suggestion in suggestions])
+        context = {'mutual_friends': {suggestion['student']: suggestion['mutual_friends'] for suggestion in suggestions}}
+        results = []
+        for suggestion in suggestions:
+            student = students.get(suggestion['student'])
+            if student is not None:
+                results.append({**suggestion, 'student': StudentSerializer(student, context=context).data})
+        return Response(results)
         
     @action(detail=True, methods=['GET'], url_path='send_friend_request')
     def send_friend_request(self, request, pk=None):
@@ -53,8 +110,13 @@ class StudentViewSet(viewsets.ReadOnlyModelViewSet):
             return Response({'error': 'Target student not found'}, status=status.HTTP_404_NOT_FOUND)
         
 class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all()
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PostCursorPagination
+    # Comments embedded per post in list/detail responses
+    top_comments = 3
+
+    def get_queryset(self):
+        return Post.objects.with_counts().with_top_comments(self.top_comments)
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -64,9 +126,157 @@ class PostViewSet(viewsets.ModelViewSet):
     def get_serializer_context(self):
         return {'author': self.request.user}
 
+    @action(detail=True, methods=['GET'], url_path='more_comments')
+    def more_comments(self, request, pk=None):
+        if not Post.objects.filter(pk=pk).exists():
+            return Response({'detail': 'No post found with this ID.'}, status=status.HTTP_404_NOT_FOUND)
+
+        comments = Comment.objects.filter(post_id=pk)
+        # Skip the comments already embedded in the post payload
+        last_embedded = comments.order_by('-id').values_list('id', flat=True)[self.top_comments - 1:self.top_comments].first()
+        if last_embedded is None:
+            comments = comments.none()
+        else:
+            comments = comments.filter(id__lt=last_embedded)
+
+        paginator = CommentCursorPagination()
+        page = paginator.paginate_queryset(comments, request, view=self)
+        serializer = SimpleCommentSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['POST'])
+    def like(self, request, pk=None):
+        try:
+            post = Post.objects.get(pk=pk)
+            if not like_post(post, request.user):
+                return Response({'detail': 'You already liked this post.'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'likes': get_like_count(post)}, status=status.HTTP_200_OK)
+
+        except Post.DoesNotExist:
+            return Response({'detail': 'No post found with this ID.'}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=True, methods=['POST'])
+    def unlike(self, request, pk=None):
+        try:
+            post = Post.objects.get(pk=pk)
+            if not unlike_post(post, request.user):
+                return Response({'detail': 'You have not liked this post.'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'likes': get_like_count(post)}, status=status.HTTP_200_OK)
+
+        except Post.DoesNotExist:
+            return Response({'detail': 'No post found with this ID.'}, status=status.HTTP_404_NOT_FOUND)
+
+class FeedViewSet(viewsets.GenericViewSet):
+    serializer_class = PostSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    # Keyset pagination on post id: ?before=<id of the last post seen>
+    page_size = 20
+    max_page_size = 100
+
+    def list(self, request):
+        try:
+            page_size = max(1, min(int(request.query_params.get('page_size', self.page_size)), self.max_page_size))
+            before = request.query_params.get('before')
+            before = int(before) if before else None
+        except ValueError:
+            return Response({'detail': 'page_size and before must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        post_ids = feed_post_ids(request.user, before=before, limit=page_size + 1)
+        has_more = len(post_ids) > page_size
+        post_ids = post_ids[:page_size]
+
+        posts = (
+            Post.objects.filter(id__in=post_ids)
+            .with_counts()
+            .with_top_comments(PostViewSet.top_comments)
+            .order_by('-id')
+        )
+        serializer = self.get_serializer(posts, many=True)
+        next_url = None
+        if has_more:
+            next_url = replace_query_param(request.build_absolute_uri(), 'before', post_ids[-1])
+        return Response({'next': next_url, 'results': serializer.data})
+
+    @action(detail=False, methods=['GET'])
+    def ranked(self, request):
+        try:
+            page_size = max(1, min(int(request.query_params.get('page_size', self.page_size)), self.max_page_size))
+            page = max(1, int(request.query_params.get('page', 1)))
+        except ValueError:
+            return Response({'detail': 'page_size and page must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        ranked = ranked_post_ids(request.user)
+        post_ids = ranked[(page - 1) * page_size:page * page_size]
+        posts = Post.objects.filter(id__in=post_ids).with_counts().with_top_comments(PostViewSet.top_comments).in_bulk()
+
+        serializer = self.get_serializer([posts[post_id] for post_id in post_ids if post_id in posts], many=True)
+        next_url = None
+        if page * page_size < len(ranked):
+            next_url = replace_query_param(request.build_absolute_uri(), 'page', page + 1)
+        return Response({'next': next_url, 'results': serializer.data})
+
+
+class LeaderboardViewSet(viewsets.GenericViewSet):
+    permission_classes = [permissions.IsAuthenticated]
+    # ?board=global|grade|friends; grade boards default to the viewer's grade
+    boards = ('global', 'grade', 'friends')
+    default_limit = 50
+    max_limit = 100
+    default_radius = 5
+
+    def _board_rows(self, request, student):
+        """(board name, rows) for the requested board; rows is None for ranked boards."""
+        board = request.query_params.get('board', 'global')
+        if board not in self.boards:
+            raise ValidationError({'board': f'Must be one of {", ".join(self.boards)}.'})
+        if board == 'friends':
+            friend_ids = get_graph().friends_of(student.pk).tolist()
+            return board, get_leaderboard().among([student.pk, *friend_ids])
+        if board == 'grade':
+            return request.query_params.get('grade', student.grade), None
+        return GLOBAL, None
+
+    def _int_param(self, request, name, default, maximum):
+        try:
+            return max(0, min(int(request.query_params.get(name, default)), maximum))
+        except ValueError:
+            raise ValidationError({name: 'Must be an integer.'})
+
+    def _with_usernames(self, rows):
+        usernames = dict(Student.objects.filter(pk__in=[row['student'] for row in rows]).values_list('pk', 'user__username'))
+        return [{**row, 'username': usernames.get(row['student'])} for row in rows]
+
+    def list(self, request):
+        student = request.user.student
+        limit = self._int_param(request, 'limit', self.default_limit, self.max_limit)
+        board, rows = self._board_rows(request, student)
+        rows = rows[:limit] if rows is not None else get_leaderboard().top(board, limit)
+        return Response(self._with_usernames(rows))
+
+    @action(detail=False, methods=['GET'])
+    def me(self, request):
+        """The viewer's rank with up to `radius` neighbours either side."""
+        student = request.user.student
+        radius = self._int_param(request, 'radius', self.default_radius, self.max_limit // 2)
+        board, rows = self._board_rows(request, student)
+        if rows is None:
+            rows = get_leaderboard().around(board, student.pk, radius)
+        else:
+            position = next((i for i, row in enumerate(rows) if row['student'] == student.pk), 0)
+            rows = rows[max(position - radius, 0):position + radius + 1]
+
+        me = next((row for row in rows if row['student'] == student.pk), None)
+        return Response({
+            'rank': me and me['rank'],
+            'score': me and me['score'],
+            'neighbours': self._with_usernames(rows),
+        })
+
+
 class CommentViewSet(viewsets.ModelViewSet):
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CommentCursorPagination
 
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -75,7 +285,10 @@ class CommentViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         post_pk = self.kwargs['post_pk']
-        return Comment.objects.filter(post=post_pk)
+        liked_by_me = Comment.liked_by.through.objects.filter(
+            comment=OuterRef('pk'), user=self.request.user.pk
+        )
+        return Comment.objects.filter(post=post_pk).annotate(liked_by_me=Exists(liked_by_me))
     
     def get_serializer_context(self):
         return {
@@ -93,12 +306,32 @@ class CommentViewSet(viewsets.ModelViewSet):
             comment = Comment.objects.get(id=comment_id, post_id=post_id)
             if comment.liked_by.filter(id=user.id).exists():
                 return Response({'detail': 'You already liked this comment.'}, status=status.HTTP_400_BAD_REQUEST)
-            comment.liked_by.add(user)
+            with transaction.atomic():
+                comment.liked_by.add(user)
+            comment.refresh_from_db(fields=['like_count'])
             return Response({'likes': comment.likes}, status=status.HTTP_200_OK)
         
         except Comment.DoesNotExist:
             return Response({'detail': 'No comment found with this ID.'}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=True, methods=['POST'], permission_classes=[permissions.IsAuthenticated])
+    def unlike_comment(self, request, *args, **kwargs):
+        comment_id = kwargs.get('pk')
+        post_id = kwargs.get('post_pk')
+        user = request.user
+
+        try:
+            comment = Comment.objects.get(id=comment_id, post_id=post_id)
+            if not comment.liked_by.filter(id=user.id).exists():
+                return Response({'detail': 'You have not liked this comment.'}, status=status.HTTP_400_BAD_REQUEST)
+            with transaction.atomic():
+                comment.liked_by.remove(user)
+            comment.refresh_from_db(fields=['like_count'])
+            return Response({'likes': comment.likes}, status=status.HTTP_200_OK)
+
+        except Comment.DoesNotExist:
+            return Response({'detail': 'No comment found with this ID.'}, status=status.HTTP_404_NOT_FOUND)
+
 
 class FriendRequestViewSet(viewsets.ModelViewSet):
     queryset = FriendRequest.objects.all()
@@ -106,7 +339,16 @@ class FriendRequestViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         current_student = self.request.user.student
-        return FriendRequest.objects.filter(to_student=current_student)
+        return FriendRequest.objects.filter(to_student=current_student).select_related('from_student__user')
+
+    def list(self, request, *args, **kwargs):
+        friend_requests = list(self.filter_queryset(self.get_queryset()))
+        self.mutual_friends = mutual_friend_counts(
+            request.user.student.pk, [friend_request.from_student_id for friend_request in friend_requests])
+        return Response(self.get_serializer(friend_requests, many=True).data)
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'mutual_friends': getattr(self, 'mutual_friends', {})}
 
     @action(detail=True, methods=['POST', 'GET'], url_path='accept')
     def accept_request(self, request, pk=None):
@@ -114,14 +356,10 @@ class FriendRequestViewSet(viewsets.ModelViewSet):
             current_student = request.user.student
             friend_request = FriendRequest.objects.get(pk=pk)
 
-            if friend_request.to_student != current_student:
+            if friend_request.to_student_id != current_student.pk:
                 return Response({'error': 'Unauthorized action.'}, status=status.HTTP_403_FORBIDDEN)
 
-            current_student.friends.add(friend_request.from_student)
-            friend_request.from_student.friends.add(current_student)
-
-            friend_request.delete()
-
+            accept_friend_requests(current_student, [friend_request.pk])
             return Response({'success': 'Friend request accepted.'}, status=status.HTTP_200_OK)
 
         except FriendRequest.DoesNotExist:
@@ -133,14 +371,32 @@ class FriendRequestViewSet(viewsets.ModelViewSet):
             friend_request = FriendRequest.objects.get(pk=pk)
             current_student = request.user.student
 
-            if friend_request.to_student != current_student:
+            if friend_request.to_student_id != current_student.pk:
                 return Response({'error': 'Unauthorized action.'}, status=status.HTTP_403_FORBIDDEN)
 
-            friend_request.delete()
+            reject_friend_requests(current_student, [friend_request.pk])
             return Response({'success': 'Friend request rejected.'}, status=status.HTTP_200_OK)
 
         except FriendRequest.DoesNotExist:
             return Response({'error': 'Friend request not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['POST'], url_path='accept')
+    def accept_many(self, request):
+        serializer = FriendRequestIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        request_ids = serializer.validated_data['ids']
+
+        accepted = accept_friend_requests(request.user.student, request_ids)
+        return Response({'accepted': accepted, 'not_found': sorted(set(request_ids) - set(accepted))})
+
+    @action(detail=False, methods=['POST'], url_path='reject')
+    def reject_many(self, request):
+        serializer = FriendRequestIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        request_ids = serializer.validated_data['ids']
+
+        rejected = reject_friend_requests(request.user.student, request_ids)
+        return Response({'rejected': rejected, 'not_found': sorted(set(request_ids) - set(rejected))})
         
 class StudyGroupViewSet(mixins.RetrieveModelMixin, mixins.CreateModelMixin, mixins.DestroyModelMixin, mixins.UpdateModelMixin, viewsets.GenericViewSet):
     permission_classes = [permissions.IsAuthenticated]
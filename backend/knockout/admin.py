@@ -0,0 +1,38 @@
+from django.contrib import admin
+from . import models
+
+
+@admin.register(models.BankQuestion)
+class BankQuestionAdmin(admin.ModelAdmin):
+    list_display = ['question_text', 'subject', 'grade_level', 'difficulty', 'topic', 'irt_difficulty', 'irt_responses']
+    list_filter = ['subject', 'grade_level', 'difficulty']
+
+
+@admin.register(models.KnockoutGame)
+class KnockoutGameAdmin(admin.ModelAdmin):
+    list_display = ['player1', 'player2', 'subject', 'status', 'player1_score', 'player2_score', 'winner', 'created_at']
+    list_filter = ['status', 'subject']
+
+
+@admin.register(models.SubjectRating)
+class SubjectRatingAdmin(admin.ModelAdmin):
+    list_display = ['user', 'subject', 'rating', 'deviation', 'games', 'ability']
+    list_filter = ['subject']
+
+
+@admin.register(models.Tournament)
+class TournamentAdmin(admin.ModelAdmin):
+    list_display = ['name', 'subject', 'grade_level', 'format', 'status', 'current_round', 'rounds', 'winner']
+    list_filter = ['status', 'format', 'subject']
+
+
+@admin.register(models.ReviewItem)
+class ReviewItemAdmin(admin.ModelAdmin):
+    list_display = ['user', 'bank_question', 'due_date', 'repetitions', 'interval_days', 'ease_factor', 'lapses']
+    list_filter = ['due_date']
+
+
+@admin.register(models.TopicProgress)
+class TopicProgressAdmin(admin.ModelAdmin):
+    list_display = ['user', 'subject', 'topic', 'answered', 'correct']
+    list_filter = ['subject']
@@ -0,0 +1,176 @@
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from dof3a_base.models import Student
+
+from .models import GradeTopicSnapshot, TopicProgress
+from .progress import MIN_ANSWERS, WEAK_LIMIT, WEAK_MASTERY, class_mastery, smoothed_mastery
+
+HEATMAP_TTL = 3600  # seconds
+PERCENTILES = [10, 25, 50, 75, 90]
+# A topic is weak for the grade once this share of the students counted in it are weak in it
+WEAK_SHARE = 0.3
+# Weak topics cluster together when the students weak in them overlap at least this much (Jaccard)
+CLUSTER_OVERLAP = 0.5
+# Change in mastery is measured against the latest snapshot at least this old
+DELTA_DAYS = 7
+GRADES = [grade for grade, _ in Student.STUDENT_GRADE if grade != Student.OPTION_SELECT]
+
+
+def heatmap_key(grade_level):
+    return f"grade_heatmap:{grade_level.replace(' ', '_')}"
+
+
+def snapshot_grades(today=None):
+    """Record every grade's topic totals for today, in one aggregate query. Returns the rows written."""
+    today = today or timezone.localdate()
+    totals = (
+        TopicProgress.objects.filter(user__student__grade__in=GRADES)
+        .values_list('user__student__grade', 'subject', 'topic')
+        .annotate(answered=Sum('answered'), correct=Sum('correct'))
+    )
+    snapshots = [
+        GradeTopicSnapshot(grade_level=grade, subject=subject, topic=topic, day=today, answered=answered, correct=correct)
+        for grade, subject, topic, answered, correct in totals
+    ]
+    # A second run the same day keeps the first day's totals
+    GradeTopicSnapshot.objects.bulk_create(snapshots, batch_size=1000, ignore_conflicts=True)
+    return len(snapshots)
+
+
+def _clusters(weak, columns):
+    """
+    Group topics whose weak students overlap, as lists of column indexes, largest first.
+
+    Topics are linked when the Jaccard overlap of their weak students
+    reaches CLUSTER_OVERLAP, and clusters are the connected groups, found by
+    passing the smallest label along links until nothing changes.
+    """
+    if not len(columns):
+        return []
+    weak = weak[:, columns].astype(np.int64)
+    together = weak.T @ weak
+    alone = np.diag(together)
+    linked = together >= CLUSTER_OVERLAP * (alone[:, None] + alone[None, :] - together)
+    labels = np.arange(len(columns))
+    while True:
+        spread = np.where(linked, labels[None, :], len(columns)).min(axis=1)
+        if np.array_equal(spread, labels):
+            break
+        labels = spread
+    groups = [columns[labels == label] for label in np.unique(labels)]
+    return sorted(groups, key=len, reverse=True)
+
+
+def _previous(grade_level, topics, today):
+    """Each topic's (answered, correct) at the latest snapshot DELTA_DAYS or more ago; zeros where there is none."""
+    answered = np.zeros(len(topics), dtype=np.int64)
+    correct = np.zeros_like(answered)
+    snapshots = GradeTopicSnapshot.objects.filter(grade_level=grade_level)
+    day = snapshots.filter(day__lte=today - timedelta(days=DELTA_DAYS)).aggregate(day=Max('day'))['day']
+    if day is None:
+        return day, answered, correct
+    columns = {topic: column for column, topic in enumerate(topics)}
+    for subject, topic, topic_answered, topic_correct in snapshots.filter(day=day).values_list(
+            'subject', 'topic', 'answered', 'correct'):
+        column = columns.get((subject, topic))
+        if column is not None:
+            answered[column], correct[column] = topic_answered, topic_correct
+    return day, answered, correct
+
+
+def build_heatmap(grade_level, today=None):
+    """
+    Mastery analytics of every student in the grade by topic, computed over whole arrays at once.
+
+    For each topic: the grade's mastery, percentiles of its students'
+    mastery, the share of them weak in it, and its change since the
+    snapshot DELTA_DAYS ago. Students count towards a topic once they have
+    answered it MIN_ANSWERS times. Also the weak topics, the clusters of
+    weak topics the same students struggle with, and the heatmap itself.
+    """
+    today = today or timezone.localdate()
+    matrix = class_mastery(grade_level)
+    mastery = matrix.mastery
+    counted = matrix.answered >= MIN_ANSWERS
+    weak = counted & (mastery < WEAK_MASTERY)
+    students = counted.sum(axis=0)
+    weak_share = weak.sum(axis=0) / np.maximum(students, 1)
+    topic_mastery = matrix.topic_mastery()
+
+    percentiles = np.full((len(PERCENTILES), len(matrix.topics)), np.nan)
+    seen = np.flatnonzero(students)
+    if len(seen):
+        percentiles[:, seen] = np.nanpercentile(np.where(counted, mastery, np.nan)[:, seen], PERCENTILES, axis=0)
+
+    since, answered, correct = _previous(grade_level, matrix.topics, today)
+    delta = np.where(answered > 0, topic_mastery - smoothed_mastery(answered, correct), np.nan)
+
+    def value(number):
+        return None if np.isnan(number) else round(float(number), 3)
+
+    def name(column):
+        return {'subject': matrix.topics[column][0], 'topic': matrix.topics[column][1]}
+
+    weak_columns = np.flatnonzero(weak_share >= WEAK_SHARE)
+    weak_columns = weak_columns[np.argsort(-weak_share[weak_columns], kind='stable')]
+    return {
+        'grade_level': grade_level,
+        'students': len(matrix.user_ids),
+        'delta_since': since,
+        'topics': [
+            {
+                **name(column),
+                'mastery': value(topic_mastery[column]),
+                'students': int(students[column]),
+                'weak_share': value(weak_share[column]),
+                'percentiles': {str(p): value(percentiles[row, column]) for row, p in enumerate(PERCENTILES)},
+                'delta': value(delta[column]),
+            }
+            for column in range(len(matrix.topics))
+        ],
+        'weak_topics': [{**name(column), 'weak_share': value(weak_share[column])} for column in weak_columns],
+        'clusters': [
+            {'topics': [name(column) for column in group], 'students': int(weak[:, group].all(axis=1).sum())}
+            for group in _clusters(weak, weak_columns)
+        ],
+        'heatmap': {
+            'users': matrix.user_ids,
+            # None where a student hasn't answered the topic enough to count
+            'mastery': np.where(counted, np.round(mastery, 3), None).tolist(),
+        },
+    }
+
+
+def refresh_heatmaps(today=None):
+    """
+    Rebuild every grade's heatmap into the default cache. Returns the grades built.
+
+    The cache is shared by every process (dof3a_base.E001 checks this on
+    deploy), so the web workers read what the nightly command built here.
+    """
+    for grade_level in GRADES:
+        cache.set(heatmap_key(grade_level), build_heatmap(grade_level, today), HEATMAP_TTL)
+    return len(GRADES)
+
+
+def grade_heatmap(grade_level):
+    """build_heatmap() for the grade, from the cache when it was built in the last HEATMAP_TTL."""
+    key = heatmap_key(grade_level)
+    heatmap = cache.get(key)
+    if heatmap is None:
+        heatmap = build_heatmap(grade_level)
+        # A refresh that finished while this was building is at least as new
+        cache.add(key, heatmap, HEATMAP_TTL)
+    return heatmap
+
+
+def grade_weak_topics(grade_level, subject=None, limit=WEAK_LIMIT):
+    """The topics the most students in the grade are weak in, most first."""
+    if grade_level not in GRADES:
+        return []
+    return [topic for topic in grade_heatmap(grade_level)['weak_topics'] if not subject or topic['subject'] == subject][:limit]
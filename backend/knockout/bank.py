@@ -0,0 +1,110 @@
+import random
+
+import numpy as np
+
+from .irt import PRIOR_DIFFICULTY, information
+from .models import BankQuestion, KnockoutQuestion
+
+OPTION_FIELDS = ['option_a', 'option_b', 'option_c', 'option_d']
+# Adaptive picks are drawn from this many times `count` of the most informative questions,
+# so players of the same ability don't keep getting the same game
+SHORTLIST_FACTOR = 4
+
+
+def save_generated_questions(result, subject, grade_level, difficulty):
+    """Store the questions from ai_models.generate_knockout_questions() in the bank."""
+    questions = []
+    for item in result.get('questions', []):
+        options = [option.split('. ', 1)[-1] for option in item.get('options', [])]
+        if len(options) != 4 or item.get('correct_answer') not in 'ABCD':
+            continue
+        questions.append(BankQuestion(
+            subject=subject,
+            grade_level=grade_level,
+            difficulty=difficulty,
+            topic=item.get('topic', '')[:100],
+            question_text=item['question'],
+            explanation=item.get('explanation', ''),
+            correct_answer=item['correct_answer'],
+            **dict(zip(OPTION_FIELDS, options)),
+        ))
+    return BankQuestion.objects.bulk_create(questions)
+
+
+def pick_questions(subject, grade_level, difficulty, count):
+    """Up to `count` random bank questions for the game settings, without ORDER BY RANDOM()."""
+    ids = list(
+        BankQuestion.objects.filter(subject=subject, grade_level=grade_level, difficulty=difficulty)
+        .values_list('pk', flat=True)
+    )
+    chosen = random.sample(ids, min(count, len(ids)))
+    bank = BankQuestion.objects.in_bulk(chosen)
+    return [bank[pk] for pk in chosen]
+
+
+def pick_adaptive_questions(subject, grade_level, abilities, count):
+    """
+    Up to `count` bank questions suited to players of these IRT abilities, easiest first.
+
+    Questions are ranked by the information they give about the players, so
+    each is one they have a fair chance at. Uncalibrated questions are placed
+    by the difficulty they were generated for, which lets new questions get
+    answered and calibrated.
+    """
+    rows = list(
+        BankQuestion.objects.filter(subject=subject, grade_level=grade_level)
+        .values_list('pk', 'difficulty', 'irt_difficulty', 'irt_discrimination')
+    )
+    if not rows:
+        return []
+    ids = np.array([pk for pk, _, _, _ in rows])
+    difficulty = np.array([PRIOR_DIFFICULTY.get(label, 0.0) if b is None else b for _, label, b, _ in rows])
+    discrimination = np.array([1.0 if a is None else a for _, _, _, a in rows])
+    gain = information(np.asarray(abilities, dtype=np.float64)[None, :], difficulty[:, None], discrimination[:, None]).sum(axis=1)
+
+    shortlist = np.argsort(-gain, kind='stable')[:count * SHORTLIST_FACTOR].tolist()
+    chosen = sorted(random.sample(shortlist, min(count, len(shortlist))), key=lambda i: difficulty[i])
+    bank = BankQuestion.objects.in_bulk(ids[chosen].tolist())
+    return [bank[pk] for pk in ids[chosen].tolist()]
+
+
+def allocate_question_sets(subject, grade_level, sets, count):
+    """
+    `sets` random question sets of up to `count` each, for a whole round of games.
+
+    Reads the bank with one query for the ids and one for the chosen rows,
+    however many sets are wanted. Returns [] if the bank has no questions.
+    """
+    ids = list(BankQuestion.objects.filter(subject=subject, grade_level=grade_level).values_list('pk', flat=True))
+    if not ids:
+        return []
+    chosen = [random.sample(ids, min(count, len(ids))) for _ in range(sets)]
+    bank = BankQuestion.objects.in_bulk({pk for question_set in chosen for pk in question_set})
+    return [[bank[pk] for pk in question_set] for question_set in chosen]
+
+
+def _game_questions(game_id, bank_questions):
+    return [
+        KnockoutQuestion(
+            game_id=game_id,
+            bank_question=question,
+            question_text=question.question_text,
+            correct_answer=question.correct_answer,
+            explanation=question.explanation,
+            question_order=order,
+            **{field: getattr(question, field) for field in OPTION_FIELDS},
+        )
+        for order, question in enumerate(bank_questions)
+    ]
+
+
+def copy_into_game(game, bank_questions):
+    return KnockoutQuestion.objects.bulk_create(_game_questions(game.pk, bank_questions))
+
+
+def copy_into_games(games):
+    """Copy questions into many games with one bulk insert; `games` holds (game id, bank questions) pairs."""
+    KnockoutQuestion.objects.bulk_create(
+        [question for game_id, bank_questions in games for question in _game_questions(game_id, bank_questions)],
+        batch_size=1000,
+    )
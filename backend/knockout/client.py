@@ -0,0 +1,88 @@
+import asyncio
+
+import orjson
+
+
+class WebSocketClient:
+    """
+    Talks to an ASGI WebSocket app in-process, the way a browser would over the network.
+
+    Used by the tests and the load test commands. Messages from the
+    server are decoded from JSON; None marks that the server closed the socket.
+    """
+
+    def __init__(self, app, path, query_string=b''):
+        self.app = app
+        self.scope = {
+            'type': 'websocket',
+            'asgi': {'version': '3.0'},
+            'path': path,
+            'query_string': query_string,
+            'headers': [],
+            'subprotocols': [],
+        }
+        self.close_code = None
+        self._to_app = asyncio.Queue()
+        self._from_app = asyncio.Queue()
+        self._accepted = None
+        self._task = None
+
+    async def connect(self):
+        """Open the socket. Returns True if the server accepted it."""
+        self._accepted = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self.app(self.scope, self._to_app.get, self._receive_from_app))
+        await self._to_app.put({'type': 'websocket.connect'})
+        return await self._accepted
+
+    async def _receive_from_app(self, message):
+        if message['type'] == 'websocket.accept':
+            self._accepted.set_result(True)
+        elif message['type'] == 'websocket.close':
+            self.close_code = message.get('code', 1000)
+            if not self._accepted.done():
+                self._accepted.set_result(False)
+            await self._from_app.put(None)
+        elif message['type'] == 'websocket.send':
+            await self._from_app.put(orjson.loads(message.get('text') or message.get('bytes')))
+
+    async def send_json(self, data):
+        await self._to_app.put({'type': 'websocket.receive', 'text': orjson.dumps(data).decode()})
+
+    async def receive_json(self, timeout=5):
+        return await asyncio.wait_for(self._from_app.get(), timeout)
+
+    async def receive_until(self, kind, timeout=5):
+        """Skip messages until one of type `kind` (or the close) arrives."""
+        while True:
+            message = await self.receive_json(timeout)
+            if message is None or message['type'] == kind:
+                return message
+
+    async def disconnect(self):
+        await self._to_app.put({'type': 'websocket.disconnect', 'code': 1000})
+        if self._task is not None:
+            await self._task
+
+
+async def play_randomly(app, token, game_id, rng, think, acks):
+    """
+    Play one game as a bot that answers at random after `think` = (min, max) seconds.
+
+    Each answer's round trip is appended to `acks`. Questions it would think
+    past are left unanswered.
+    """
+    loop = asyncio.get_running_loop()
+    client = WebSocketClient(app, f'/ws/knockout/{game_id}/', f'token={token}'.encode())
+    if not await client.connect():
+        return
+    sent_at = None
+    while (message := await client.receive_json(timeout=60)) is not None:
+        if message['type'] == 'question':
+            delay = rng.uniform(*think)
+            if delay < message['seconds']:
+                await asyncio.sleep(delay)
+                sent_at = loop.time()
+                await client.send_json({'type': 'answer', 'index': message['index'], 'choice': rng.choice('ABCD')})
+        elif message['type'] == 'answer_result':
+            acks.append(loop.time() - sent_at)
+    await client.disconnect()
@@ -0,0 +1,135 @@
+import asyncio
+import re
+from urllib.parse import parse_qs
+
+import orjson
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .engine import MatchError, engine
+from .matchmaking import matchmaker
+
+GAME_PATH = re.compile(r'^/ws/knockout/(?P<game_id>\d+)/$')
+QUEUE_PATH = '/ws/knockout/queue/'
+
+
+def _query_param(scope, name):
+    return parse_qs(scope.get('query_string', b'').decode()).get(name, [None])[0]
+
+
+def authenticate(scope):
+    """The user id from the ?token= access token, or None. Browsers can't set headers on WebSockets."""
+    token = _query_param(scope, 'token')
+    if not token:
+        return None
+    try:
+        return int(AccessToken(token)[api_settings.USER_ID_CLAIM])
+    except (TokenError, KeyError, ValueError):
+        return None
+
+
+async def _send_loop(outbox, send):
+    while True:
+        message = await outbox.get()
+        if message is None:
+            await send({'type': 'websocket.close', 'code': 1000})
+            return
+        await send({'type': 'websocket.send', 'text': orjson.dumps(message).decode()})
+
+
+def _handle(match, user_id, text, outbox):
+    try:
+        data = orjson.loads(text)
+        kind = data.get('type')
+    except (orjson.JSONDecodeError, AttributeError):
+        outbox.put_nowait({'type': 'error', 'detail': 'Messages must be JSON objects.'})
+        return
+
+    try:
+        if kind == 'answer':
+            match.answer(user_id, data.get('index'), data.get('choice'))
+        elif kind == 'state':
+            outbox.put_nowait(match.state_message(user_id))
+        else:
+            raise MatchError('Unknown message type.')
+    except MatchError as error:
+        outbox.put_nowait({'type': 'error', 'detail': str(error)})
+
+
+async def knockout_application(scope, receive, send):
+    """
+    ASGI app for the knockout WebSockets, authenticated with ?token=<JWT access token>.
+
+    /ws/knockout/queue/?subject=<subject> queues the player for matchmaking.
+    The server sends queued, then match_found with the game to join (or an
+    error) and closes the socket.
+
+    /ws/knockout/<game id>/ plays a game. Clients send
+    {"type": "answer", "index": n, "choice": "A"} and receive state, question,
+    answer_result, opponent_answered, question_result and match_over messages.
+    In games against a bot, the bot is player 0. The server closes the socket
+    once the match is over, or after match_expired when the other player
+    never connects. Games are held in the worker's memory; see MatchEngine
+    for running this on a single worker or with sticky routing.
+    """
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    user_id = authenticate(scope)
+    if scope['path'] == QUEUE_PATH:
+        await _queue_session(scope, receive, send, user_id)
+        return
+    path = GAME_PATH.match(scope['path'])
+    if path is None:
+        await send({'type': 'websocket.close', 'code': 4004})
+        return
+    if user_id is None:
+        await send({'type': 'websocket.close', 'code': 4001})
+        return
+    await _game_session(int(path['game_id']), receive, send, user_id)
+
+
+async def _queue_session(scope, receive, send, user_id):
+    subject = _query_param(scope, 'subject')
+    if user_id is None:
+        await send({'type': 'websocket.close', 'code': 4001})
+        return
+    if not subject:
+        await send({'type': 'websocket.close', 'code': 4000})
+        return
+
+    outbox = asyncio.Queue()
+    await send({'type': 'websocket.accept'})
+    sender = asyncio.create_task(_send_loop(outbox, send))
+    try:
+        await matchmaker.join(user_id, subject[:50], outbox)
+        # Nothing to read; wait for the player to leave or the server to close
+        while (await receive())['type'] != 'websocket.disconnect':
+            pass
+    finally:
+        matchmaker.leave(user_id, outbox)
+        sender.cancel()
+
+
+async def _game_session(game_id, receive, send, user_id):
+    outbox = asyncio.Queue()
+    try:
+        match = await engine.join(game_id, user_id, outbox)
+    except MatchError as error:
+        await send({'type': 'websocket.close', 'code': error.code})
+        return
+
+    await send({'type': 'websocket.accept'})
+    sender = asyncio.create_task(_send_loop(outbox, send))
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message['type'] == 'websocket.receive':
+                _handle(match, user_id, message.get('text') or message.get('bytes'), outbox)
+    finally:
+        match.disconnect(user_id, outbox)
+        sender.cancel()
@@ -0,0 +1,520 @@
+import asyncio
+import logging
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+
+from dof3a_base import activity
+from dof3a_base.background import run_in_background
+from dof3a_base.models import Student
+from dof3a_base.scores import buffer_points
+from .models import KnockoutGame, KnockoutQuestion, KnockoutAnswer
+from .ratings import game_score, record_results
+from .reviews import add_missed
+from .tournaments import games_completed
+
+logger = logging.getLogger(__name__)
+
+# How often in-memory match state is written back to the database
+CHECKPOINT_SECONDS = 5.0
+# Pause between a question's result and the next question
+REVEAL_SECONDS = 3.0
+# How long a match waits for all its players to connect before it is given up
+WAIT_SECONDS = 120.0
+# A correct answer scores BASE_POINTS plus up to SPEED_BONUS more the faster it came in
+BASE_POINTS = 100
+SPEED_BONUS = 100
+# Stands in for the bot in a match's player_ids; never a real user id
+BOT_PLAYER = 0
+# Student.score awarded when a game ends
+CORRECT_ANSWER_AWARD = 1
+WIN_AWARD = 5
+
+
+class MatchError(Exception):
+    """A player can't join or act on a match. `code` is the WebSocket close code used when joining fails."""
+
+    def __init__(self, message, code=4000):
+        super().__init__(message)
+        self.code = code
+
+
+@dataclass(slots=True)
+class Question:
+    id: int
+    text: str
+    options: list
+    correct: str
+
+
+@dataclass(slots=True)
+class Answer:
+    question_id: int
+    user_id: int
+    choice: str
+    correct: bool
+    time_taken_ms: int
+    points: int
+    answered_at: datetime
+
+
+class Match:
+    """
+    Server-authoritative state of one game.
+
+    All methods run on the event loop, so state changes need no locking. The
+    server starts each question's clock when it sends the question and scores
+    answers as they arrive; clients only ever see the results.
+    """
+
+    def __init__(self, game_id, player_ids, questions, question_seconds, reveal_seconds=REVEAL_SECONDS,
+                 status='pending', current=0, answers=(), bot_accuracy=None, subject=''):
+        self.game_id = game_id
+        self.subject = subject
+        self.player_ids = tuple(player_ids)
+        self.questions = questions
+        self.question_seconds = question_seconds
+        self.reveal_seconds = reveal_seconds
+        self.status = status
+        self.current = current
+        self.started_at = None
+        self.completed_at = None
+        self.winner_id = None
+        # Chance the bot answers correctly, for games against BOT_PLAYER
+        self.bot_accuracy = bot_accuracy
+        self._rng = random.Random()
+
+        self.scores = dict.fromkeys(self.player_ids, 0)
+        self.answers = {}
+        for index, answer in answers:
+            self.answers[index, answer.user_id] = answer
+            self.scores[answer.user_id] += answer.points
+        self.unsaved = []
+        self.dirty = False
+        self.on_finish = None
+
+        # waiting -> question -> reveal -> question ... -> over
+        self.phase = 'waiting'
+        self.waiting_since = time.monotonic()
+        self.outboxes = {player_id: set() for player_id in self.player_ids}
+        self._asked_at = None
+        self._timer = None
+        self._bot_timer = None
+
+    # Connections
+
+    def connect(self, user_id, outbox):
+        if user_id not in self.outboxes:
+            raise MatchError('You are not a player in this game.', 4003)
+        if self.phase == 'over':
+            raise MatchError('This game is over.', 4010)
+
+        self.outboxes[user_id].add(outbox)
+        outbox.put_nowait(self.state_message(user_id))
+        humans = [player_id for player_id in self.player_ids if player_id != BOT_PLAYER]
+        if self.phase == 'waiting' and all(self.outboxes[player_id] for player_id in humans):
+            if self.status == 'pending':
+                self.status = 'in_progress'
+                self.started_at = timezone.now()
+                self.dirty = True
+            # Resumed games restart the checkpointed question with a fresh clock
+            self._ask()
+
+    def disconnect(self, user_id, outbox):
+        # The clock keeps running; unanswered questions simply score nothing
+        self.outboxes.get(user_id, set()).discard(outbox)
+
+    def send(self, user_id, message):
+        for outbox in self.outboxes[user_id]:
+            outbox.put_nowait(message)
+
+    def broadcast(self, message):
+        for user_id in self.player_ids:
+            self.send(user_id, message)
+
+    # Game flow
+
+    def _elapsed(self):
+        return asyncio.get_running_loop().time() - self._asked_at
+
+    def _question_message(self):
+        question = self.questions[self.current]
+        return {
+            'type': 'question',
+            'index': self.current,
+            'total': len(self.questions),
+            'text': question.text,
+            'options': question.options,
+            'seconds': max(self.question_seconds - self._elapsed(), 0.0),
+        }
+
+    def _ask(self):
+        loop = asyncio.get_running_loop()
+        self.phase = 'question'
+        self._asked_at = loop.time()
+        self._timer = loop.call_later(self.question_seconds, self._close_question, self.current)
+        self.broadcast(self._question_message())
+        if self.bot_accuracy is not None:
+            delay = self._rng.uniform(0.25, 0.9) * self.question_seconds
+            self._bot_timer = loop.call_later(delay, self._bot_answer, self.current)
+
+    def _bot_answer(self, index):
+        if self.phase != 'question' or index != self.current:
+            return
+        correct = self.questions[index].correct
+        if self._rng.random() < self.bot_accuracy:
+            choice = correct
+        else:
+            choice = self._rng.choice([option for option in 'ABCD' if option != correct])
+        self.answer(BOT_PLAYER, index, choice)
+
+    def answer(self, user_id, index, choice):
+        if self.phase != 'question' or index != self.current:
+            raise MatchError('That question is closed.')
+        if (index, user_id) in self.answers:
+            raise MatchError('You already answered this question.')
+        if choice not in ('A', 'B', 'C', 'D'):
+            raise MatchError('Choice must be A, B, C or D.')
+        elapsed = self._elapsed()
+        if elapsed > self.question_seconds:
+            raise MatchError('Time is up.')
+
+        question = self.questions[index]
+        correct = choice == question.correct
+        points = BASE_POINTS + round(SPEED_BONUS * (1 - elapsed / self.question_seconds)) if correct else 0
+        answer = Answer(question.id, user_id, choice, correct, int(elapsed * 1000), points, timezone.now())
+        self.answers[index, user_id] = answer
+        if user_id != BOT_PLAYER:
+            # Bot answers only count towards its score
+            self.unsaved.append(answer)
+        self.scores[user_id] += points
+        self.dirty = True
+
+        self.send(user_id, {
+            'type': 'answer_result',
+            'index': index,
+            'correct': correct,
+            'points': points,
+            'score': self.scores[user_id],
+            'time_taken_ms': answer.time_taken_ms,
+        })
+        for other in self.player_ids:
+            if other != user_id:
+                self.send(other, {'type': 'opponent_answered', 'index': index})
+
+        if all((index, player_id) in self.answers for player_id in self.player_ids):
+            self._timer.cancel()
+            self._close_question(index)
+
+    def _close_question(self, index):
+        if self.phase != 'question' or index != self.current:
+            return
+        self.phase = 'reveal'
+        self.broadcast({
+            'type': 'question_result',
+            'index': index,
+            'correct_answer': self.questions[index].correct,
+            'scores': self._scores_message(),
+        })
+        self.current += 1
+        self.dirty = True
+        if self.current >= len(self.questions):
+            self._finish()
+        else:
+            self._timer = asyncio.get_running_loop().call_later(self.reveal_seconds, self._ask)
+
+    def pause(self):
+        for timer in (self._timer, self._bot_timer):
+            if timer is not None:
+                timer.cancel()
+        if self.phase != 'over':
+            self.phase = 'waiting'
+            self.waiting_since = time.monotonic()
+            for user_id in self.player_ids:
+                self.send(user_id, None)
+
+    def expire(self):
+        """Give up on a match whose players never all connected. A game that never started is cancelled."""
+        self.phase = 'over'
+        if self.status == 'pending':
+            self.status = 'cancelled'
+            self.dirty = True
+        self.broadcast({'type': 'match_expired'})
+        for user_id in self.player_ids:
+            self.send(user_id, None)
+
+    def _finish(self):
+        self.phase = 'over'
+        self.status = 'completed'
+        self.completed_at = timezone.now()
+        (first, first_score), (second, second_score) = self.scores.items()
+        if first_score != second_score:
+            self.winner_id = first if first_score > second_score else second
+        self.dirty = True
+
+        self.broadcast({'type': 'match_over', 'winner': self.winner_id, 'scores': self._scores_message()})
+        for user_id in self.player_ids:
+            # Tells each connection to close once everything before it is sent
+            self.send(user_id, None)
+        if self.on_finish:
+            self.on_finish(self)
+
+    def _scores_message(self):
+        return {str(user_id): score for user_id, score in self.scores.items()}
+
+    def state_message(self, user_id):
+        state = {
+            'type': 'state',
+            'game': self.game_id,
+            'you': user_id,
+            'players': list(self.player_ids),
+            'phase': self.phase,
+            'scores': self._scores_message(),
+            'question': None,
+        }
+        if self.phase == 'question':
+            state['question'] = self._question_message()
+        return state
+
+    # Checkpoints
+
+    def correct_answers(self, user_id):
+        return sum(1 for (_, player_id), answer in self.answers.items() if player_id == user_id and answer.correct)
+
+    def answered(self, user_id):
+        return sum(1 for _, player_id in self.answers if player_id == user_id)
+
+    def snapshot(self):
+        """Everything changed since the last snapshot, for save_checkpoints()."""
+        player1, player2 = self.player_ids
+        snapshot = {
+            'game_id': self.game_id,
+            'status': self.status,
+            'player1_score': self.scores[player1],
+            'player2_score': self.scores[player2],
+            'current_question': min(self.current, len(self.questions) - 1),
+            'started_at': self.started_at,
+            'completed_at': self.completed_at,
+            'winner_id': None if self.winner_id == BOT_PLAYER else self.winner_id,
+            'awards': {user_id: self.correct_answers(user_id) * CORRECT_ANSWER_AWARD
+                       + (WIN_AWARD if user_id == self.winner_id else 0)
+                       for user_id in self.player_ids if user_id != BOT_PLAYER},
+            'answers': self.unsaved,
+            # (answered, right) per human player, for the activity stream
+            'tally': {user_id: (self.answered(user_id), self.correct_answers(user_id))
+                      for user_id in self.player_ids if user_id != BOT_PLAYER},
+            # For ratings.record_results() once the game is over
+            'result': (self.subject, player1, None if player2 == BOT_PLAYER else player2, self.bot_accuracy,
+                       game_score(self.scores[player1], self.scores[player2])),
+        }
+        self.unsaved = []
+        self.dirty = False
+        return snapshot
+
+    def restore(self, snapshot):
+        """Put back a snapshot that failed to save so the next checkpoint retries it."""
+        self.unsaved = snapshot['answers'] + self.unsaved
+        self.dirty = True
+
+
+def load_match(game_id, reveal_seconds=REVEAL_SECONDS):
+    """Build a Match from the database, resuming from its last checkpoint."""
+    game = (
+        KnockoutGame.objects.filter(pk=game_id)
+        .values('player1_id', 'player2_id', 'bot_accuracy', 'subject', 'status', 'current_question', 'question_time_seconds',
+                'started_at', 'player2_score')
+        .first()
+    )
+    if game is None:
+        raise MatchError('Game not found.', 4004)
+    if game['status'] in ('completed', 'cancelled'):
+        raise MatchError('This game is over.', 4010)
+
+    questions = [
+        Question(question.pk, question.question_text, question.options, question.correct_answer)
+        for question in KnockoutQuestion.objects.filter(game_id=game_id)
+    ]
+    if not questions:
+        raise MatchError('This game has no questions.', 4004)
+    index_of = {question.id: index for index, question in enumerate(questions)}
+    answers = [
+        (index_of[answer.question_id], Answer(answer.question_id, answer.user_id, answer.selected_answer,
+                                              answer.is_correct, answer.time_taken_ms, answer.points,
+                                              answer.answered_at))
+        for answer in KnockoutAnswer.objects.filter(question__game_id=game_id)
+    ]
+    vs_bot = game['player2_id'] is None
+    match = Match(
+        game_id, (game['player1_id'], BOT_PLAYER if vs_bot else game['player2_id']), questions,
+        game['question_time_seconds'], reveal_seconds, status=game['status'], current=game['current_question'],
+        answers=answers, bot_accuracy=game['bot_accuracy'] if vs_bot else None, subject=game['subject'],
+    )
+    match.started_at = game['started_at']
+    if vs_bot:
+        # Bot answers aren't stored, only its running score
+        match.scores[BOT_PLAYER] = game['player2_score']
+    return match
+
+
+def save_checkpoints(snapshots):
+    """Write match snapshots in one transaction, rating and awarding points for games that just completed."""
+    now = timezone.now()
+    with transaction.atomic():
+        KnockoutAnswer.objects.bulk_create(
+            [
+                KnockoutAnswer(question_id=answer.question_id, user_id=answer.user_id,
+                               selected_answer=answer.choice, is_correct=answer.correct,
+                               time_taken_ms=answer.time_taken_ms, points=answer.points,
+                               answered_at=answer.answered_at)
+                for snapshot in snapshots for answer in snapshot['answers']
+            ],
+            ignore_conflicts=True,
+        )
+
+        # Only the checkpoint that moves a game to completed hands out its points
+        finishing = [snapshot['game_id'] for snapshot in snapshots if snapshot['status'] == 'completed']
+        if finishing:
+            finished = set(
+                KnockoutGame.objects.select_for_update()
+                .filter(pk__in=finishing, status='completed')
+                .values_list('pk', flat=True)
+            )
+            snapshots = [snapshot for snapshot in snapshots if snapshot['game_id'] not in finished]
+
+        # One UPDATE per game: bulk_update()'s CASE expressions cost several times the CPU
+        # to build, and this runs beside the event loop, holding the GIL while it does
+        for snapshot in snapshots:
+            KnockoutGame.objects.filter(pk=snapshot['game_id']).update(
+                status=snapshot['status'],
+                player1_score=snapshot['player1_score'],
+                player2_score=snapshot['player2_score'],
+                current_question=snapshot['current_question'],
+                started_at=snapshot['started_at'],
+                completed_at=snapshot['completed_at'],
+                winner_id=snapshot['winner_id'],
+                points_awarded=snapshot['awards'].get(snapshot['winner_id'], 0),
+                checkpointed_at=now,
+            )
+
+        completed = sorted((snapshot for snapshot in snapshots if snapshot['status'] == 'completed'),
+                           key=lambda snapshot: snapshot['completed_at'])
+        if completed:
+            record_results([snapshot['result'] for snapshot in completed])
+            game_ids = [snapshot['game_id'] for snapshot in completed]
+            run_in_background(games_completed, game_ids)
+            run_in_background(add_missed, game_ids)
+            for snapshot in completed:
+                for user_id, (answered, right) in snapshot['tally'].items():
+                    activity.record(user_id, 'knockout_complete', game=snapshot['game_id'],
+                                    won=user_id == snapshot['winner_id'], answers=answered, correct=right)
+
+        awards = defaultdict(int)
+        for snapshot in snapshots:
+            if snapshot['status'] == 'completed':
+                for user_id, points in snapshot['awards'].items():
+                    awards[user_id] += points
+        students = dict(Student.objects.filter(user_id__in=awards).values_list('user_id', 'pk')) if awards else {}
+        for user_id, points in awards.items():
+            if points and user_id in students:
+                # Games finish in bursts, so awards go through the score buffer
+                buffer_points(students[user_id], points)
+
+
+class MatchEngine:
+    """
+    The matches this worker process is running, with their periodic checkpoints.
+
+    Match state lives only in this process's memory, so both players of a
+    game must reach the same worker: run the knockout WebSockets on a single
+    ASGI worker, or route /ws/knockout/<game id>/ by game id to sticky
+    workers. A second worker would load its own copy of the match and the
+    two would score and checkpoint the game independently. The matchmaking
+    queue has the same constraint.
+
+    Matches still waiting for their players after wait_seconds are expired.
+    """
+
+    def __init__(self, checkpoint_seconds=CHECKPOINT_SECONDS, reveal_seconds=REVEAL_SECONDS, wait_seconds=WAIT_SECONDS):
+        self.checkpoint_seconds = checkpoint_seconds
+        self.reveal_seconds = reveal_seconds
+        self.wait_seconds = wait_seconds
+        self.matches = {}
+        self._loading = {}
+        self._checkpointer = None
+        self._tasks = set()
+
+    async def join(self, game_id, user_id, outbox):
+        match = self.matches.get(game_id)
+        if match is None:
+            loading = self._loading.get(game_id)
+            if loading is None:
+                # Players connecting at the same moment share one load
+                loading = self._loading[game_id] = asyncio.ensure_future(
+                    sync_to_async(load_match)(game_id, self.reveal_seconds))
+                loading.add_done_callback(lambda _: self._loading.pop(game_id, None))
+            match = self.matches.setdefault(game_id, await loading)
+            match.on_finish = self._finished
+
+        if self._checkpointer is None or self._checkpointer.done():
+            self._checkpointer = asyncio.create_task(self._checkpoint_loop())
+        match.connect(user_id, outbox)
+        return match
+
+    def _finished(self, match):
+        # Save finished games straight away rather than on the next tick
+        task = asyncio.create_task(self.checkpoint())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _expire_waiting(self):
+        now = time.monotonic()
+        for match in list(self.matches.values()):
+            if match.phase == 'waiting' and now - match.waiting_since > self.wait_seconds:
+                match.expire()
+                if not match.dirty:
+                    # Nothing to save; a game already in progress resumes from its checkpoint on reconnect
+                    self.matches.pop(match.game_id, None)
+
+    async def _checkpoint_loop(self):
+        while self.matches:
+            await asyncio.sleep(self.checkpoint_seconds)
+            self._expire_waiting()
+            try:
+                await self.checkpoint()
+            except Exception:
+                logger.exception('Knockout checkpoint failed')
+
+    async def close(self):
+        """Pause every match and save what's left, for server shutdown. Games resume from here on reconnect."""
+        for match in self.matches.values():
+            match.pause()
+        if self._checkpointer is not None:
+            self._checkpointer.cancel()
+            self._checkpointer = None
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.checkpoint()
+
+    async def checkpoint(self):
+        """Save every changed match, then forget the ones that are finished and saved."""
+        dirty = [match for match in self.matches.values() if match.dirty]
+        if not dirty:
+            return
+        snapshots = [match.snapshot() for match in dirty]
+        try:
+            await sync_to_async(save_checkpoints)(snapshots)
+        except Exception:
+            for match, snapshot in zip(dirty, snapshots):
+                match.restore(snapshot)
+            raise
+        for match in dirty:
+            if match.phase == 'over' and not match.dirty:
+                self.matches.pop(match.game_id, None)
+
+
+engine = MatchEngine()
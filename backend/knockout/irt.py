@@ -0,0 +1,196 @@
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+
+from .models import BankQuestion, KnockoutAnswer, SubjectRating
+
+# Four options, so a player who knows nothing still gets a quarter right (a 3PL model with fixed guessing)
+GUESSING = 0.25
+# Where an uncalibrated question is assumed to sit, from the difficulty it was generated for
+PRIOR_DIFFICULTY = {'easy': -1.0, 'medium': 0.0, 'hard': 1.0}
+# Priors keep the fit finite for questions answered all right or all wrong
+DIFFICULTY_SD = 1.5
+LOG_DISCRIMINATION_SD = 0.5
+# Abilities are integrated over a standard normal population at these points
+QUADRATURE_POINTS = 21
+# Largest change to one parameter in a single Newton step
+MAX_STEP = 1.0
+MAX_HALVINGS = 10
+TOLERANCE = 1e-3
+MAX_ITERATIONS = 100
+# Rows fetched per round trip while loading answers
+CHUNK_SIZE = 20000
+
+
+def probability(ability, difficulty, discrimination):
+    """Chance of a correct answer."""
+    return GUESSING + (1 - GUESSING) / (1 + np.exp(-discrimination * (ability - difficulty)))
+
+
+def information(ability, difficulty, discrimination):
+    """Fisher information a question gives about a player of this ability."""
+    p = probability(ability, difficulty, discrimination)
+    return discrimination ** 2 * ((p - GUESSING) / (1 - GUESSING)) ** 2 * (1 - p) / p
+
+
+def _item_objective(difficulty, log_discrimination, prior_difficulty, nodes, answered, right):
+    """Each question's expected log posterior given the expected answers at each node."""
+    p = probability(nodes[None, :], difficulty[:, None], np.exp(log_discrimination)[:, None])
+    return ((right * np.log(p) + (answered - right) * np.log1p(-p)).sum(axis=1)
+            - (difficulty - prior_difficulty) ** 2 / (2 * DIFFICULTY_SD ** 2)
+            - log_discrimination ** 2 / (2 * LOG_DISCRIMINATION_SD ** 2))
+
+
+def _item_step(difficulty, log_discrimination, prior_difficulty, nodes, answered, right):
+    """
+    One Newton step for every question's (difficulty, log discrimination) at once.
+
+    answered and right are the expected answers and right answers per question
+    (rows) at each quadrature node (columns).
+    """
+    a = np.exp(log_discrimination)[:, None]
+    gap = nodes[None, :] - difficulty[:, None]
+    s = 1 / (1 + np.exp(-np.clip(a * gap, -30, 30)))
+    p = GUESSING + (1 - GUESSING) * s
+    slope = (1 - GUESSING) * s * (1 - s)
+    score = (right - answered * p) * slope / (p * (1 - p))
+    info = answered * slope ** 2 / (p * (1 - p))
+
+    # Derivatives of z = a * (node - difficulty) are -a and a * gap
+    g_b = -(score * a).sum(axis=1) - (difficulty - prior_difficulty) / DIFFICULTY_SD ** 2
+    g_a = (score * a * gap).sum(axis=1) - log_discrimination / LOG_DISCRIMINATION_SD ** 2
+    h_bb = (info * a ** 2).sum(axis=1) + 1 / DIFFICULTY_SD ** 2
+    h_aa = (info * (a * gap) ** 2).sum(axis=1) + 1 / LOG_DISCRIMINATION_SD ** 2
+    h_ba = -(info * a * a * gap).sum(axis=1)
+    determinant = h_bb * h_aa - h_ba ** 2
+    step_b = np.clip((h_aa * g_b - h_ba * g_a) / determinant, -MAX_STEP, MAX_STEP)
+    step_a = np.clip((h_bb * g_a - h_ba * g_b) / determinant, -MAX_STEP, MAX_STEP)
+
+    # With guessing the objective isn't concave, and a full step can overshoot back and
+    # forth forever; halve the steps of the questions it makes worse
+    current = _item_objective(difficulty, log_discrimination, prior_difficulty, nodes, answered, right)
+    for _ in range(MAX_HALVINGS):
+        worse = _item_objective(difficulty + step_b, log_discrimination + step_a, prior_difficulty, nodes,
+                                answered, right) < current
+        if not worse.any():
+            break
+        step_b[worse] /= 2
+        step_a[worse] /= 2
+    return step_b, step_a
+
+
+def fit(item, person, correct, prior_difficulty, persons, max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE):
+    """
+    Fit question difficulty and discrimination by marginal maximum likelihood.
+
+    Each answer is a row of the item, person and correct arrays. Each EM
+    iteration finds every player's posterior over a grid of abilities, then
+    takes a Newton step for every question against the expected answers at
+    each grid point. Both are np.bincount passes over the answers, one per
+    grid point, so the work is linear in the answers. Returns (difficulty,
+    discrimination, ability, iterations), abilities being posterior means.
+    """
+    items = len(prior_difficulty)
+    nodes = np.linspace(-4, 4, QUADRATURE_POINTS)
+    log_population = -nodes ** 2 / 2
+    difficulty = prior_difficulty.astype(np.float64)
+    log_discrimination = np.zeros(items)
+
+    right_item, right_person = item[correct], person[correct]
+    for iteration in range(1, max_iterations + 1):
+        # E step: log-likelihood of each player's answers at each node
+        a = np.exp(log_discrimination)[item]
+        ab = a * difficulty[item]
+        log_likelihood = np.empty((QUADRATURE_POINTS, persons))
+        for q, node in enumerate(nodes):
+            p = GUESSING + (1 - GUESSING) / (1 + np.exp(ab - a * node))
+            log_likelihood[q] = np.bincount(person, np.log(np.where(correct, p, 1 - p)), persons)
+        # Nodes on the first axis keep each node's row contiguous for the gathers below
+        posterior = log_likelihood + log_population[:, None]
+        posterior = np.exp(posterior - posterior.max(axis=0))
+        posterior /= posterior.sum(axis=0)
+
+        # M step: expected answers and right answers per question at each node
+        answered = np.empty((items, QUADRATURE_POINTS))
+        right = np.empty((items, QUADRATURE_POINTS))
+        for q in range(QUADRATURE_POINTS):
+            answered[:, q] = np.bincount(item, posterior[q][person], items)
+            right[:, q] = np.bincount(right_item, posterior[q][right_person], items)
+        step_b, step_a = _item_step(difficulty, log_discrimination, prior_difficulty, nodes, answered, right)
+        difficulty += step_b
+        log_discrimination += step_a
+
+        if max(np.abs(step_b).max(initial=0), np.abs(step_a).max(initial=0)) < tolerance:
+            break
+    return difficulty, np.exp(log_discrimination), nodes @ posterior, iteration
+
+
+def log_likelihood(item, person, correct, difficulty, discrimination, ability):
+    """Mean log-likelihood per answer."""
+    p = probability(ability[person], difficulty[item], discrimination[item])
+    return float(np.mean(np.where(correct, np.log(p), np.log(1 - p))))
+
+
+def load_answers():
+    """
+    Every recorded answer to a bank question as (question id, user id, correct) arrays.
+
+    Rows are streamed straight into a NumPy array so millions of answers
+    don't sit in memory as tuples.
+    """
+    rows = (
+        KnockoutAnswer.objects.filter(question__bank_question__isnull=False)
+        .values_list('question__bank_question_id', 'user_id', 'is_correct')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    answers = np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(-1, 3)
+    return answers[:, 0], answers[:, 1], answers[:, 2].astype(bool)
+
+
+def calibrate(max_iterations=MAX_ITERATIONS, save=True):
+    """
+    Fit IRT parameters for every answered bank question and each player's ability per subject.
+
+    Questions without answers keep empty parameters. Returns a dict of the
+    counts, iterations and fit for reporting.
+    """
+    question_ids, user_ids, correct = load_answers()
+    bank = list(BankQuestion.objects.order_by('pk').values_list('pk', 'subject', 'difficulty'))
+    bank_ids = np.array([pk for pk, _, _ in bank], dtype=np.int64)
+    subjects, bank_subject = np.unique(np.array([subject for _, subject, _ in bank], dtype=str), return_inverse=True)
+
+    answered, item = np.unique(question_ids, return_inverse=True)
+    position = np.searchsorted(bank_ids, answered)
+    prior = np.array([PRIOR_DIFFICULTY.get(bank[i][2], 0.0) for i in position.tolist()])
+    # A player's ability is measured separately in each subject
+    player_keys, person = np.unique(user_ids * max(len(subjects), 1) + bank_subject[position][item], return_inverse=True)
+
+    difficulty, discrimination, ability, iterations = fit(item, person, correct, prior, len(player_keys), max_iterations)
+    stats = {
+        'answers': len(correct),
+        'questions': len(answered),
+        'players': len(player_keys),
+        'iterations': iterations,
+        'log_likelihood': log_likelihood(item, person, correct, difficulty, discrimination, ability) if len(correct) else None,
+    }
+    if save and len(correct):
+        responses = np.bincount(item, minlength=len(answered))
+        players = [(int(key) // len(subjects), str(subjects[key % len(subjects)])) for key in player_keys.tolist()]
+        with transaction.atomic():
+            BankQuestion.objects.bulk_update(
+                [BankQuestion(pk=pk, irt_difficulty=float(b), irt_discrimination=float(a), irt_responses=int(n))
+                 for pk, b, a, n in zip(answered.tolist(), difficulty, discrimination, responses)],
+                ['irt_difficulty', 'irt_discrimination', 'irt_responses'], batch_size=1000,
+            )
+            SubjectRating.objects.bulk_create(
+                [SubjectRating(user_id=user_id, subject=subject) for user_id, subject in players],
+                ignore_conflicts=True, batch_size=1000,
+            )
+            rows = {(user_id, subject): pk for pk, user_id, subject in
+                    SubjectRating.objects.values_list('pk', 'user_id', 'subject').iterator(chunk_size=CHUNK_SIZE)}
+            SubjectRating.objects.bulk_update(
+                [SubjectRating(pk=rows[key], ability=float(theta)) for key, theta in zip(players, ability)],
+                ['ability'], batch_size=1000,
+            )
+    return stats
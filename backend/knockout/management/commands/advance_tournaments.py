@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from knockout.tournaments import sweep
+
+
+class Command(BaseCommand):
+    help = (
+        'Decide finished and overdue tournament games and advance every running tournament. '
+        'Run it every minute or so from cron; it also catches up after a worker restart.'
+    )
+
+    def handle(self, *args, **options):
+        decided = sweep()
+        self.stdout.write(self.style.SUCCESS(f'Decided {decided} tournament matches'))
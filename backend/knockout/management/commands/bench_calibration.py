@@ -0,0 +1,51 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from knockout.irt import fit, probability
+
+
+def correlation(a, b):
+    return float(np.corrcoef(a, b)[0, 1])
+
+
+class Command(BaseCommand):
+    help = (
+        'Fit IRT parameters to synthetic answers drawn from known questions and players, and report '
+        'the fitting time and how well the true difficulty, discrimination and ability are recovered'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--answers', type=int, nargs='+', default=[100000, 1000000, 5000000])
+        parser.add_argument('--questions', type=int, default=5000)
+        parser.add_argument('--players', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        header = f"{'answers':>9}{'fit':>9}{'iters':>7}{'per iter':>10}{'r(b)':>7}{'rmse(b)':>9}{'r(a)':>7}{'r(theta)':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for answers in options['answers']:
+            self._bench(answers, options['questions'], options['players'])
+
+    def _bench(self, answers, questions, players):
+        rng = np.random.default_rng(answers)
+        difficulty = rng.normal(0, 1, questions)
+        discrimination = rng.lognormal(0, 0.3, questions)
+        ability = rng.normal(0, 1, players)
+        # The label the question was generated with is right about two times in three
+        prior = np.clip(np.round(difficulty + rng.normal(0, 0.5, questions)), -1, 1)
+
+        item = rng.integers(0, questions, answers)
+        person = rng.integers(0, players, answers)
+        correct = rng.random(answers) < probability(ability[person], difficulty[item], discrimination[item])
+
+        started = time.perf_counter()
+        fitted_b, fitted_a, fitted_theta, iterations = fit(item, person, correct, prior, players)
+        seconds = time.perf_counter() - started
+
+        self.stdout.write(
+            f'{answers:>9}{seconds:>8.1f}s{iterations:>7}{1000 * seconds / iterations:>8.0f}ms'
+            f'{correlation(fitted_b, difficulty):>7.3f}{np.sqrt(np.mean((fitted_b - difficulty) ** 2)):>9.3f}'
+            f'{correlation(fitted_a, discrimination):>7.3f}{correlation(fitted_theta, ability):>10.3f}'
+        )
@@ -0,0 +1,80 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from knockout.ratings import (
+    DEFAULT_DEVIATION, DEFAULT_RATING, DEFAULT_VOLATILITY, _rounds, apply_games, glicko2_update,
+)
+
+
+def new_state(players):
+    return {
+        'rating': np.full(players, DEFAULT_RATING),
+        'deviation': np.full(players, DEFAULT_DEVIATION),
+        'volatility': np.full(players, DEFAULT_VOLATILITY),
+        'games': np.zeros(players, dtype=np.int64),
+    }
+
+
+def replay_one_by_one(state, first, second, score, bot_ratings):
+    """The incremental path: one update per game, as if each finished on its own."""
+    for a, b, s, bot in zip(first.tolist(), second.tolist(), score.tolist(), bot_ratings.tolist()):
+        apply_games(state, np.array([a]), np.array([b]), np.array([s]), np.array([bot]))
+    return state
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay synthetic knockout histories through the Glicko-2 ratings, game by game and vectorised '
+        'by round, and report the time taken and the largest difference between the two'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--players', type=int, default=20000)
+        parser.add_argument('--bot-share', type=float, default=0.2)
+        # Game-by-game replay is only timed up to this many games
+        parser.add_argument('--scalar-limit', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        header = f"{'games':>9}{'rounds':>8}{'per game':>11}{'vectorised':>12}{'games/s':>12}{'speedup':>9}{'max diff':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        # Warm up NumPy so the first row isn't charged for it
+        glicko2_update(np.array([DEFAULT_RATING]), np.array([DEFAULT_DEVIATION]), np.array([DEFAULT_VOLATILITY]),
+                       np.array([[DEFAULT_RATING]]), np.array([[DEFAULT_DEVIATION]]), np.array([[1.0]]))
+        for games in options['games']:
+            self._bench(games, options)
+
+    def _bench(self, games, options):
+        rng = np.random.default_rng(games)
+        players = options['players']
+        strength = rng.normal(DEFAULT_RATING, 200, players)
+        first = rng.integers(0, players, games)
+        second = (first + rng.integers(1, players, games)) % players
+        second[rng.random(games) < options['bot_share']] = -1
+        bot_ratings = rng.normal(DEFAULT_RATING, 150, games)
+        opponent = np.where(second >= 0, strength[np.maximum(second, 0)], bot_ratings)
+        win = 1 / (1 + 10 ** ((opponent - strength[first]) / 400))
+        score = (rng.random(games) < win).astype(np.float64)
+
+        started = time.perf_counter()
+        vectorised = apply_games(new_state(players), first, second, score, bot_ratings)
+        vectorised_seconds = time.perf_counter() - started
+        rounds = int(_rounds(first, second, players).max()) + 1
+
+        per_game, speedup, diff = '-', '-', '-'
+        if games <= options['scalar_limit']:
+            started = time.perf_counter()
+            scalar = replay_one_by_one(new_state(players), first, second, score, bot_ratings)
+            scalar_seconds = time.perf_counter() - started
+            per_game = f'{scalar_seconds:.2f}s'
+            speedup = f'{scalar_seconds / vectorised_seconds:.0f}x'
+            diff = f"{np.max(np.abs(scalar['rating'] - vectorised['rating'])):.1e}"
+
+        self.stdout.write(
+            f'{games:>9}{rounds:>8}{per_game:>11}{vectorised_seconds:>11.2f}s'
+            f'{games / vectorised_seconds:>12,.0f}{speedup:>9}{diff:>10}'
+        )
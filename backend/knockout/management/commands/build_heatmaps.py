@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from knockout.analytics import refresh_heatmaps, snapshot_grades
+
+
+class Command(BaseCommand):
+    help = (
+        'Snapshot every grade\'s topic totals for today and rebuild the grade heatmaps in the shared cache. '
+        'Run it nightly from cron, after update_progress.'
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        snapshots = snapshot_grades()
+        grades = refresh_heatmaps()
+        self.stdout.write(self.style.SUCCESS(
+            f'Snapshotted {snapshots} grade topics and built {grades} heatmaps in {time.perf_counter() - started:.2f}s'
+        ))
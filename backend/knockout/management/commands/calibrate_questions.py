@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from knockout.irt import MAX_ITERATIONS, calibrate
+
+
+class Command(BaseCommand):
+    help = 'Fit IRT difficulty and discrimination for bank questions, and player abilities, from recorded answers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-iterations', type=int, default=MAX_ITERATIONS)
+        parser.add_argument('--dry-run', action='store_true', help='Fit without saving the parameters')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        stats = calibrate(options['max_iterations'], save=not options['dry_run'])
+        elapsed = time.perf_counter() - started
+        fit = 'n/a' if stats['log_likelihood'] is None else f"{stats['log_likelihood']:.4f}"
+        self.stdout.write(self.style.SUCCESS(
+            f"Calibrated {stats['questions']} questions and {stats['players']} player abilities from "
+            f"{stats['answers']} answers in {stats['iterations']} iterations and {elapsed:.2f}s "
+            f"(mean log-likelihood {fit})"
+        ))
@@ -0,0 +1,120 @@
+import asyncio
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from dof3a_base.models import Student
+from knockout.bank import copy_into_game
+from knockout.client import play_randomly
+from knockout.engine import engine
+from knockout.models import BankQuestion, KnockoutGame
+
+User = get_user_model()
+
+SUBJECT = 'Loadtest'
+# Event loop lag is sampled this often
+LAG_INTERVAL = 0.05
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Play synthetic knockout matches between bots against the ASGI app in this process and report '
+        'answer round-trip latency and event loop lag. Synthetic users and games are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--matches', type=int, nargs='+', default=[100, 500, 1000, 2000])
+        parser.add_argument('--questions', type=int, default=5)
+        parser.add_argument('--question-seconds', type=int, default=5)
+        parser.add_argument('--reveal-seconds', type=float, default=0.5)
+        # Bots answer after a random delay in this range; past the question time they miss it
+        parser.add_argument('--think', type=float, nargs=2, default=[0.3, 4.0])
+
+    def handle(self, *args, **options):
+        # Imported here so the command runs the same router production serves
+        from dof3a.asgi import application
+
+        engine.reveal_seconds = options['reveal_seconds']
+        header = (f"{'matches':>8}{'sockets':>9}{'wall':>9}{'cpu':>7}{'ack p50':>11}{'ack p99':>11}"
+                  f"{'ack max':>11}{'lag p99':>11}{'lag max':>11}{'saved':>7}")
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        BankQuestion.objects.bulk_create([
+            BankQuestion(subject=SUBJECT, grade_level=Student.MIDDLE_ONE, question_text=f'Question {i}',
+                         option_a='a', option_b='b', option_c='c', option_d='d', correct_answer='ABCD'[i % 4])
+            for i in range(options['questions'])
+        ])
+        bank = list(BankQuestion.objects.filter(subject=SUBJECT))
+        try:
+            for matches in options['matches']:
+                prefix = f'loadtest-{matches}-'
+                try:
+                    players = self._setup(prefix, matches, bank, options)
+                    results = asyncio.run(self._play(application, players, options))
+                    saved = KnockoutGame.objects.filter(player1__username__startswith=prefix, status='completed').count()
+                    self._report(matches, results, saved)
+                finally:
+                    User.objects.filter(username__startswith=prefix).delete()
+        finally:
+            BankQuestion.objects.filter(subject=SUBJECT).delete()
+
+    def _setup(self, prefix, matches, bank, options):
+        """Create 2 * matches users and their games. Returns [(access token, game id), ...]."""
+        User.objects.bulk_create([
+            User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com') for i in range(2 * matches)
+        ])
+        # bulk_create doesn't send post_save, and MySQL doesn't return the new primary keys
+        users = list(User.objects.filter(username__startswith=prefix).order_by('pk'))
+        Student.objects.bulk_create([Student(user=user, score=0, grade=Student.MIDDLE_ONE) for user in users])
+
+        KnockoutGame.objects.bulk_create([
+            KnockoutGame(player1=users[2 * i], player2=users[2 * i + 1], subject=SUBJECT,
+                         grade_level=Student.MIDDLE_ONE, question_time_seconds=options['question_seconds'])
+            for i in range(matches)
+        ])
+        games = list(KnockoutGame.objects.filter(player1__username__startswith=prefix).select_related('player1', 'player2').order_by('pk'))
+        for game in games:
+            copy_into_game(game, bank)
+        return [(str(AccessToken.for_user(user)), game.pk) for game in games for user in (game.player1, game.player2)]
+
+    async def _play(self, application, players, options):
+        loop = asyncio.get_running_loop()
+        acks, lags = [], []
+        stop = asyncio.Event()
+
+        async def monitor():
+            while not stop.is_set():
+                started = loop.time()
+                await asyncio.sleep(LAG_INTERVAL)
+                lags.append(loop.time() - started - LAG_INTERVAL)
+
+        watcher = asyncio.create_task(monitor())
+        wall, cpu = time.perf_counter(), time.process_time()
+        await asyncio.gather(*(play_randomly(application, token, game_id, random.Random(i), options['think'], acks)
+                               for i, (token, game_id) in enumerate(players)))
+        await engine.close()
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        stop.set()
+        await watcher
+        return {'sockets': len(players), 'wall': wall, 'cpu': cpu, 'acks': acks, 'lags': lags}
+
+    def _report(self, matches, results, saved):
+        acks = [ack * 1000 for ack in results['acks']]
+        lags = [lag * 1000 for lag in results['lags']]
+        self.stdout.write(
+            f"{matches:>8}{results['sockets']:>9}{results['wall']:>8.1f}s{100 * results['cpu'] / results['wall']:>6.0f}%"
+            f'{statistics.median(acks) if acks else 0:>9.2f}ms{percentile(acks, 0.99):>9.2f}ms{max(acks, default=0):>9.2f}ms'
+            f'{percentile(lags, 0.99):>9.2f}ms{max(lags, default=0):>9.2f}ms{saved:>7}'
+        )
@@ -0,0 +1,145 @@
+import asyncio
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from dof3a_base.models import Student
+from knockout.client import play_randomly
+from knockout.engine import engine
+from knockout.models import BankQuestion, KnockoutGame, Tournament, TournamentEntry
+from knockout.tournaments import start
+
+from .loadtest_knockout import LAG_INTERVAL, percentile
+
+User = get_user_model()
+
+SUBJECT = 'Loadtest'
+PREFIX = 'tournament-loadtest-'
+# How often the command checks whether the next round has been created
+POLL_SECONDS = 0.05
+ADVANCE_TIMEOUT = 120
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a whole knockout tournament of synthetic players answering at random against the ASGI app in '
+        'this process, and report per round how long creating it took, answer latency, event loop lag and how '
+        'long the bracket took to advance after the last game. Synthetic users are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=1024)
+        parser.add_argument('--format', nargs='+', default=['single_elimination', 'swiss'],
+                            choices=['single_elimination', 'swiss'])
+        parser.add_argument('--questions', type=int, default=5)
+        parser.add_argument('--bank-size', type=int, default=200)
+        parser.add_argument('--question-seconds', type=int, default=5)
+        parser.add_argument('--reveal-seconds', type=float, default=0.5)
+        parser.add_argument('--think', type=float, nargs=2, default=[0.3, 4.0])
+
+    def handle(self, *args, **options):
+        from dof3a.asgi import application
+
+        engine.reveal_seconds = options['reveal_seconds']
+        BankQuestion.objects.bulk_create([
+            BankQuestion(subject=SUBJECT, grade_level=Student.MIDDLE_ONE, question_text=f'Question {i}',
+                         option_a='a', option_b='b', option_c='c', option_d='d', correct_answer='ABCD'[i % 4])
+            for i in range(options['bank_size'])
+        ])
+        try:
+            tokens = self._setup_players(options['players'])
+            for format in options['format']:
+                self._run(application, tokens, format, options)
+        finally:
+            User.objects.filter(username__startswith=PREFIX).delete()
+            BankQuestion.objects.filter(subject=SUBJECT).delete()
+
+    def _setup_players(self, players):
+        """Create the players; returns {user id: access token}."""
+        User.objects.bulk_create([
+            User(username=f'{PREFIX}{i}', email=f'{PREFIX}{i}@example.com') for i in range(players)
+        ])
+        users = list(User.objects.filter(username__startswith=PREFIX).order_by('pk'))
+        Student.objects.bulk_create([Student(user=user, score=0, grade=Student.MIDDLE_ONE) for user in users])
+        return {user.pk: str(AccessToken.for_user(user)) for user in users}
+
+    def _run(self, application, tokens, format, options):
+        organiser = User.objects.get(pk=min(tokens))
+        tournament = Tournament.objects.create(
+            name=f'Load test {format}', created_by=organiser, subject=SUBJECT, grade_level=Student.MIDDLE_ONE,
+            format=format, questions_per_match=options['questions'], question_time_seconds=options['question_seconds'],
+        )
+        TournamentEntry.objects.bulk_create([TournamentEntry(tournament=tournament, user_id=user_id) for user_id in tokens])
+
+        self.stdout.write(f'\n{format}, {len(tokens)} players')
+        header = (f"{'round':>6}{'games':>7}{'create':>10}{'play':>9}{'ack p50':>11}{'ack p99':>11}"
+                  f"{'lag p99':>11}{'lag max':>11}{'advance':>11}")
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        started = time.perf_counter()
+        start(tournament.pk)
+        created = time.perf_counter() - started
+        total = time.perf_counter()
+        rounds = asyncio.run(self._play(application, tournament.pk, tokens, created, options))
+        total = time.perf_counter() - total
+
+        for row in rounds:
+            create = '-' if row['create'] is None else f"{1000 * row['create']:.0f}ms"
+            self.stdout.write(
+                f"{row['round']:>6}{row['games']:>7}{create:>10}{row['play']:>8.1f}s"
+                f"{percentile(row['acks'], 0.5) * 1000:>9.2f}ms{percentile(row['acks'], 0.99) * 1000:>9.2f}ms"
+                f"{percentile(row['lags'], 0.99) * 1000:>9.2f}ms{max(row['lags'], default=0) * 1000:>9.2f}ms"
+                f"{1000 * row['advance']:>9.0f}ms"
+            )
+        tournament.refresh_from_db()
+        self.stdout.write(f'{tournament.status} in {total:.1f}s, winner {tournament.winner_id}')
+
+    async def _play(self, application, tournament_id, tokens, created, options):
+        loop = asyncio.get_running_loop()
+        lags = []
+        stop = asyncio.Event()
+
+        async def monitor():
+            while not stop.is_set():
+                started = loop.time()
+                await asyncio.sleep(LAG_INTERVAL)
+                lags.append(loop.time() - started - LAG_INTERVAL)
+
+        watcher = asyncio.create_task(monitor())
+        rounds = []
+        tournament = await Tournament.objects.aget(pk=tournament_id)
+        rng = random.Random(tournament_id)
+        while tournament.status == 'in_progress':
+            number = tournament.current_round
+            games = [game async for game in KnockoutGame.objects.filter(
+                tournament_match__tournament_id=tournament_id, tournament_match__round=number,
+            ).values_list('pk', 'player1_id', 'player2_id')]
+
+            acks, first_lag = [], len(lags)
+            played = time.perf_counter()
+            await asyncio.gather(*(
+                play_randomly(application, tokens[user_id], game_id, random.Random(rng.random()), options['think'], acks)
+                for game_id, player1, player2 in games for user_id in (player1, player2)
+            ))
+            finished = time.perf_counter()
+
+            # The finishing checkpoints advance the bracket on the background pool
+            while tournament.status == 'in_progress' and tournament.current_round == number:
+                if time.perf_counter() - finished > ADVANCE_TIMEOUT:
+                    raise CommandError(f'Round {number} did not advance; see the background task log')
+                await asyncio.sleep(POLL_SECONDS)
+                tournament = await Tournament.objects.aget(pk=tournament_id)
+            rounds.append({'round': number, 'games': len(games), 'create': created, 'play': finished - played,
+                           'acks': sorted(acks), 'lags': sorted(lags[first_lag:]),
+                           'advance': time.perf_counter() - finished})
+            # Later rounds are created while advancing, so their time is in that column
+            created = None
+
+        await engine.close()
+        stop.set()
+        await watcher
+        return rounds
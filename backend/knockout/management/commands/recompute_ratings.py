@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from knockout.ratings import rating_tau, replay_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute every knockout subject rating by replaying all completed games in order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tau', type=float, default=None, help='Glicko-2 tau (default: KNOCKOUT_RATING_TAU)')
+        parser.add_argument('--dry-run', action='store_true', help='Replay without saving the ratings')
+
+    def handle(self, *args, **options):
+        tau = rating_tau() if options['tau'] is None else options['tau']
+        started = time.perf_counter()
+        games = replay_ratings(tau=tau, save=not options['dry_run'])
+        elapsed = time.perf_counter() - started
+        action = 'Replayed' if options['dry_run'] else 'Recomputed ratings from'
+        self.stdout.write(self.style.SUCCESS(f'{action} {games} games with tau={tau} in {elapsed:.2f}s'))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from knockout.reviews import reschedule
+
+
+class Command(BaseCommand):
+    help = (
+        'Reschedule every review answered since the last run with SM-2, setting each item\'s next due date. '
+        'Run it nightly from cron.'
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rescheduled = reschedule()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rescheduled {rescheduled} reviews in {time.perf_counter() - started:.2f}s'
+        ))
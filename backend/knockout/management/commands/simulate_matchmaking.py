@@ -0,0 +1,83 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from dof3a_base.models import Student
+from knockout.matchmaking import MatchQueue, Ticket, TICK_SECONDS
+
+GRADES = [grade for grade, _ in Student.STUDENT_GRADE if grade != Student.OPTION_SELECT]
+SUBJECTS = ['Math', 'Physics', 'Chemistry', 'Biology', 'English']
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the matchmaking queue on a virtual clock with synthetic players arriving in a burst, '
+        'and report match-found waits, bot share, rating gaps and the CPU cost per arrival and tick'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, nargs='+', default=[1000, 5000, 20000])
+        # Everyone arrives within this many seconds, like a school logging in after class
+        parser.add_argument('--arrival-seconds', type=float, default=120)
+        parser.add_argument('--rating-spread', type=float, default=200)
+
+    def handle(self, *args, **options):
+        header = (f"{'players':>8}{'wait p50':>10}{'wait p95':>10}{'wait p99':>10}{'bots':>7}{'gap':>7}"
+                  f"{'max depth':>11}{'arrival':>11}{'tick max':>11}")
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for players in options['players']:
+            self._simulate(players, options)
+
+    def _simulate(self, players, options):
+        rng = random.Random(players)
+        arrivals = sorted(
+            (Ticket(user_id, rng.choice(GRADES), rng.choice(SUBJECTS), rng.gauss(1500, options['rating_spread']),
+                    rng.uniform(0, options['arrival_seconds']))
+             for user_id in range(1, players + 1)),
+            key=lambda ticket: ticket.joined_at,
+        )
+
+        queue = MatchQueue()
+        waits, gaps, bots, depth = [], [], 0, 0
+        arrival_seconds, tick_seconds = [], []
+
+        def settle(pairs, bot_tickets, now):
+            nonlocal bots
+            for first, second in pairs:
+                waits.extend([now - first.joined_at, now - second.joined_at])
+                gaps.append(abs(first.rating - second.rating))
+            for ticket in bot_tickets:
+                waits.append(now - ticket.joined_at)
+                bots += 1
+
+        next_tick = TICK_SECONDS
+        for ticket in arrivals:
+            while next_tick <= ticket.joined_at:
+                started = time.perf_counter()
+                settle(*queue.match(next_tick), next_tick)
+                tick_seconds.append(time.perf_counter() - started)
+                next_tick += TICK_SECONDS
+            started = time.perf_counter()
+            queue.add(ticket)
+            settle(*queue.match(ticket.joined_at, [ticket]), ticket.joined_at)
+            arrival_seconds.append(time.perf_counter() - started)
+            depth = max(depth, len(queue))
+        while queue:
+            started = time.perf_counter()
+            settle(*queue.match(next_tick), next_tick)
+            tick_seconds.append(time.perf_counter() - started)
+            next_tick += TICK_SECONDS
+
+        waits.sort()
+        self.stdout.write(
+            f'{players:>8}{percentile(waits, 0.5):>9.1f}s{percentile(waits, 0.95):>9.1f}s{percentile(waits, 0.99):>9.1f}s'
+            f'{100 * bots / players:>6.1f}%{statistics.mean(gaps) if gaps else 0:>7.0f}{depth:>11}'
+            f'{1000 * statistics.mean(arrival_seconds):>9.3f}ms{1000 * max(tick_seconds, default=0):>9.2f}ms'
+        )
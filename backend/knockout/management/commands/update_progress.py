@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from knockout.progress import update_progress
+
+
+class Command(BaseCommand):
+    help = (
+        'Add game answers recorded since the last run to the per-student topic progress counters. '
+        'Run it every few minutes from cron.'
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        read = update_progress()
+        self.stdout.write(self.style.SUCCESS(
+            f'Counted {read} answers in {time.perf_counter() - started:.2f}s'
+        ))
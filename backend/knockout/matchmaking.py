@@ -0,0 +1,287 @@
+import asyncio
+import logging
+from collections import defaultdict, deque
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+
+from dof3a_base import activity
+from dof3a_base.models import Student
+from .bank import copy_into_game, pick_adaptive_questions
+from .models import KnockoutGame, SubjectRating
+from .ratings import DEFAULT_RATING
+
+logger = logging.getLogger(__name__)
+
+# Players within the same BAND_WIDTH rating points are matched straight away
+BAND_WIDTH = 100
+# Every WIDEN_SECONDS of waiting lets a player reach one band further, up to MAX_WIDEN_BANDS
+WIDEN_SECONDS = 5
+MAX_WIDEN_BANDS = 4
+# Players still waiting after this long play a bot instead
+BOT_AFTER_SECONDS = 30
+# How often waiting players are re-checked as their bands widen
+TICK_SECONDS = 1.0
+QUESTIONS_PER_GAME = 5
+# Recent matches the match-found latency percentiles are taken over
+STATS_WINDOW = 1000
+
+
+@dataclass(slots=True)
+class Ticket:
+    user_id: int
+    grade: str
+    subject: str
+    rating: float
+    joined_at: float
+    # IRT ability, used to pick the game's questions
+    ability: float = 0.0
+
+    @property
+    def band(self):
+        return int(self.rating // BAND_WIDTH)
+
+
+class MatchQueue:
+    """
+    Waiting players bucketed by (grade, subject, rating band).
+
+    Each bucket is a dict in join order, so its first entry is the player who
+    has waited longest there and can reach furthest. Two players match when
+    both have waited long enough to reach the other's band. Time is passed in
+    rather than read, so the simulation can run it on a virtual clock.
+    """
+
+    def __init__(self, widen_seconds=WIDEN_SECONDS, max_widen=MAX_WIDEN_BANDS, bot_after=BOT_AFTER_SECONDS):
+        self.widen_seconds = widen_seconds
+        self.max_widen = max_widen
+        self.bot_after = bot_after
+        self.buckets = defaultdict(dict)
+        self.tickets = {}
+
+    def __len__(self):
+        return len(self.tickets)
+
+    def reach(self, ticket, now):
+        return min(int((now - ticket.joined_at) // self.widen_seconds), self.max_widen)
+
+    def add(self, ticket):
+        self.remove(ticket.user_id)
+        self.tickets[ticket.user_id] = ticket
+        self.buckets[ticket.grade, ticket.subject, ticket.band][ticket.user_id] = ticket
+
+    def remove(self, user_id):
+        ticket = self.tickets.pop(user_id, None)
+        if ticket is not None:
+            key = (ticket.grade, ticket.subject, ticket.band)
+            del self.buckets[key][user_id]
+            if not self.buckets[key]:
+                del self.buckets[key]
+        return ticket
+
+    def find_opponent(self, ticket, now):
+        """The longest-waiting player this ticket and they can both reach, nearest band first."""
+        reach = self.reach(ticket, now)
+        for distance in range(reach + 1):
+            for band in {ticket.band - distance, ticket.band + distance}:
+                for other in self.buckets.get((ticket.grade, ticket.subject, band), {}).values():
+                    if other.user_id == ticket.user_id:
+                        continue
+                    # Later arrivals in the bucket reach no further than the first
+                    if self.reach(other, now) >= distance:
+                        return other
+                    break
+        return None
+
+    def match(self, now, tickets=None):
+        """
+        Pair up whoever can be paired, longest waiting first.
+
+        Returns (pairs, bot_tickets); every returned ticket has left the queue.
+        """
+        pairs, bots = [], []
+        for ticket in list(self.tickets.values() if tickets is None else tickets):
+            if ticket.user_id not in self.tickets:
+                continue
+            other = self.find_opponent(ticket, now)
+            if other is not None:
+                self.remove(ticket.user_id)
+                self.remove(other.user_id)
+                pairs.append((ticket, other))
+            elif now - ticket.joined_at >= self.bot_after:
+                self.remove(ticket.user_id)
+                bots.append(ticket)
+        return pairs, bots
+
+    def depth(self):
+        return {f'{grade}|{subject}|{band * BAND_WIDTH}': len(bucket)
+                for (grade, subject, band), bucket in self.buckets.items()}
+
+
+class MatchStats:
+    """Match-found latency over the last STATS_WINDOW matches, plus running totals."""
+
+    def __init__(self):
+        self.waits = deque(maxlen=STATS_WINDOW)
+        self.human_matches = 0
+        self.bot_matches = 0
+
+    def record(self, waits, vs_bot):
+        """One game found, after each of its players waited `waits` seconds."""
+        self.waits.extend(waits)
+        if vs_bot:
+            self.bot_matches += 1
+        else:
+            self.human_matches += 1
+
+    def as_dict(self, queue):
+        waits = sorted(self.waits)
+
+        def percentile(fraction):
+            return round(waits[min(int(len(waits) * fraction), len(waits) - 1)], 3) if waits else None
+
+        return {
+            'waiting': len(queue),
+            'queue_depth': queue.depth(),
+            'human_matches': self.human_matches,
+            'bot_matches': self.bot_matches,
+            'wait_seconds': {'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99),
+                             'max': round(waits[-1], 3) if waits else None},
+        }
+
+
+def player_rating(user_id, subject):
+    """The player's (Glicko-2 rating, IRT ability) in the subject; new players start at the defaults."""
+    rating, ability = (
+        SubjectRating.objects.filter(user_id=user_id, subject=subject).values_list('rating', 'ability').first()
+        or (None, None)
+    )
+    return DEFAULT_RATING if rating is None else rating, 0.0 if ability is None else ability
+
+
+def player_profile(user_id, subject):
+    """(grade, rating, ability) used to queue the player."""
+    grade = Student.objects.filter(user_id=user_id).values_list('grade', flat=True).first()
+    return grade, *player_rating(user_id, subject)
+
+
+def difficulty_for(rating):
+    if rating < DEFAULT_RATING - BAND_WIDTH:
+        return 'easy'
+    if rating > DEFAULT_RATING + BAND_WIDTH:
+        return 'hard'
+    return 'medium'
+
+
+def bot_accuracy_for(rating):
+    # An even game for the player; ratings.bot_rating() is the inverse
+    return min(max(0.5 + (rating - DEFAULT_RATING) / 1000, 0.2), 0.9)
+
+
+def create_matched_game(tickets):
+    """Create the game for one or two matched tickets (one means against a bot). Returns its id, or None."""
+    first = tickets[0]
+    rating = sum(ticket.rating for ticket in tickets) / len(tickets)
+    questions = pick_adaptive_questions(first.subject, first.grade, [ticket.ability for ticket in tickets],
+                                        QUESTIONS_PER_GAME)
+    if not questions:
+        return None
+
+    with transaction.atomic():
+        game = KnockoutGame.objects.create(
+            player1_id=first.user_id,
+            player2_id=tickets[1].user_id if len(tickets) > 1 else None,
+            bot_accuracy=None if len(tickets) > 1 else bot_accuracy_for(first.rating),
+            subject=first.subject,
+            grade_level=first.grade,
+            difficulty=difficulty_for(rating),
+        )
+        copy_into_game(game, questions)
+        activity.record_many([ticket.user_id for ticket in tickets], 'knockout_join', game=game.pk)
+    return game.pk
+
+
+class Matchmaker:
+    """The matchmaking queue for this worker process, with its connected players."""
+
+    def __init__(self, queue=None, tick_seconds=TICK_SECONDS):
+        self.queue = MatchQueue() if queue is None else queue
+        self.tick_seconds = tick_seconds
+        self.stats = MatchStats()
+        self.outboxes = {}
+        # Rebuilt on the event loop whenever the queue changes, for readers on other threads
+        self.snapshot = self.stats.as_dict(self.queue)
+        self._ticker = None
+        self._tasks = set()
+
+    def _now(self):
+        return asyncio.get_running_loop().time()
+
+    async def join(self, user_id, subject, outbox):
+        grade, rating, ability = await sync_to_async(player_profile)(user_id, subject)
+        previous = self.outboxes.get(user_id)
+        if previous is not None:
+            previous.put_nowait({'type': 'error', 'detail': 'You joined the queue from another connection.'})
+            previous.put_nowait(None)
+
+        ticket = Ticket(user_id, grade, subject, rating, self._now(), ability)
+        self.queue.add(ticket)
+        self.outboxes[user_id] = outbox
+        outbox.put_nowait({'type': 'queued', 'subject': subject, 'grade': grade, 'rating': round(rating)})
+
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.create_task(self._tick_loop())
+        self._dispatch(*self.queue.match(self._now(), [ticket]))
+        self._publish()
+
+    def leave(self, user_id, outbox):
+        if self.outboxes.get(user_id) is outbox:
+            del self.outboxes[user_id]
+            self.queue.remove(user_id)
+            self._publish()
+
+    async def _tick_loop(self):
+        while self.queue:
+            await asyncio.sleep(self.tick_seconds)
+            self._dispatch(*self.queue.match(self._now()))
+            self._publish()
+
+    def _publish(self):
+        self.snapshot = self.stats.as_dict(self.queue)
+
+    def _dispatch(self, pairs, bots):
+        for tickets in [*pairs, *((ticket,) for ticket in bots)]:
+            outboxes = [self.outboxes.pop(ticket.user_id, None) for ticket in tickets]
+            task = asyncio.create_task(self._start_game(tickets, outboxes))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _start_game(self, tickets, outboxes):
+        try:
+            game_id = await sync_to_async(create_matched_game)(tickets)
+        except Exception:
+            logger.exception('Creating a matched knockout game failed')
+            game_id = None
+
+        if game_id is not None:
+            now = self._now()
+            self.stats.record([now - ticket.joined_at for ticket in tickets], vs_bot=len(tickets) == 1)
+        for ticket, outbox in zip(tickets, outboxes):
+            if game_id is None:
+                message = {'type': 'error', 'detail': 'No questions for this subject and grade yet.'}
+            else:
+                opponents = [other.user_id for other in tickets if other is not ticket]
+                message = {
+                    'type': 'match_found',
+                    'game': game_id,
+                    'opponent': opponents[0] if opponents else None,
+                    'websocket_url': f'/ws/knockout/{game_id}/',
+                }
+            if outbox is not None:
+                outbox.put_nowait(message)
+                outbox.put_nowait(None)
+        self._publish()
+
+
+matchmaker = Matchmaker()
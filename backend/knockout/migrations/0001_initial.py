@@ -0,0 +1,265 @@
+# Generated by Django 5.2.4 on 2026-10-19 03:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BankQuestion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("subject", models.CharField(max_length=50)),
+                (
+                    "grade_level",
+                    models.CharField(
+                        choices=[
+                            ("Please select an option", "Please select an option"),
+                            ("Middle 1", "Middle 1"),
+                            ("Middle 2", "Middle 2"),
+                            ("Middle 3", "Middle 3"),
+                            ("Senior 1", "Senior 1"),
+                            ("Senior 2", "Senior 2"),
+                            ("Senior 3", "Senior 3"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "difficulty",
+                    models.CharField(
+                        choices=[
+                            ("easy", "Easy"),
+                            ("medium", "Medium"),
+                            ("hard", "Hard"),
+                        ],
+                        default="medium",
+                        max_length=10,
+                    ),
+                ),
+                ("topic", models.CharField(blank=True, max_length=100)),
+                ("question_text", models.TextField()),
+                ("option_a", models.CharField(max_length=200)),
+                ("option_b", models.CharField(max_length=200)),
+                ("option_c", models.CharField(max_length=200)),
+                ("option_d", models.CharField(max_length=200)),
+                (
+                    "correct_answer",
+                    models.CharField(
+                        choices=[("A", "A"), ("B", "B"), ("C", "C"), ("D", "D")],
+                        max_length=1,
+                    ),
+                ),
+                ("explanation", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["grade_level", "subject", "difficulty"],
+                        name="knockout_ba_grade_l_4048ae_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="KnockoutGame",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("subject", models.CharField(max_length=50)),
+                (
+                    "grade_level",
+                    models.CharField(
+                        choices=[
+                            ("Please select an option", "Please select an option"),
+                            ("Middle 1", "Middle 1"),
+                            ("Middle 2", "Middle 2"),
+                            ("Middle 3", "Middle 3"),
+                            ("Senior 1", "Senior 1"),
+                            ("Senior 2", "Senior 2"),
+                            ("Senior 3", "Senior 3"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "difficulty",
+                    models.CharField(
+                        choices=[
+                            ("easy", "Easy"),
+                            ("medium", "Medium"),
+                            ("hard", "Hard"),
+                        ],
+                        default="medium",
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("in_progress", "In Progress"),
+                            ("completed", "Completed"),
+                            ("cancelled", "Cancelled"),
+                        ],
+                        default="pending",
+                        max_length=15,
+                    ),
+                ),
+                ("player1_score", models.PositiveIntegerField(default=0)),
+                ("player2_score", models.PositiveIntegerField(default=0)),
+                ("points_awarded", models.PositiveIntegerField(default=0)),
+                ("current_question", models.PositiveIntegerField(default=0)),
+                ("question_time_seconds", models.PositiveIntegerField(default=15)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+                ("checkpointed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "player1",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="knockout_player1",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "player2",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="knockout_player2",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "winner",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="knockout_wins",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="KnockoutQuestion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("question_text", models.TextField()),
+                ("option_a", models.CharField(max_length=200)),
+                ("option_b", models.CharField(max_length=200)),
+                ("option_c", models.CharField(max_length=200)),
+                ("option_d", models.CharField(max_length=200)),
+                (
+                    "correct_answer",
+                    models.CharField(
+                        choices=[("A", "A"), ("B", "B"), ("C", "C"), ("D", "D")],
+                        max_length=1,
+                    ),
+                ),
+                ("explanation", models.TextField(blank=True)),
+                ("question_order", models.PositiveIntegerField()),
+                (
+                    "bank_question",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="uses",
+                        to="knockout.bankquestion",
+                    ),
+                ),
+                (
+                    "game",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="questions",
+                        to="knockout.knockoutgame",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["question_order"],
+            },
+        ),
+        migrations.CreateModel(
+            name="KnockoutAnswer",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "selected_answer",
+                    models.CharField(
+                        choices=[("A", "A"), ("B", "B"), ("C", "C"), ("D", "D")],
+                        max_length=1,
+                    ),
+                ),
+                ("is_correct", models.BooleanField()),
+                ("time_taken_ms", models.PositiveIntegerField()),
+                ("points", models.PositiveIntegerField(default=0)),
+                ("answered_at", models.DateTimeField()),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="knockout_answers",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "question",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="answers",
+                        to="knockout.knockoutquestion",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("question", "user")},
+            },
+        ),
+    ]
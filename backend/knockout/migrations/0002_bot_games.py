@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-19 03:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("knockout", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="knockoutgame",
+            name="bot_accuracy",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="knockoutgame",
+            name="player2",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="knockout_player2",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-19 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("knockout", "0003_subjectrating"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bankquestion",
+            name="irt_difficulty",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="bankquestion",
+            name="irt_discrimination",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="bankquestion",
+            name="irt_responses",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="subjectrating",
+            name="ability",
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
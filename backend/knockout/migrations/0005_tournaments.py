@@ -0,0 +1,212 @@
+# Generated by Django 5.2.4 on 2026-10-19 04:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("knockout", "0004_irt_calibration"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tournament",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                ("subject", models.CharField(max_length=50)),
+                (
+                    "grade_level",
+                    models.CharField(
+                        choices=[
+                            ("Please select an option", "Please select an option"),
+                            ("Middle 1", "Middle 1"),
+                            ("Middle 2", "Middle 2"),
+                            ("Middle 3", "Middle 3"),
+                            ("Senior 1", "Senior 1"),
+                            ("Senior 2", "Senior 2"),
+                            ("Senior 3", "Senior 3"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "format",
+                    models.CharField(
+                        choices=[
+                            ("single_elimination", "Single elimination"),
+                            ("swiss", "Swiss"),
+                        ],
+                        default="single_elimination",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("registration", "Registration"),
+                            ("in_progress", "In Progress"),
+                            ("completed", "Completed"),
+                        ],
+                        default="registration",
+                        max_length=15,
+                    ),
+                ),
+                ("questions_per_match", models.PositiveIntegerField(default=5)),
+                ("question_time_seconds", models.PositiveIntegerField(default=15)),
+                ("round_minutes", models.PositiveIntegerField(default=15)),
+                ("rounds", models.PositiveIntegerField(default=0)),
+                ("current_round", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "created_by",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="knockout_tournaments_created",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "winner",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="knockout_tournament_wins",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TournamentEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("seed", models.PositiveIntegerField(blank=True, null=True)),
+                ("points", models.FloatField(default=0)),
+                ("eliminated_in", models.PositiveIntegerField(blank=True, null=True)),
+                ("joined_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "tournament",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="entries",
+                        to="knockout.tournament",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="knockout_entries",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TournamentMatch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("round", models.PositiveIntegerField()),
+                ("position", models.PositiveIntegerField()),
+                ("deadline", models.DateTimeField()),
+                ("decided_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "player1",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "player2",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "tournament",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="matches",
+                        to="knockout.tournament",
+                    ),
+                ),
+                (
+                    "winner",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["tournament", "round", "position"],
+            },
+        ),
+        migrations.AddField(
+            model_name="knockoutgame",
+            name="tournament_match",
+            field=models.OneToOneField(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="game",
+                to="knockout.tournamentmatch",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tournament",
+            index=models.Index(
+                fields=["status", "grade_level"], name="knockout_to_status_2df33c_idx"
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="tournamententry",
+            unique_together={("tournament", "user")},
+        ),
+        migrations.AlterUniqueTogether(
+            name="tournamentmatch",
+            unique_together={("tournament", "round", "position")},
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.4 on 2026-10-19 04:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("knockout", "0005_tournaments"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReviewItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("repetitions", models.PositiveIntegerField(default=0)),
+                ("interval_days", models.PositiveIntegerField(default=0)),
+                ("ease_factor", models.FloatField(default=2.5)),
+                ("lapses", models.PositiveIntegerField(default=0)),
+                ("due_date", models.DateField()),
+                (
+                    "pending_quality",
+                    models.PositiveSmallIntegerField(blank=True, null=True),
+                ),
+                ("reviewed_on", models.DateField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "bank_question",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reviews",
+                        to="knockout.bankquestion",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="knockout_reviews",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["user", "due_date"], name="review_due_idx")
+                ],
+                "unique_together": {("user", "bank_question")},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("knockout", "0007_topic_progress"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GradeTopicSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("grade_level", models.CharField(max_length=50)),
+                ("subject", models.CharField(max_length=50)),
+                ("topic", models.CharField(max_length=100)),
+                ("day", models.DateField()),
+                ("answered", models.PositiveIntegerField()),
+                ("correct", models.PositiveIntegerField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["grade_level", "day"], name="grade_snapshot_day_idx"
+                    )
+                ],
+                "unique_together": {("grade_level", "subject", "topic", "day")},
+            },
+        ),
+    ]
@@ -0,0 +1,267 @@
+from django.db import models
+from django.contrib.auth import get_user_model
+
+from dof3a_base.models import Student
+
+User = get_user_model()
+
+DIFFICULTY_CHOICES = [
+    ('easy', 'Easy'),
+    ('medium', 'Medium'),
+    ('hard', 'Hard'),
+]
+
+ANSWER_CHOICES = [('A', 'A'), ('B', 'B'), ('C', 'C'), ('D', 'D')]
+
+
+class BankQuestion(models.Model):
+    """A reusable multiple choice question that games draw from."""
+    subject = models.CharField(max_length=50)
+    grade_level = models.CharField(max_length=50, choices=Student.STUDENT_GRADE)
+    difficulty = models.CharField(max_length=10, choices=DIFFICULTY_CHOICES, default='medium')
+    topic = models.CharField(max_length=100, blank=True)
+    question_text = models.TextField()
+    option_a = models.CharField(max_length=200)
+    option_b = models.CharField(max_length=200)
+    option_c = models.CharField(max_length=200)
+    option_d = models.CharField(max_length=200)
+    correct_answer = models.CharField(max_length=1, choices=ANSWER_CHOICES)
+    explanation = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Item response theory parameters measured by knockout.irt.calibrate(); empty until then
+    irt_difficulty = models.FloatField(null=True, blank=True)
+    irt_discrimination = models.FloatField(null=True, blank=True)
+    irt_responses = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['grade_level', 'subject', 'difficulty'])]
+
+    def __str__(self):
+        return self.question_text[:80]
+
+
+class KnockoutGame(models.Model):
+    """A 1v1 knockout game; checkpointed from the in-memory match by knockout.engine."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('in_progress', 'In Progress'),
+        ('completed', 'Completed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    player1 = models.ForeignKey(User, on_delete=models.CASCADE, related_name='knockout_player1')
+    # Empty when player1 was matched against a bot, which answers with bot_accuracy
+    player2 = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='knockout_player2')
+    bot_accuracy = models.FloatField(null=True, blank=True)
+
+    subject = models.CharField(max_length=50)
+    grade_level = models.CharField(max_length=50, choices=Student.STUDENT_GRADE)
+    difficulty = models.CharField(max_length=10, choices=DIFFICULTY_CHOICES, default='medium')
+    status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='pending')
+
+    player1_score = models.PositiveIntegerField(default=0)
+    player2_score = models.PositiveIntegerField(default=0)
+    winner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='knockout_wins')
+    points_awarded = models.PositiveIntegerField(default=0)
+
+    # Index of the question being played when last checkpointed
+    current_question = models.PositiveIntegerField(default=0)
+    question_time_seconds = models.PositiveIntegerField(default=15)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    checkpointed_at = models.DateTimeField(null=True, blank=True)
+
+    # Set for games played as part of a tournament round
+    tournament_match = models.OneToOneField('TournamentMatch', on_delete=models.CASCADE, null=True, blank=True,
+                                            related_name='game')
+
+    def __str__(self):
+        opponent = self.player2.username if self.player2_id else 'bot'
+        return f'{self.player1.username} vs {opponent} - {self.subject}'
+
+
+class KnockoutQuestion(models.Model):
+    """A question as asked in one game, copied from the bank so later bank edits don't change history."""
+    game = models.ForeignKey(KnockoutGame, on_delete=models.CASCADE, related_name='questions')
+    bank_question = models.ForeignKey(BankQuestion, on_delete=models.SET_NULL, null=True, blank=True, related_name='uses')
+    question_text = models.TextField()
+    option_a = models.CharField(max_length=200)
+    option_b = models.CharField(max_length=200)
+    option_c = models.CharField(max_length=200)
+    option_d = models.CharField(max_length=200)
+    correct_answer = models.CharField(max_length=1, choices=ANSWER_CHOICES)
+    explanation = models.TextField(blank=True)
+    question_order = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['question_order']
+
+    @property
+    def options(self):
+        return [self.option_a, self.option_b, self.option_c, self.option_d]
+
+
+class KnockoutAnswer(models.Model):
+    """A player's answer, timed and scored by the server."""
+    question = models.ForeignKey(KnockoutQuestion, on_delete=models.CASCADE, related_name='answers')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='knockout_answers')
+    selected_answer = models.CharField(max_length=1, choices=ANSWER_CHOICES)
+    is_correct = models.BooleanField()
+    time_taken_ms = models.PositiveIntegerField()
+    points = models.PositiveIntegerField(default=0)
+    answered_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('question', 'user')
+
+
+class SubjectRating(models.Model):
+    """A player's Glicko-2 knockout rating in one subject, kept by knockout.ratings."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='knockout_ratings')
+    subject = models.CharField(max_length=50)
+    rating = models.FloatField(default=1500.0)
+    deviation = models.FloatField(default=350.0)
+    volatility = models.FloatField(default=0.06)
+    games = models.PositiveIntegerField(default=0)
+    # IRT ability on the question difficulty scale, set by knockout.irt.calibrate()
+    ability = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'subject')
+        indexes = [models.Index(fields=['subject', '-rating'], name='rating_subject_rank_idx')]
+
+    def __str__(self):
+        return f'{self.user} {self.subject}: {self.rating:.0f}'
+
+
+class Tournament(models.Model):
+    """A bracket of knockout games; knockout.tournaments creates and advances its rounds."""
+    FORMAT_CHOICES = [
+        ('single_elimination', 'Single elimination'),
+        ('swiss', 'Swiss'),
+    ]
+    STATUS_CHOICES = [
+        ('registration', 'Registration'),
+        ('in_progress', 'In Progress'),
+        ('completed', 'Completed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='knockout_tournaments_created')
+    subject = models.CharField(max_length=50)
+    grade_level = models.CharField(max_length=50, choices=Student.STUDENT_GRADE)
+    format = models.CharField(max_length=20, choices=FORMAT_CHOICES, default='single_elimination')
+    status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='registration')
+
+    questions_per_match = models.PositiveIntegerField(default=5)
+    question_time_seconds = models.PositiveIntegerField(default=15)
+    # Games still unfinished this long after their round starts are decided on the scores so far
+    round_minutes = models.PositiveIntegerField(default=15)
+
+    # Planned number of rounds, fixed when the tournament starts
+    rounds = models.PositiveIntegerField(default=0)
+    current_round = models.PositiveIntegerField(default=0)
+    winner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='knockout_tournament_wins')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'grade_level'])]
+
+    def __str__(self):
+        return self.name
+
+
+class TournamentEntry(models.Model):
+    tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE, related_name='entries')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='knockout_entries')
+    # 1 is the strongest entrant, by subject rating when the tournament starts
+    seed = models.PositiveIntegerField(null=True, blank=True)
+    # Swiss standings: 1 per win or bye, 0.5 per draw
+    points = models.FloatField(default=0)
+    eliminated_in = models.PositiveIntegerField(null=True, blank=True)
+    joined_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('tournament', 'user')
+
+    def __str__(self):
+        return f'{self.user} in {self.tournament}'
+
+
+class TournamentMatch(models.Model):
+    """One pairing in a round. A bye has no player2 or game and is decided when created."""
+    tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE, related_name='matches')
+    round = models.PositiveIntegerField()
+    # Slot in the round; in single elimination positions 2k and 2k + 1 feed position k of the next round
+    position = models.PositiveIntegerField()
+    player1 = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    player2 = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    # Empty on a decided Swiss draw
+    winner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    deadline = models.DateTimeField()
+    decided_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('tournament', 'round', 'position')
+        ordering = ['tournament', 'round', 'position']
+
+    def __str__(self):
+        return f'{self.tournament} round {self.round} #{self.position}'
+
+
+class ReviewItem(models.Model):
+    """A bank question a student missed, shown again on an SM-2 schedule by knockout.reviews."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='knockout_reviews')
+    bank_question = models.ForeignKey(BankQuestion, on_delete=models.CASCADE, related_name='reviews')
+    repetitions = models.PositiveIntegerField(default=0)
+    interval_days = models.PositiveIntegerField(default=0)
+    ease_factor = models.FloatField(default=2.5)
+    lapses = models.PositiveIntegerField(default=0)
+    due_date = models.DateField()
+    # A review graded since the last nightly pass, which reschedules it
+    pending_quality = models.PositiveSmallIntegerField(null=True, blank=True)
+    reviewed_on = models.DateField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'bank_question')
+        indexes = [models.Index(fields=['user', 'due_date'], name='review_due_idx')]
+
+    def __str__(self):
+        return f'{self.user} reviews {self.bank_question_id} on {self.due_date}'
+
+
+class TopicProgress(models.Model):
+    """Questions a student has answered in games per subject and bank topic, kept by knockout.progress."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='topic_progress')
+    subject = models.CharField(max_length=50)
+    topic = models.CharField(max_length=100)
+    answered = models.PositiveIntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'subject', 'topic')
+
+    def __str__(self):
+        return f'{self.user} {self.subject}/{self.topic}: {self.correct}/{self.answered}'
+
+
+class GradeTopicSnapshot(models.Model):
+    """A grade's topic progress totals as of a day, kept by knockout.analytics to measure change over time."""
+    grade_level = models.CharField(max_length=50)
+    subject = models.CharField(max_length=50)
+    topic = models.CharField(max_length=100)
+    day = models.DateField()
+    answered = models.PositiveIntegerField()
+    correct = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('grade_level', 'subject', 'topic', 'day')
+        indexes = [models.Index(fields=['grade_level', 'day'], name='grade_snapshot_day_idx')]
@@ -0,0 +1,135 @@
+from collections import defaultdict
+
+import numpy as np
+from django.db.models import F
+
+from dof3a_base.models import Student
+from dof3a_base.rollups import CHUNK_SIZE, consume
+
+from .models import KnockoutAnswer, TopicProgress
+
+# Mastery is accuracy pulled towards PRIOR_ACCURACY as if PRIOR_ANSWERS more answers had been
+# given, so a couple of lucky or unlucky answers don't read as mastered or failed
+PRIOR_ANSWERS = 4
+PRIOR_ACCURACY = 0.5
+# A topic is weak below this mastery, once it has been answered at least MIN_ANSWERS times
+WEAK_MASTERY = 0.6
+MIN_ANSWERS = 3
+WEAK_LIMIT = 5
+
+
+def smoothed_mastery(answered, correct):
+    return (correct + PRIOR_ANSWERS * PRIOR_ACCURACY) / (answered + PRIOR_ANSWERS)
+
+
+def _apply(rows):
+    """
+    Add a chunk of answers to the progress counters.
+
+    Counters are incremented in the database with F() expressions, one
+    UPDATE per distinct (answered, correct) increment, so nothing read here
+    is written back and a concurrent writer can't lose an increment.
+    """
+    increments = defaultdict(lambda: [0, 0])
+    for _, user_id, _, subject, topic, is_correct in rows:
+        counts = increments[user_id, subject, topic]
+        counts[0] += 1
+        counts[1] += is_correct
+    TopicProgress.objects.bulk_create(
+        [TopicProgress(user_id=user_id, subject=subject, topic=topic) for user_id, subject, topic in increments],
+        batch_size=1000, ignore_conflicts=True,
+    )
+    pks = {
+        (user_id, subject, topic): pk for pk, user_id, subject, topic in TopicProgress.objects.filter(
+            user_id__in={key[0] for key in increments}, topic__in={key[2] for key in increments},
+        ).values_list('pk', 'user_id', 'subject', 'topic')
+    }
+    groups = defaultdict(list)
+    for key, counts in increments.items():
+        groups[tuple(counts)].append(pks[key])
+    for (answered, correct), ids in groups.items():
+        TopicProgress.objects.filter(pk__in=ids).update(answered=F('answered') + answered, correct=F('correct') + correct)
+
+
+def update_progress(chunk_size=CHUNK_SIZE, now=None):
+    """Count game answers recorded since the last run towards topic progress. Returns the answers read."""
+    answers = KnockoutAnswer.objects.filter(question__bank_question__topic__gt='').values_list(
+        'pk', 'user_id', 'answered_at', 'question__game__subject', 'question__bank_question__topic', 'is_correct',
+    )
+    return consume('topic_progress', answers, _apply, chunk_size, now)
+
+
+class MasteryMatrix:
+    """
+    Answered and correct counts of students × (subject, topic) as arrays.
+
+    Rows follow `user_ids` and columns `topics`; cells nobody has answered
+    are zero, and their mastery is PRIOR_ACCURACY.
+    """
+
+    def __init__(self, user_ids, topics, answered, correct):
+        self.user_ids = user_ids
+        self.topics = topics
+        self.answered = answered
+        self.correct = correct
+        self._rows = {user_id: row for row, user_id in enumerate(user_ids)}
+
+    @classmethod
+    def from_counts(cls, user_ids, counts):
+        """Build from (user id, subject, topic, answered, correct) rows of the given users, one per cell at most."""
+        counts = list(counts)
+        topics = sorted({(subject, topic) for _, subject, topic, _, _ in counts})
+        answered = np.zeros((len(user_ids), len(topics)), dtype=np.int64)
+        correct = np.zeros_like(answered)
+        if counts:
+            rows = {user_id: row for row, user_id in enumerate(user_ids)}
+            columns = {topic: column for column, topic in enumerate(topics)}
+            index = np.array([(rows[user_id], columns[subject, topic]) for user_id, subject, topic, _, _ in counts]).T
+            answered[index[0], index[1]] = [row[3] for row in counts]
+            correct[index[0], index[1]] = [row[4] for row in counts]
+        return cls(list(user_ids), topics, answered, correct)
+
+    @property
+    def mastery(self):
+        return smoothed_mastery(self.answered, self.correct)
+
+    def topic_mastery(self):
+        """Mastery of each topic over all the students together, e.g. a class."""
+        return smoothed_mastery(self.answered.sum(axis=0), self.correct.sum(axis=0))
+
+    def weak_topics(self, user_id=None, limit=WEAK_LIMIT):
+        """A student's weakest topics, or with no student the group's, weakest first."""
+        if user_id is None:
+            answered, mastery = self.answered.sum(axis=0), self.topic_mastery()
+        else:
+            row = self._rows[user_id]
+            answered, mastery = self.answered[row], self.mastery[row]
+        weak = np.flatnonzero((answered >= MIN_ANSWERS) & (mastery < WEAK_MASTERY))
+        weak = weak[np.argsort(mastery[weak], kind='stable')][:limit]
+        return [
+            {'subject': self.topics[column][0], 'topic': self.topics[column][1], 'mastery': round(float(mastery[column]), 2)}
+            for column in weak
+        ]
+
+    def to_dict(self):
+        return {
+            'users': self.user_ids,
+            'topics': [{'subject': subject, 'topic': topic} for subject, topic in self.topics],
+            'answered': self.answered.tolist(),
+            'correct': self.correct.tolist(),
+            'mastery': np.round(self.mastery, 3).tolist(),
+        }
+
+
+def mastery_matrix(user_ids, subject=None):
+    """The students' mastery matrix, from the progress counters in one query."""
+    user_ids = list(user_ids)
+    counts = TopicProgress.objects.filter(user_id__in=user_ids)
+    if subject:
+        counts = counts.filter(subject=subject)
+    return MasteryMatrix.from_counts(user_ids, counts.values_list('user_id', 'subject', 'topic', 'answered', 'correct'))
+
+
+def class_mastery(grade_level, subject=None):
+    """Every student in the grade, including those who haven't played yet, in two queries."""
+    return mastery_matrix(Student.objects.filter(grade=grade_level).order_by('user_id').values_list('user_id', flat=True), subject)
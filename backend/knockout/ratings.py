@@ -0,0 +1,245 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import KnockoutGame, SubjectRating
+
+# Glicko-2 defaults for a new player (Glickman, "Example of the Glicko-2 system")
+DEFAULT_RATING = 1500.0
+DEFAULT_DEVIATION = 350.0
+DEFAULT_VOLATILITY = 0.06
+# Constrains how fast volatility changes; 0.3 to 1.2 are sensible
+TAU = 0.5
+# Glicko-2 works on ratings divided by this, centred on DEFAULT_RATING
+SCALE = 173.7178
+CONVERGENCE = 1e-6
+MAX_ITERATIONS = 100
+# Bots play at a known strength, so they are treated as a well-established opponent
+BOT_DEVIATION = 50.0
+
+
+def rating_tau():
+    return getattr(settings, 'KNOCKOUT_RATING_TAU', TAU)
+
+
+def bot_rating(accuracy):
+    """The rating a bot of this accuracy plays at; matchmaking.bot_accuracy_for() is its inverse."""
+    return DEFAULT_RATING + (accuracy - 0.5) * 1000
+
+
+def glicko2_update(rating, deviation, volatility, opponent_rating, opponent_deviation, score, tau=None):
+    """
+    One Glicko-2 rating period for many players at once.
+
+    rating, deviation and volatility are 1-D arrays, one entry per player. The
+    opponent arrays and score (1 win, 0.5 draw, 0 loss) carry the player's games
+    in the period along a trailing axis. Returns the new (rating, deviation,
+    volatility) arrays.
+    """
+    tau = rating_tau() if tau is None else tau
+    mu = (rating - DEFAULT_RATING) / SCALE
+    phi = deviation / SCALE
+    mu_j = (opponent_rating - DEFAULT_RATING) / SCALE
+    g = 1 / np.sqrt(1 + 3 * (opponent_deviation / SCALE) ** 2 / np.pi ** 2)
+    expected = 1 / (1 + np.exp(-g * (mu[:, None] - mu_j)))
+    v = 1 / np.sum(g ** 2 * expected * (1 - expected), axis=-1)
+    improvement = np.sum(g * (score - expected), axis=-1)
+    delta = v * improvement
+
+    # New volatility by the Illinois method, iterating every player together
+    a = np.log(volatility ** 2)
+
+    def f(x):
+        ex = np.exp(x)
+        return ex * (delta ** 2 - phi ** 2 - v - ex) / (2 * (phi ** 2 + v + ex) ** 2) - (x - a) / tau ** 2
+
+    big = delta ** 2 > phi ** 2 + v
+    with np.errstate(invalid='ignore'):
+        upper = np.where(big, np.log(delta ** 2 - phi ** 2 - v), a)
+    k = np.ones_like(a)
+    pending = ~big
+    while pending.any():
+        below = pending & (f(a - k * tau) < 0)
+        upper = np.where(pending & ~below, a - k * tau, upper)
+        k += below
+        pending = below
+
+    low, high = a, upper
+    f_low, f_high = f(low), f(high)
+    for _ in range(MAX_ITERATIONS):
+        active = np.abs(high - low) > CONVERGENCE
+        if not active.any():
+            break
+        with np.errstate(divide='ignore', invalid='ignore'):
+            middle = np.where(active, low + (low - high) * f_low / (f_high - f_low), high)
+        f_middle = f(middle)
+        swap = active & (f_middle * f_high <= 0)
+        low, f_low = np.where(swap, high, low), np.where(swap, f_high, np.where(active, f_low / 2, f_low))
+        high, f_high = np.where(active, middle, high), np.where(active, f_middle, f_high)
+    new_volatility = np.exp(low / 2)
+
+    phi_star = np.sqrt(phi ** 2 + new_volatility ** 2)
+    new_phi = 1 / np.sqrt(1 / phi_star ** 2 + 1 / v)
+    new_mu = mu + new_phi ** 2 * improvement
+    return DEFAULT_RATING + SCALE * new_mu, SCALE * new_phi, new_volatility
+
+
+def _rounds(first, second, players):
+    """
+    Split games into rounds in which nobody plays twice.
+
+    A game goes in the round after both its players' previous games, so each
+    player's games stay in order and every round can be rated in one call.
+    """
+    last = [0] * players
+    rounds = np.empty(len(first), dtype=np.int64)
+    for i, (a, b) in enumerate(zip(first.tolist(), second.tolist())):
+        r = last[a] if b < 0 else max(last[a], last[b])
+        rounds[i] = r
+        last[a] = r + 1
+        if b >= 0:
+            last[b] = r + 1
+    return rounds
+
+
+def apply_games(state, first, second, score, bot_ratings, tau=None):
+    """
+    Rate games in order, vectorised across each round.
+
+    state is a dict of 'rating', 'deviation', 'volatility' and 'games' arrays
+    indexed by player and is updated in place. Each game is first vs second
+    (-1 for a bot playing at bot_ratings), with `score` from first's side.
+    """
+    if not len(first):
+        return state
+    rounds = _rounds(first, second, len(state['rating']))
+    order = np.argsort(rounds, kind='stable')
+    bounds = np.searchsorted(rounds[order], np.arange(rounds.max() + 2))
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        games = order[start:stop]
+        a, b, s = first[games], second[games], score[games]
+        human = b >= 0
+        b_human = b[human]
+
+        players = np.concatenate([a, b_human])
+        opponent_rating = np.concatenate([
+            np.where(human, state['rating'][np.maximum(b, 0)], bot_ratings[games]),
+            state['rating'][a[human]],
+        ])
+        opponent_deviation = np.concatenate([
+            np.where(human, state['deviation'][np.maximum(b, 0)], BOT_DEVIATION),
+            state['deviation'][a[human]],
+        ])
+        scores = np.concatenate([s, 1 - s[human]])
+
+        rating, deviation, volatility = glicko2_update(
+            state['rating'][players], state['deviation'][players], state['volatility'][players],
+            opponent_rating[:, None], opponent_deviation[:, None], scores[:, None], tau,
+        )
+        state['rating'][players] = rating
+        state['deviation'][players] = deviation
+        state['volatility'][players] = volatility
+        state['games'][players] += 1
+    return state
+
+
+def game_score(player1_score, player2_score):
+    """player1's Glicko score for a finished game."""
+    return 1.0 if player1_score > player2_score else 0.5 if player1_score == player2_score else 0.0
+
+
+def _player_keys(results):
+    return sorted({(user_id, subject) for subject, player1, player2, _, _ in results
+                   for user_id in (player1, player2) if user_id})
+
+
+def _game_arrays(results, index):
+    """Game arrays for apply_games() from (subject, player1_id, player2_id, bot_accuracy, score) rows."""
+    first = np.array([index[player1, subject] for subject, player1, _, _, _ in results], dtype=np.int64)
+    second = np.array([index[player2, subject] if player2 else -1 for subject, _, player2, _, _ in results],
+                      dtype=np.int64)
+    score = np.array([result[4] for result in results], dtype=np.float64)
+    bots = np.array([bot_rating(accuracy) if accuracy is not None else DEFAULT_RATING
+                     for _, _, _, accuracy, _ in results], dtype=np.float64)
+    return first, second, score, bots
+
+
+def record_results(results):
+    """
+    Update the players' subject ratings for finished games, in the order given.
+
+    results holds (subject, player1_id, player2_id or None for a bot game,
+    bot_accuracy, player1's score) tuples. Run inside the transaction that
+    completes the games.
+    """
+    keys = _player_keys(results)
+    with transaction.atomic():
+        SubjectRating.objects.bulk_create(
+            [SubjectRating(user_id=user_id, subject=subject) for user_id, subject in keys], ignore_conflicts=True,
+        )
+        locked = SubjectRating.objects.select_for_update().filter(
+            user_id__in={user_id for user_id, _ in keys}, subject__in={subject for _, subject in keys},
+        ).order_by('pk')
+        wanted = set(keys)
+        rows = [row for row in locked if (row.user_id, row.subject) in wanted]
+        index = {(row.user_id, row.subject): i for i, row in enumerate(rows)}
+
+        state = {
+            'rating': np.array([row.rating for row in rows]),
+            'deviation': np.array([row.deviation for row in rows]),
+            'volatility': np.array([row.volatility for row in rows]),
+            'games': np.array([row.games for row in rows], dtype=np.int64),
+        }
+        apply_games(state, *_game_arrays(results, index))
+
+        now = timezone.now()
+        # Bursts of games finish together; single-row UPDATEs are cheaper to build than bulk_update()'s CASE
+        for i, row in enumerate(rows):
+            SubjectRating.objects.filter(pk=row.pk).update(
+                rating=float(state['rating'][i]), deviation=float(state['deviation'][i]),
+                volatility=float(state['volatility'][i]), games=int(state['games'][i]), updated_at=now,
+            )
+
+
+def replay_ratings(tau=None, save=True):
+    """
+    Recompute every subject rating from the full knockout history.
+
+    Returns the number of games replayed. With save=False nothing is written,
+    for trying out parameters.
+    """
+    games = list(
+        KnockoutGame.objects.filter(status='completed').order_by('completed_at', 'pk')
+        .values_list('subject', 'player1_id', 'player2_id', 'bot_accuracy', 'player1_score', 'player2_score')
+    )
+    results = [(subject, player1, player2, accuracy, game_score(score1, score2))
+               for subject, player1, player2, accuracy, score1, score2 in games]
+    keys = _player_keys(results)
+    index = {key: i for i, key in enumerate(keys)}
+    state = {
+        'rating': np.full(len(keys), DEFAULT_RATING),
+        'deviation': np.full(len(keys), DEFAULT_DEVIATION),
+        'volatility': np.full(len(keys), DEFAULT_VOLATILITY),
+        'games': np.zeros(len(keys), dtype=np.int64),
+    }
+    apply_games(state, *_game_arrays(results, index), tau=tau)
+
+    if save:
+        now = timezone.now()
+        with transaction.atomic():
+            # Abilities come from knockout.irt.calibrate(), not the games, so they carry over
+            abilities = {(user_id, subject): ability for user_id, subject, ability in
+                         SubjectRating.objects.filter(ability__isnull=False).values_list('user_id', 'subject', 'ability')}
+            SubjectRating.objects.all().delete()
+            rows = [
+                SubjectRating(user_id=user_id, subject=subject, rating=float(state['rating'][i]),
+                              deviation=float(state['deviation'][i]), volatility=float(state['volatility'][i]),
+                              games=int(state['games'][i]), ability=abilities.pop((user_id, subject), None),
+                              updated_at=now)
+                for i, (user_id, subject) in enumerate(keys)
+            ]
+            rows += [SubjectRating(user_id=user_id, subject=subject, ability=ability, updated_at=now)
+                     for (user_id, subject), ability in abilities.items()]
+            SubjectRating.objects.bulk_create(rows, batch_size=1000)
+    return len(results)
@@ -0,0 +1,141 @@
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import KnockoutAnswer, KnockoutGame, KnockoutQuestion, ReviewItem
+
+# SM-2 grades answers 0-5; below PASSING_QUALITY the item is relearned from the start
+QUALITY_CORRECT = 4
+QUALITY_WRONG = 1
+PASSING_QUALITY = 3
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+# Days until the next review after the first and second correct answers in a row
+FIRST_INTERVAL = 1
+SECOND_INTERVAL = 6
+# Most reviews handed out for one day
+DAILY_LIMIT = 50
+# Pending reviews rescheduled per round trip in the nightly pass
+CHUNK_SIZE = 20000
+
+
+def sm2(repetitions, interval, ease, quality):
+    """
+    SM-2 for arrays of items at once. Returns the new (repetitions, interval, ease).
+
+    A passing grade moves an item one step further along 1, 6, then the
+    previous interval times its ease; a failing one starts it again from a
+    day. Ease moves with every grade, never below MIN_EASE.
+    """
+    passed = quality >= PASSING_QUALITY
+    grown = np.rint(interval * ease).astype(np.int64)
+    new_interval = np.where(~passed | (repetitions == 0), FIRST_INTERVAL,
+                            np.where(repetitions == 1, SECOND_INTERVAL, grown))
+    new_repetitions = np.where(passed, repetitions + 1, 0)
+    miss = 5 - quality
+    new_ease = np.round(np.maximum(ease + 0.1 - miss * (0.08 + miss * 0.02), MIN_EASE), 2)
+    return new_repetitions, new_interval, new_ease
+
+
+def add_missed(game_ids):
+    """
+    Queue review items for the bank questions each player got wrong or left unanswered in these completed games.
+
+    New misses are first due tomorrow. A question the player already reviews
+    counts as a failed review, which the nightly pass turns into a lapse.
+    """
+    games = KnockoutGame.objects.filter(pk__in=game_ids, status='completed')
+    players = defaultdict(set)
+    for pk, player1, player2 in games.values_list('pk', 'player1_id', 'player2_id'):
+        players[pk].update(player for player in (player1, player2) if player is not None)
+    questions = list(
+        KnockoutQuestion.objects.filter(game__in=games, bank_question__isnull=False)
+        .values_list('pk', 'game_id', 'bank_question_id')
+    )
+    right = set(
+        KnockoutAnswer.objects.filter(question__game__in=games, is_correct=True).values_list('question_id', 'user_id')
+    )
+    missed = {(user_id, bank_id) for pk, game_id, bank_id in questions
+              for user_id in players[game_id] if (pk, user_id) not in right}
+    if not missed:
+        return 0
+
+    today = timezone.localdate()
+    with transaction.atomic():
+        existing = [
+            pk for pk, user_id, bank_id in ReviewItem.objects.filter(
+                user_id__in={user_id for user_id, _ in missed}, bank_question_id__in={bank_id for _, bank_id in missed},
+            ).values_list('pk', 'user_id', 'bank_question_id')
+            if (user_id, bank_id) in missed
+        ]
+        ReviewItem.objects.filter(pk__in=existing).update(pending_quality=QUALITY_WRONG, reviewed_on=today)
+        ReviewItem.objects.bulk_create(
+            [ReviewItem(user_id=user_id, bank_question_id=bank_id, due_date=today + timedelta(days=FIRST_INTERVAL))
+             for user_id, bank_id in missed],
+            ignore_conflicts=True, batch_size=1000,
+        )
+    return len(missed)
+
+
+def due_reviews(user, today=None, limit=DAILY_LIMIT):
+    """Today's reviews for a player, most overdue first: one query on the (user, due_date) index."""
+    today = today or timezone.localdate()
+    return (
+        ReviewItem.objects.filter(user=user, due_date__lte=today, pending_quality__isnull=True)
+        .select_related('bank_question').order_by('due_date', 'pk')[:limit]
+    )
+
+
+def record_review(item, choice, today=None):
+    """
+    Grade a review answer and keep the grade for the nightly pass. Returns whether it was right.
+
+    Only due items that haven't been answered since the last pass are
+    graded; anything else returns None.
+    """
+    today = today or timezone.localdate()
+    correct = choice == item.bank_question.correct_answer
+    updated = ReviewItem.objects.filter(pk=item.pk, due_date__lte=today, pending_quality__isnull=True).update(
+        pending_quality=QUALITY_CORRECT if correct else QUALITY_WRONG, reviewed_on=today,
+    )
+    return correct if updated else None
+
+
+def reschedule():
+    """
+    Apply every pending grade with SM-2 and set the next due dates. Returns the number of items rescheduled.
+
+    Items are fetched in chunks and worked out with NumPy, then written back
+    with one UPDATE per distinct outcome rather than per item: most students
+    land on the same few intervals, so a chunk takes a handful of statements.
+    """
+    rescheduled = 0
+    last_pk = 0
+    while True:
+        rows = list(
+            ReviewItem.objects.filter(pending_quality__isnull=False, pk__gt=last_pk).order_by('pk')
+            .values_list('pk', 'repetitions', 'interval_days', 'ease_factor', 'pending_quality', 'reviewed_on')
+            [:CHUNK_SIZE]
+        )
+        if not rows:
+            return rescheduled
+        last_pk = rows[-1][0]
+        pks, repetitions, interval, ease, quality, reviewed_on = zip(*rows)
+        new_repetitions, new_interval, new_ease = sm2(
+            np.array(repetitions), np.array(interval), np.array(ease), np.array(quality),
+        )
+        outcomes = defaultdict(list)
+        for pk, reps, days, factor, grade, reviewed in zip(pks, new_repetitions.tolist(), new_interval.tolist(),
+                                                           new_ease.tolist(), quality, reviewed_on):
+            outcomes[reps, days, factor, reviewed + timedelta(days=days), grade < PASSING_QUALITY].append(pk)
+        with transaction.atomic():
+            for (reps, days, factor, due_date, lapsed), group in outcomes.items():
+                ReviewItem.objects.filter(pk__in=group).update(
+                    repetitions=reps, interval_days=days, ease_factor=factor, due_date=due_date,
+                    lapses=F('lapses') + int(lapsed), pending_quality=None,
+                )
+        rescheduled += len(rows)
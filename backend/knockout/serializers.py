@@ -0,0 +1,102 @@
+from django.contrib.auth import get_user_model
+from rest_framework import serializers
+
+from .models import (
+    KnockoutGame, ReviewItem, SubjectRating, Tournament, TournamentEntry, TournamentMatch, ANSWER_CHOICES,
+    DIFFICULTY_CHOICES,
+)
+
+User = get_user_model()
+
+
+class KnockoutGameSerializer(serializers.ModelSerializer):
+    websocket_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = KnockoutGame
+        fields = [
+            'id', 'player1', 'player2', 'bot_accuracy', 'subject', 'grade_level', 'difficulty', 'status',
+            'player1_score', 'player2_score', 'winner', 'points_awarded', 'question_time_seconds',
+            'created_at', 'started_at', 'completed_at', 'websocket_url',
+        ]
+
+    def get_websocket_url(self, obj):
+        # Connect with ?token=<access token>
+        return f'/ws/knockout/{obj.pk}/'
+
+
+class CreateKnockoutGameSerializer(serializers.Serializer):
+    opponent = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    subject = serializers.CharField(max_length=50)
+    difficulty = serializers.ChoiceField(choices=DIFFICULTY_CHOICES, default='medium')
+    num_questions = serializers.IntegerField(min_value=1, max_value=20, default=5)
+    question_time_seconds = serializers.IntegerField(min_value=5, max_value=60, default=15)
+
+    def validate_opponent(self, value):
+        if value == self.context['request'].user:
+            raise serializers.ValidationError("You can't challenge yourself.")
+        return value
+
+
+class SubjectRatingSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SubjectRating
+        fields = ['user', 'subject', 'rating', 'deviation', 'games']
+
+
+class TournamentSerializer(serializers.ModelSerializer):
+    entrants = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Tournament
+        fields = [
+            'id', 'name', 'created_by', 'subject', 'grade_level', 'format', 'status', 'questions_per_match',
+            'question_time_seconds', 'round_minutes', 'rounds', 'current_round', 'winner', 'entrants',
+            'created_at', 'started_at', 'completed_at',
+        ]
+        read_only_fields = ['created_by', 'grade_level', 'status', 'rounds', 'current_round', 'winner',
+                            'started_at', 'completed_at']
+        extra_kwargs = {
+            'questions_per_match': {'min_value': 1, 'max_value': 20},
+            'question_time_seconds': {'min_value': 5, 'max_value': 60},
+            'round_minutes': {'min_value': 1, 'max_value': 24 * 60},
+        }
+
+
+class TournamentEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TournamentEntry
+        fields = ['user', 'seed', 'points', 'eliminated_in']
+
+
+class TournamentMatchSerializer(serializers.ModelSerializer):
+    game = serializers.PrimaryKeyRelatedField(read_only=True)
+    websocket_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TournamentMatch
+        fields = ['round', 'position', 'player1', 'player2', 'winner', 'deadline', 'decided_at', 'game', 'websocket_url']
+
+    def get_websocket_url(self, obj):
+        game = getattr(obj, 'game', None)
+        return None if game is None else f'/ws/knockout/{game.pk}/'
+
+
+class ReviewItemSerializer(serializers.ModelSerializer):
+    """A due review with its question, without the answer."""
+    subject = serializers.CharField(source='bank_question.subject')
+    topic = serializers.CharField(source='bank_question.topic')
+    question_text = serializers.CharField(source='bank_question.question_text')
+    option_a = serializers.CharField(source='bank_question.option_a')
+    option_b = serializers.CharField(source='bank_question.option_b')
+    option_c = serializers.CharField(source='bank_question.option_c')
+    option_d = serializers.CharField(source='bank_question.option_d')
+
+    class Meta:
+        model = ReviewItem
+        fields = ['id', 'subject', 'topic', 'question_text', 'option_a', 'option_b', 'option_c', 'option_d',
+                  'due_date', 'repetitions', 'lapses']
+
+
+class ReviewAnswerSerializer(serializers.Serializer):
+    choice = serializers.ChoiceField(choices=ANSWER_CHOICES)
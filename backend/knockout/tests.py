@@ -0,0 +1,756 @@
+import asyncio
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from django.test import TestCase
+from django.utils import timezone
+
+from dof3a_base.models import Student
+from .analytics import GRADES, build_heatmap, grade_weak_topics, refresh_heatmaps, snapshot_grades
+from .bank import copy_into_game, pick_adaptive_questions, pick_questions
+from .client import WebSocketClient
+from .consumers import knockout_application
+from .irt import calibrate, fit, probability
+from .engine import MatchEngine, load_match, BASE_POINTS, BOT_PLAYER, CORRECT_ANSWER_AWARD, WIN_AWARD
+from .matchmaking import Matchmaker, MatchQueue, Ticket, BAND_WIDTH, WIDEN_SECONDS
+from .models import (
+    BankQuestion, GradeTopicSnapshot, KnockoutGame, KnockoutAnswer, ReviewItem, SubjectRating, TopicProgress, Tournament, TournamentEntry,
+)
+from .progress import MasteryMatrix, class_mastery, mastery_matrix, update_progress
+from .ratings import DEFAULT_RATING, glicko2_update, record_results, replay_ratings
+from .reviews import add_missed, due_reviews, reschedule, sm2
+from .tournaments import bracket_order, games_completed, start, sweep
+
+User = get_user_model()
+
+
+def make_users(count, prefix='user'):
+    return [
+        User.objects.create(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com')
+        for i in range(count)
+    ]
+
+
+def make_bank(count, subject='Math', grade='Middle 1'):
+    return BankQuestion.objects.bulk_create([
+        BankQuestion(subject=subject, grade_level=grade, difficulty='medium', question_text=f'Q{i}',
+                     option_a='a', option_b='b', option_c='c', option_d='d', correct_answer='ABCD'[i % 4])
+        for i in range(count)
+    ])
+
+
+class KnockoutMatchTests(TestCase):
+    def setUp(self):
+        self.player1, self.player2, self.stranger = make_users(3)
+        make_bank(3)
+        self.game = self.make_game()
+        self.engine = MatchEngine(checkpoint_seconds=60, reveal_seconds=0.01)
+        patcher = mock.patch('knockout.consumers.engine', self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_game(self, question_time_seconds=15):
+        game = KnockoutGame.objects.create(player1=self.player1, player2=self.player2, subject='Math',
+                                           grade_level='Middle 1', question_time_seconds=question_time_seconds)
+        copy_into_game(game, sorted(pick_questions('Math', 'Middle 1', 'medium', 3), key=lambda q: q.pk))
+        return game
+
+    async def connect(self, user, game_id=None, token=True):
+        query = f'token={AccessToken.for_user(user)}'.encode() if token else b''
+        client = WebSocketClient(knockout_application, f'/ws/knockout/{game_id or self.game.pk}/', query)
+        accepted = await client.connect()
+        return client, accepted
+
+    async def start(self, game_id=None):
+        first, _ = await self.connect(self.player1, game_id)
+        second, _ = await self.connect(self.player2, game_id)
+        for client in (first, second):
+            self.assertEqual((await client.receive_json())['type'], 'state')
+            self.assertEqual((await client.receive_json())['type'], 'question')
+        return first, second
+
+    @mock.patch('knockout.engine.buffer_points')
+    async def test_match_is_scored_by_the_server_and_saved_on_finish(self, buffer_points):
+        first, second = await self.start()
+        for index, correct in enumerate('ABC'):
+            await first.send_json({'type': 'answer', 'index': index, 'choice': correct})
+            result = await first.receive_json()
+            self.assertEqual(result['type'], 'answer_result')
+            self.assertTrue(result['correct'])
+            self.assertGreater(result['points'], BASE_POINTS)
+            self.assertEqual(await second.receive_json(), {'type': 'opponent_answered', 'index': index})
+
+            await second.send_json({'type': 'answer', 'index': index, 'choice': 'D'})
+            result = await second.receive_json()
+            self.assertEqual((result['correct'], result['points']), (False, 0))
+
+            for client in (first, second):
+                revealed = await client.receive_until('question_result')
+                self.assertEqual(revealed['correct_answer'], correct)
+                if index < 2:
+                    await client.receive_until('question')
+
+        over = await first.receive_until('match_over')
+        self.assertEqual(over['winner'], self.player1.pk)
+        self.assertIsNone(await first.receive_json())
+        self.assertEqual(first.close_code, 1000)
+        await first.disconnect()
+        await second.disconnect()
+        await asyncio.gather(*self.engine._tasks)
+
+        game = await KnockoutGame.objects.aget(pk=self.game.pk)
+        self.assertEqual((game.status, game.winner_id), ('completed', self.player1.pk))
+        self.assertEqual(game.player1_score, over['scores'][str(self.player1.pk)])
+        self.assertEqual(await KnockoutAnswer.objects.filter(question__game=game).acount(), 6)
+        award = 3 * CORRECT_ANSWER_AWARD + WIN_AWARD
+        self.assertEqual(game.points_awarded, award)
+        buffer_points.assert_called_once_with((await Student.objects.aget(user=self.player1)).pk, award)
+        self.assertEqual(self.engine.matches, {})
+        ratings = {row.user_id: row async for row in SubjectRating.objects.filter(subject='Math')}
+        self.assertGreater(ratings[self.player1.pk].rating, DEFAULT_RATING)
+        self.assertLess(ratings[self.player2.pk].rating, DEFAULT_RATING)
+        self.assertEqual(ratings[self.player1.pk].games, 1)
+
+    async def test_unanswered_questions_close_on_the_server_clock(self):
+        game = await sync_to_async(self.make_game)(question_time_seconds=1)
+        first, second = await self.start(game.pk)
+        revealed = await first.receive_until('question_result', timeout=3)
+        self.assertEqual(revealed['scores'], {str(self.player1.pk): 0, str(self.player2.pk): 0})
+
+        await first.send_json({'type': 'answer', 'index': 0, 'choice': 'A'})
+        self.assertEqual(await first.receive_until('error'), {'type': 'error', 'detail': 'That question is closed.'})
+        await self.engine.close()
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_invalid_answers_are_rejected(self):
+        first, second = await self.start()
+        await first.send_json({'type': 'answer', 'index': 0, 'choice': 'E'})
+        self.assertEqual((await first.receive_json())['detail'], 'Choice must be A, B, C or D.')
+        await first.send_json({'type': 'answer', 'index': 0, 'choice': 'B'})
+        self.assertEqual((await first.receive_json())['type'], 'answer_result')
+        await first.send_json({'type': 'answer', 'index': 0, 'choice': 'A'})
+        self.assertEqual((await first.receive_json())['detail'], 'You already answered this question.')
+        await first.send_json({'type': 'hello'})
+        self.assertEqual((await first.receive_json())['detail'], 'Unknown message type.')
+        await self.engine.close()
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_only_authenticated_players_can_join(self):
+        client, accepted = await self.connect(self.player1, token=False)
+        self.assertEqual((accepted, client.close_code), (False, 4001))
+        client, accepted = await self.connect(self.stranger)
+        self.assertEqual((accepted, client.close_code), (False, 4003))
+        client, accepted = await self.connect(self.player1, game_id=10 ** 9)
+        self.assertEqual((accepted, client.close_code), (False, 4004))
+
+    async def test_checkpoint_lets_a_game_resume(self):
+        first, second = await self.start()
+        await first.send_json({'type': 'answer', 'index': 0, 'choice': 'A'})
+        points = (await first.receive_json())['points']
+        await second.send_json({'type': 'answer', 'index': 0, 'choice': 'A'})
+        await first.receive_until('question')
+        await self.engine.close()
+        await first.disconnect()
+        await second.disconnect()
+
+        match = await sync_to_async(load_match)(self.game.pk)
+        self.assertEqual((match.status, match.current), ('in_progress', 1))
+        self.assertEqual(match.scores[self.player1.pk], points)
+        self.assertEqual(len(match.answers), 2)
+
+    async def test_match_left_waiting_is_expired(self):
+        self.engine = MatchEngine(checkpoint_seconds=0.05, wait_seconds=0.1)
+        with mock.patch('knockout.consumers.engine', self.engine):
+            first, _ = await self.connect(self.player1)
+            self.assertEqual((await first.receive_json())['type'], 'state')
+            self.assertEqual(await first.receive_json(timeout=2), {'type': 'match_expired'})
+            self.assertIsNone(await first.receive_json())
+            await first.disconnect()
+            # The cancellation is saved by the checkpoint that runs straight after
+            for _ in range(40):
+                if not self.engine.matches:
+                    break
+                await asyncio.sleep(0.05)
+
+            game = await KnockoutGame.objects.aget(pk=self.game.pk)
+            self.assertEqual(game.status, 'cancelled')
+            self.assertEqual(self.engine.matches, {})
+            client, accepted = await self.connect(self.player2)
+            self.assertEqual((accepted, client.close_code), (False, 4010))
+
+
+class KnockoutBotMatchTests(TestCase):
+    def setUp(self):
+        [self.player] = make_users(1)
+        make_bank(3)
+        self.game = KnockoutGame.objects.create(player1=self.player, bot_accuracy=1.0, subject='Math',
+                                                grade_level='Middle 1', question_time_seconds=1)
+        copy_into_game(self.game, sorted(pick_questions('Math', 'Middle 1', 'medium', 3), key=lambda q: q.pk))
+        self.engine = MatchEngine(checkpoint_seconds=60, reveal_seconds=0.01)
+        patcher = mock.patch('knockout.consumers.engine', self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch('knockout.engine.buffer_points')
+    async def test_bot_answers_on_its_own(self, buffer_points):
+        client = WebSocketClient(knockout_application, f'/ws/knockout/{self.game.pk}/',
+                                 f'token={AccessToken.for_user(self.player)}'.encode())
+        self.assertTrue(await client.connect())
+        state = await client.receive_json()
+        self.assertEqual(state['players'], [self.player.pk, BOT_PLAYER])
+
+        for index in range(3):
+            await client.receive_until('question')
+            await client.send_json({'type': 'answer', 'index': index, 'choice': 'D'})
+            self.assertEqual(await client.receive_until('opponent_answered'), {'type': 'opponent_answered', 'index': index})
+        over = await client.receive_until('match_over')
+        self.assertEqual(over['winner'], BOT_PLAYER)
+        await client.disconnect()
+        await asyncio.gather(*self.engine._tasks)
+
+        game = await KnockoutGame.objects.aget(pk=self.game.pk)
+        self.assertEqual((game.status, game.winner_id, game.points_awarded), ('completed', None, 0))
+        self.assertGreater(game.player2_score, 3 * BASE_POINTS)
+        self.assertEqual(await KnockoutAnswer.objects.filter(question__game=game).acount(), 3)
+        buffer_points.assert_not_called()
+        rating = await SubjectRating.objects.aget(user=self.player, subject='Math')
+        self.assertLess(rating.rating, DEFAULT_RATING)
+        self.assertEqual(await SubjectRating.objects.acount(), 1)
+
+
+class SubjectRatingTests(TestCase):
+    def test_glicko2_matches_the_worked_example(self):
+        # Glickman's "Example of the Glicko-2 system"
+        rating, deviation, volatility = glicko2_update(
+            np.array([1500.0]), np.array([200.0]), np.array([0.06]),
+            np.array([[1400.0, 1550.0, 1700.0]]), np.array([[30.0, 100.0, 300.0]]), np.array([[1.0, 0.0, 0.0]]),
+            tau=0.5,
+        )
+        self.assertAlmostEqual(rating[0], 1464.05, places=1)
+        self.assertAlmostEqual(deviation[0], 151.52, places=1)
+        self.assertAlmostEqual(volatility[0], 0.05999, places=4)
+
+    def test_replay_matches_incremental_updates(self):
+        players = make_users(4)
+        results = [('Math', players[0].pk, players[1].pk, None, 1.0), ('Math', players[2].pk, None, 0.7, 0.0),
+                   ('Math', players[0].pk, players[2].pk, None, 0.5), ('Physics', players[3].pk, players[0].pk, None, 1.0),
+                   ('Math', players[1].pk, players[2].pk, None, 0.0)]
+        for i, (subject, player1, player2, accuracy, score) in enumerate(results):
+            record_results([results[i]])
+            KnockoutGame.objects.create(
+                player1_id=player1, player2_id=player2, bot_accuracy=accuracy, subject=subject, status='completed',
+                player1_score=int(score * 2), player2_score=1, completed_at=timezone.now() + timedelta(seconds=i),
+            )
+        incremental = {(row.user_id, row.subject): row.rating for row in SubjectRating.objects.all()}
+        self.assertEqual(len(incremental), 5)
+
+        self.assertEqual(replay_ratings(), len(results))
+        replayed = {(row.user_id, row.subject): row.rating for row in SubjectRating.objects.all()}
+        self.assertEqual(replayed.keys(), incremental.keys())
+        for key, rating in incremental.items():
+            self.assertAlmostEqual(replayed[key], rating, places=6)
+
+    def test_ratings_api(self):
+        player, other = make_users(2)
+        record_results([('Math', player.pk, other.pk, None, 1.0)])
+        client = APIClient()
+        client.force_authenticate(player)
+        response = client.get('/api/knockout/ratings/')
+        self.assertEqual([(row['user'], row['subject'], row['games']) for row in response.data], [(player.pk, 'Math', 1)])
+        response = client.get('/api/knockout/ratings/', {'subject': 'Math'})
+        self.assertEqual([row['user'] for row in response.data], [player.pk, other.pk])
+
+
+class IrtCalibrationTests(TestCase):
+    def test_fit_recovers_question_difficulty(self):
+        rng = np.random.default_rng(0)
+        difficulty, ability = np.linspace(-2, 2, 20), rng.normal(0, 1, 500)
+        item, person = rng.integers(0, 20, 20000), rng.integers(0, 500, 20000)
+        correct = rng.random(20000) < probability(ability[person], difficulty[item], 1.0)
+        fitted, discrimination, abilities, _ = fit(item, person, correct, np.zeros(20), 500)
+        self.assertGreater(np.corrcoef(fitted, difficulty)[0, 1], 0.95)
+        self.assertGreater(np.corrcoef(abilities, ability)[0, 1], 0.7)
+        self.assertTrue(np.all(discrimination > 0))
+
+    def test_calibrate_from_recorded_answers(self):
+        players = make_users(6)
+        easy, hard = make_bank(2)
+        for i, player in enumerate(players):
+            game = KnockoutGame.objects.create(player1=player, bot_accuracy=0.5, subject='Math', grade_level='Middle 1')
+            for question in copy_into_game(game, [easy, hard]):
+                # Everyone gets the easy question right, only the first three the hard one
+                correct = question.bank_question_id == easy.pk or i < 3
+                KnockoutAnswer.objects.create(question=question, user=player, selected_answer='A', is_correct=correct,
+                                              time_taken_ms=1000, answered_at=timezone.now())
+
+        stats = calibrate()
+        self.assertEqual((stats['answers'], stats['questions'], stats['players']), (12, 2, 6))
+        easy.refresh_from_db()
+        hard.refresh_from_db()
+        self.assertLess(easy.irt_difficulty, hard.irt_difficulty)
+        self.assertEqual((easy.irt_responses, hard.irt_responses), (6, 6))
+        abilities = dict(SubjectRating.objects.values_list('user_id', 'ability'))
+        self.assertGreater(abilities[players[0].pk], abilities[players[5].pk])
+
+        # Replaying the ratings keeps the calibrated abilities
+        replay_ratings()
+        self.assertEqual(dict(SubjectRating.objects.values_list('user_id', 'ability')), abilities)
+
+    def test_adaptive_pick_matches_ability(self):
+        bank = make_bank(40)
+        for question, difficulty in zip(bank, np.linspace(-3, 3, 40)):
+            BankQuestion.objects.filter(pk=question.pk).update(irt_difficulty=difficulty, irt_discrimination=1.5)
+        strong = pick_adaptive_questions('Math', 'Middle 1', [2.0], 2)
+        weak = pick_adaptive_questions('Math', 'Middle 1', [-2.0, -1.5], 2)
+        self.assertEqual(len(strong), 2)
+        self.assertGreater(min(q.irt_difficulty for q in strong), max(q.irt_difficulty for q in weak))
+        self.assertEqual([q.irt_difficulty for q in strong], sorted(q.irt_difficulty for q in strong))
+        self.assertEqual(pick_adaptive_questions('Physics', 'Middle 1', [0.0], 3), [])
+
+
+class TournamentTests(TestCase):
+    def setUp(self):
+        self.players = make_users(5)
+        make_bank(10)
+
+    def make_tournament(self, format='single_elimination', entrants=5):
+        tournament = Tournament.objects.create(name='Cup', created_by=self.players[0], subject='Math',
+                                               grade_level='Middle 1', format=format, questions_per_match=3)
+        for player in self.players[:entrants]:
+            TournamentEntry.objects.create(tournament=tournament, user=player)
+        # Seed by rating: players[0] is the strongest
+        for i, player in enumerate(self.players):
+            SubjectRating.objects.create(user=player, subject='Math', rating=2000 - 100 * i)
+        return tournament
+
+    def finish_round(self, tournament, number, scores=lambda game: (300, 100)):
+        games = list(KnockoutGame.objects.filter(tournament_match__tournament=tournament, tournament_match__round=number))
+        for game in games:
+            player1_score, player2_score = scores(game)
+            KnockoutGame.objects.filter(pk=game.pk).update(status='completed', player1_score=player1_score,
+                                                           player2_score=player2_score)
+        games_completed([game.pk for game in games])
+        tournament.refresh_from_db()
+        return games
+
+    def test_bracket_order_keeps_top_seeds_apart(self):
+        self.assertEqual(bracket_order(8), [1, 8, 4, 5, 2, 7, 3, 6])
+
+    def test_single_elimination_runs_to_a_winner(self):
+        tournament = self.make_tournament()
+        start(tournament.pk)
+        tournament.refresh_from_db()
+        self.assertEqual((tournament.status, tournament.rounds, tournament.current_round), ('in_progress', 3, 1))
+        first = tournament.matches.filter(round=1)
+        # Seeds 1-3 get byes into round 2; only seeds 4 and 5 play
+        self.assertEqual(first.count(), 4)
+        self.assertEqual(first.filter(player2__isnull=True, decided_at__isnull=False).count(), 3)
+        [game] = self.finish_round(tournament, 1, scores=lambda game: (100, 100))
+        self.assertEqual(game.questions.count(), 3)
+        # A tie goes to the better seed
+        self.assertEqual(tournament.entries.get(user=self.players[4]).eliminated_in, 1)
+
+        self.assertEqual(tournament.current_round, 2)
+        second = list(tournament.matches.filter(round=2).values_list('player1', 'player2'))
+        self.assertEqual(second, [(self.players[0].pk, self.players[3].pk), (self.players[1].pk, self.players[2].pk)])
+        self.finish_round(tournament, 2, scores=lambda game: (100, 200))
+        self.finish_round(tournament, 3)
+        self.assertEqual((tournament.status, tournament.winner_id), ('completed', self.players[3].pk))
+        # Finishing the same games again changes nothing
+        self.finish_round(tournament, 3, scores=lambda game: (0, 500))
+        self.assertEqual(tournament.winner_id, self.players[3].pk)
+
+    def test_swiss_rounds_rotate_the_bye_and_avoid_rematches(self):
+        tournament = self.make_tournament(format='swiss')
+        start(tournament.pk)
+        tournament.refresh_from_db()
+        for number in range(1, tournament.rounds + 1):
+            self.finish_round(tournament, number, scores=lambda game: (200, 100) if game.pk % 2 else (100, 100))
+        self.assertEqual((tournament.status, tournament.rounds), ('completed', 3))
+
+        matches = list(tournament.matches.values_list('player1', 'player2'))
+        byes = [player1 for player1, player2 in matches if player2 is None]
+        self.assertEqual(len(byes), 3)
+        self.assertEqual(len(set(byes)), 3)
+        pairs = [frozenset(match) for match in matches if None not in match]
+        self.assertEqual(len(pairs), len(set(pairs)))
+        points = dict(tournament.entries.values_list('user_id', 'points'))
+        self.assertEqual(sum(points.values()), 3 * 3)
+        self.assertEqual(points[tournament.winner_id], max(points.values()))
+
+    def test_sweep_decides_overdue_games(self):
+        tournament = self.make_tournament(entrants=2)
+        start(tournament.pk)
+        self.assertEqual(sweep(), 0)
+        self.assertEqual(sweep(now=timezone.now() + timedelta(hours=1)), 1)
+        tournament.refresh_from_db()
+        self.assertEqual((tournament.status, tournament.winner_id), ('completed', self.players[0].pk))
+
+    def test_tournament_api(self):
+        for player in self.players:
+            player.student.grade = 'Middle 1'
+            player.student.save()
+        client = APIClient()
+        client.force_authenticate(self.players[0])
+        response = client.post('/api/knockout/tournaments/', {'name': 'Cup', 'subject': 'Math', 'format': 'swiss'})
+        self.assertEqual(response.status_code, 201)
+        url = f"/api/knockout/tournaments/{response.data['id']}/"
+        self.assertEqual(client.post(f'{url}start/').status_code, 400)
+        for player in self.players[:3]:
+            client.force_authenticate(player)
+            self.assertEqual(client.post(f'{url}join/').status_code, 201)
+        self.assertEqual(client.post(f'{url}join/').status_code, 400)
+        self.assertEqual(client.post(f'{url}start/').status_code, 403)
+
+        client.force_authenticate(self.players[0])
+        response = client.post(f'{url}start/')
+        self.assertEqual((response.data['status'], response.data['entrants']), ('in_progress', 3))
+        bracket = client.get(f'{url}bracket/').data
+        self.assertEqual(len(bracket['matches']), 2)
+        played = [match for match in bracket['matches'] if match['game']]
+        self.assertEqual(played[0]['websocket_url'], f"/ws/knockout/{played[0]['game']}/")
+
+
+class ReviewTests(TestCase):
+    def setUp(self):
+        self.player, self.opponent = make_users(2)
+        self.bank = make_bank(3)
+        self.today = timezone.localdate()
+
+    def play(self, right):
+        """A completed game over the bank where each player got `right[player]` questions right."""
+        game = KnockoutGame.objects.create(player1=self.player, player2=self.opponent, subject='Math',
+                                           grade_level='Middle 1', status='completed')
+        for question in copy_into_game(game, self.bank):
+            for player in (self.player, self.opponent):
+                if question.bank_question in right.get(player, ()):
+                    KnockoutAnswer.objects.create(question=question, user=player, selected_answer=question.correct_answer,
+                                                  is_correct=True, time_taken_ms=1000, answered_at=timezone.now())
+        return game
+
+    def test_sm2_intervals(self):
+        repetitions, interval, ease = np.array([0, 1, 2, 5]), np.array([0, 1, 6, 30]), np.full(4, 2.5)
+        reps, days, factor = sm2(repetitions, interval, ease, np.array([4, 4, 5, 2]))
+        self.assertEqual(reps.tolist(), [1, 2, 3, 0])
+        self.assertEqual(days.tolist(), [1, 6, 15, 1])
+        self.assertEqual(factor.tolist(), [2.5, 2.5, 2.6, 2.18])
+        # Ease never drops below 1.3
+        self.assertEqual(sm2(np.array([3]), np.array([10]), np.array([1.3]), np.array([0]))[2].tolist(), [1.3])
+
+    def test_missed_questions_are_queued_for_tomorrow(self):
+        game = self.play({self.player: self.bank[:1], self.opponent: self.bank})
+        self.assertEqual(add_missed([game.pk]), 2)
+        items = ReviewItem.objects.filter(user=self.player)
+        self.assertEqual(set(items.values_list('bank_question', flat=True)), {self.bank[1].pk, self.bank[2].pk})
+        self.assertEqual(set(items.values_list('due_date', flat=True)), {self.today + timedelta(days=1)})
+        self.assertFalse(due_reviews(self.player).exists())
+        with self.assertNumQueries(1):
+            self.assertEqual(len(due_reviews(self.player, today=self.today + timedelta(days=1))), 2)
+
+        # Missing one again before it is reviewed counts as a failed review
+        self.assertEqual(add_missed([self.play({}).pk]), 6)
+        self.assertEqual(ReviewItem.objects.filter(user=self.player, pending_quality=1).count(), 2)
+        self.assertEqual(ReviewItem.objects.count(), 6)
+
+    def test_answers_are_rescheduled_overnight(self):
+        add_missed([self.play({}).pk])
+        items = list(ReviewItem.objects.filter(user=self.player).order_by('pk'))
+        ReviewItem.objects.update(due_date=self.today)
+        client = APIClient()
+        client.force_authenticate(self.player)
+        response = client.get('/api/knockout/reviews/')
+        self.assertEqual([row['id'] for row in response.data], [item.pk for item in items])
+        self.assertNotIn('correct_answer', response.data[0])
+
+        right, wrong = items[0], items[1]
+        answer = client.post(f'/api/knockout/reviews/{right.pk}/answer/', {'choice': right.bank_question.correct_answer})
+        self.assertEqual(answer.data['correct'], True)
+        answer = client.post(f'/api/knockout/reviews/{wrong.pk}/answer/', {'choice': 'D'})
+        self.assertEqual(answer.data['correct'], False)
+        self.assertEqual(client.post(f'/api/knockout/reviews/{wrong.pk}/answer/', {'choice': 'B'}).status_code, 400)
+        self.assertEqual(len(client.get('/api/knockout/reviews/').data), 1)
+
+        self.assertEqual(reschedule(), 2)
+        right.refresh_from_db()
+        wrong.refresh_from_db()
+        self.assertEqual((right.repetitions, right.interval_days, right.due_date, right.lapses),
+                         (1, 1, self.today + timedelta(days=1), 0))
+        self.assertEqual((wrong.repetitions, wrong.lapses, wrong.pending_quality), (0, 1, None))
+        self.assertLess(wrong.ease_factor, right.ease_factor)
+        self.assertEqual(reschedule(), 0)
+
+
+class MatchQueueTests(TestCase):
+    def ticket(self, user_id, rating=1500, joined_at=0, grade='Middle 1', subject='Math'):
+        return Ticket(user_id, grade, subject, rating, joined_at)
+
+    def test_same_band_matches_at_once(self):
+        queue = MatchQueue()
+        queue.add(self.ticket(1, rating=1510))
+        queue.add(self.ticket(2, rating=1590, joined_at=1))
+        pairs, bots = queue.match(1)
+        self.assertEqual([(a.user_id, b.user_id) for a, b in pairs], [(1, 2)])
+        self.assertEqual((bots, len(queue)), ([], 0))
+
+    def test_bands_widen_while_both_wait(self):
+        queue = MatchQueue()
+        queue.add(self.ticket(1, rating=1500))
+        queue.add(self.ticket(2, rating=1500 + 2 * BAND_WIDTH, joined_at=WIDEN_SECONDS))
+        self.assertEqual(queue.match(2 * WIDEN_SECONDS), ([], []))
+        # Both must reach two bands: the later player only can after waiting 2 * WIDEN_SECONDS
+        pairs, _ = queue.match(3 * WIDEN_SECONDS)
+        self.assertEqual([(a.user_id, b.user_id) for a, b in pairs], [(1, 2)])
+
+    def test_grades_and_subjects_never_mix(self):
+        queue = MatchQueue(bot_after=10 ** 6)
+        queue.add(self.ticket(1))
+        queue.add(self.ticket(2, grade='Senior 1'))
+        queue.add(self.ticket(3, subject='Physics'))
+        self.assertEqual(queue.match(10 ** 5), ([], []))
+        self.assertEqual(len(queue.depth()), 3)
+
+    def test_longest_waiting_opponent_is_chosen_then_bots(self):
+        queue = MatchQueue(bot_after=30)
+        for user_id in (1, 2, 3):
+            queue.add(self.ticket(user_id, joined_at=user_id))
+        pairs, bots = queue.match(3)
+        self.assertEqual([(a.user_id, b.user_id) for a, b in pairs], [(1, 2)])
+        self.assertEqual(queue.match(32), ([], []))
+        _, bots = queue.match(33)
+        self.assertEqual([ticket.user_id for ticket in bots], [3])
+
+
+class MatchmakerTests(TestCase):
+    def setUp(self):
+        self.players = make_users(2)
+        for player in self.players:
+            player.student.grade = 'Middle 1'
+            player.student.save()
+        make_bank(5)
+
+    async def queue(self, matchmaker, user):
+        client = WebSocketClient(knockout_application, '/ws/knockout/queue/',
+                                 f'token={AccessToken.for_user(user)}&subject=Math'.encode())
+        with mock.patch('knockout.consumers.matchmaker', matchmaker):
+            self.assertTrue(await client.connect())
+            self.assertEqual((await client.receive_json())['type'], 'queued')
+        return client
+
+    async def test_players_in_the_same_band_are_matched(self):
+        matchmaker = Matchmaker()
+        first = await self.queue(matchmaker, self.players[0])
+        second = await self.queue(matchmaker, self.players[1])
+        found = [await first.receive_json(), await second.receive_json()]
+        self.assertEqual({message['type'] for message in found}, {'match_found'})
+        self.assertEqual(found[0]['game'], found[1]['game'])
+        self.assertEqual(found[0]['opponent'], self.players[1].pk)
+        self.assertIsNone(await first.receive_json())
+        await first.disconnect()
+        await second.disconnect()
+
+        game = await KnockoutGame.objects.aget(pk=found[0]['game'])
+        self.assertEqual({game.player1_id, game.player2_id}, {player.pk for player in self.players})
+        self.assertEqual(await game.questions.acount(), 5)
+        stats = matchmaker.snapshot
+        self.assertEqual((stats['waiting'], stats['human_matches'], stats['bot_matches']), (0, 1, 0))
+
+    async def test_lone_player_gets_a_bot_after_the_timeout(self):
+        matchmaker = Matchmaker(MatchQueue(bot_after=0.2), tick_seconds=0.05)
+        client = await self.queue(matchmaker, self.players[0])
+        self.assertEqual(matchmaker.snapshot['waiting'], 1)
+        found = await client.receive_json()
+        self.assertEqual((found['type'], found['opponent']), ('match_found', None))
+        await client.disconnect()
+
+        game = await KnockoutGame.objects.aget(pk=found['game'])
+        self.assertIsNone(game.player2_id)
+        self.assertAlmostEqual(game.bot_accuracy, 0.5)
+        self.assertEqual(matchmaker.snapshot['bot_matches'], 1)
+
+    async def test_queue_uses_the_stored_rating(self):
+        await SubjectRating.objects.acreate(user=self.players[0], subject='Math', rating=1800)
+        matchmaker = Matchmaker()
+        client = await self.queue(matchmaker, self.players[0])
+        self.assertEqual(matchmaker.queue.tickets[self.players[0].pk].rating, 1800)
+        with mock.patch('knockout.consumers.matchmaker', matchmaker):
+            await client.disconnect()
+
+    async def test_leaving_the_queue_removes_the_ticket(self):
+        matchmaker = Matchmaker()
+        client = await self.queue(matchmaker, self.players[0])
+        with mock.patch('knockout.consumers.matchmaker', matchmaker):
+            await client.disconnect()
+        self.assertEqual(len(matchmaker.queue), 0)
+        self.assertEqual(matchmaker.snapshot['queue_depth'], {})
+
+
+class KnockoutGameApiTests(TestCase):
+    def setUp(self):
+        self.player, self.opponent = make_users(2)
+        self.player.student.grade = 'Middle 1'
+        self.player.student.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.player)
+
+    def test_challenge_copies_bank_questions(self):
+        make_bank(8)
+        response = self.client.post('/api/knockout/games/', {'opponent': self.opponent.pk, 'subject': 'Math', 'num_questions': 5})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['websocket_url'], f"/ws/knockout/{response.data['id']}/")
+        game = KnockoutGame.objects.get(pk=response.data['id'])
+        self.assertEqual(game.questions.count(), 5)
+        self.assertEqual(len(set(game.questions.values_list('bank_question', flat=True))), 5)
+
+        response = self.client.get('/api/knockout/games/')
+        self.assertEqual([row['id'] for row in response.data], [game.pk])
+
+    def test_challenge_needs_questions_and_another_player(self):
+        response = self.client.post('/api/knockout/games/', {'opponent': self.opponent.pk, 'subject': 'Math'})
+        self.assertEqual(response.status_code, 400)
+        make_bank(3)
+        response = self.client.post('/api/knockout/games/', {'opponent': self.player.pk, 'subject': 'Math'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TopicProgressTests(TestCase):
+    def setUp(self):
+        self.player, self.opponent = make_users(2)
+        for user in (self.player, self.opponent):
+            user.student.grade = 'Middle 1'
+            user.student.save()
+        self.bank = make_bank(4)
+        topics = ['Fractions', 'Fractions', 'Integers', '']
+        for question, topic in zip(self.bank, topics):
+            question.topic = topic
+        BankQuestion.objects.bulk_update(self.bank, ['topic'])
+        self.now = timezone.now()
+
+    def play(self, right):
+        """A game over the bank that both players answered, each right on the bank questions in `right[player]`."""
+        game = KnockoutGame.objects.create(player1=self.player, player2=self.opponent, subject='Math',
+                                           grade_level='Middle 1', status='completed')
+        for question in copy_into_game(game, self.bank):
+            for player in (self.player, self.opponent):
+                KnockoutAnswer.objects.create(question=question, user=player, selected_answer='A',
+                                              is_correct=question.bank_question in right.get(player, ()),
+                                              time_taken_ms=1000, answered_at=self.now - timedelta(minutes=5))
+
+    def test_answers_are_counted_once(self):
+        self.play({self.player: self.bank[:1], self.opponent: self.bank})
+        # Answers to questions without a topic aren't counted
+        self.assertEqual(update_progress(now=self.now), 6)
+        self.assertEqual(update_progress(now=self.now), 0)
+        self.play({self.player: self.bank[:2]})
+        update_progress(chunk_size=4, now=self.now)
+        counts = {
+            (row.user_id, row.topic): (row.answered, row.correct) for row in TopicProgress.objects.all()
+        }
+        self.assertEqual(counts, {
+            (self.player.pk, 'Fractions'): (4, 3), (self.player.pk, 'Integers'): (2, 0),
+            (self.opponent.pk, 'Fractions'): (4, 2), (self.opponent.pk, 'Integers'): (2, 1),
+        })
+
+    def test_mastery_matrix(self):
+        for _ in range(2):
+            self.play({self.opponent: self.bank})
+        update_progress(now=self.now)
+        with self.assertNumQueries(1):
+            matrix = mastery_matrix([self.player.pk, self.opponent.pk])
+        self.assertEqual(matrix.topics, [('Math', 'Fractions'), ('Math', 'Integers')])
+        self.assertEqual(matrix.answered.tolist(), [[4, 2], [4, 2]])
+        self.assertEqual(matrix.correct.tolist(), [[0, 0], [4, 2]])
+        # Smoothed: no answers at all reads as a coin toss
+        self.assertEqual(np.round(matrix.mastery, 2).tolist(), [[0.25, 0.33], [0.75, 0.67]])
+        self.assertEqual(matrix.weak_topics(self.player.pk), [{'subject': 'Math', 'topic': 'Fractions', 'mastery': 0.25}])
+        self.assertEqual(matrix.weak_topics(self.opponent.pk), [])
+        # Together they got half of each topic right
+        self.assertEqual([topic['mastery'] for topic in matrix.weak_topics()], [0.5, 0.5])
+
+        grade = class_mastery('Middle 1', subject='Science')
+        self.assertEqual((grade.answered.shape, grade.user_ids), ((2, 0), [self.player.pk, self.opponent.pk]))
+        self.assertEqual(MasteryMatrix.from_counts([1], []).mastery.shape, (1, 0))
+
+    def test_mastery_api(self):
+        self.play({})
+        update_progress(now=self.now)
+        client = APIClient()
+        client.force_authenticate(self.player)
+        response = client.get('/api/knockout/mastery/')
+        self.assertEqual(response.data['users'], [self.player.pk])
+        self.assertEqual(response.data['answered'], [[2, 1]])
+        self.assertEqual(response.data['weak_topics'], [])
+        self.assertEqual(client.get('/api/knockout/mastery/', {'grade': 'Middle 1'}).status_code, 403)
+
+        self.player.is_staff = True
+        self.player.save()
+        response = client.get('/api/knockout/mastery/', {'grade': 'Middle 1'})
+        self.assertEqual(response.data['answered'], [[2, 1], [2, 1]])
+
+
+class GradeHeatmapTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.students = make_users(4)
+        for user in self.students:
+            user.student.grade = 'Middle 1'
+            user.student.save()
+        counts = [
+            {'Fractions': (10, 2), 'Integers': (10, 3), 'Cells': (10, 9)},
+            {'Fractions': (10, 3), 'Integers': (10, 2), 'Cells': (10, 8)},
+            {'Fractions': (10, 9), 'Integers': (10, 9), 'Cells': (10, 2)},
+            # Too few answers to count towards the percentiles
+            {'Fractions': (2, 0)},
+        ]
+        TopicProgress.objects.bulk_create([
+            TopicProgress(user=user, subject='Science' if topic == 'Cells' else 'Math', topic=topic,
+                          answered=answered, correct=correct)
+            for user, topics in zip(self.students, counts) for topic, (answered, correct) in topics.items()
+        ])
+        self.today = timezone.localdate()
+
+    def test_heatmap(self):
+        GradeTopicSnapshot.objects.create(grade_level='Middle 1', subject='Math', topic='Fractions',
+                                          day=self.today - timedelta(days=8), answered=20, correct=2)
+        heatmap = build_heatmap('Middle 1', self.today)
+        topics = {topic['topic']: topic for topic in heatmap['topics']}
+        self.assertEqual(heatmap['students'], 4)
+        self.assertEqual(topics['Fractions']['students'], 3)
+        self.assertEqual(topics['Fractions']['percentiles']['50'], 0.357)
+        self.assertEqual(topics['Fractions']['weak_share'], 0.667)
+        # 16/36 now against 4/24 at the snapshot
+        self.assertEqual(topics['Fractions']['delta'], 0.278)
+        self.assertIsNone(topics['Integers']['delta'])
+        self.assertEqual([topic['topic'] for topic in heatmap['weak_topics']], ['Fractions', 'Integers', 'Cells'])
+        self.assertEqual(
+            [([topic['topic'] for topic in cluster['topics']], cluster['students']) for cluster in heatmap['clusters']],
+            [(['Fractions', 'Integers'], 2), (['Cells'], 1)],
+        )
+        self.assertEqual(heatmap['heatmap']['mastery'][3], [None, None, None])
+
+    def test_snapshots_and_cache(self):
+        self.assertEqual(snapshot_grades(self.today), 3)
+        snapshot_grades(self.today)
+        self.assertEqual(GradeTopicSnapshot.objects.filter(day=self.today).count(), 3)
+
+        self.assertEqual(refresh_heatmaps(self.today), len(GRADES))
+        with self.assertNumQueries(0):
+            self.assertEqual([topic['topic'] for topic in grade_weak_topics('Middle 1', 'Science')], ['Cells'])
+        self.assertEqual(grade_weak_topics(Student.OPTION_SELECT), [])
+
+        client = APIClient()
+        client.force_authenticate(self.students[0])
+        self.assertEqual(client.get('/api/knockout/heatmap/', {'grade': 'Middle 1'}).status_code, 403)
+        self.students[0].is_staff = True
+        self.students[0].save()
+        self.assertEqual(client.get('/api/knockout/heatmap/', {'grade': 'Middle 9'}).status_code, 400)
+        response = client.get('/api/knockout/heatmap/', {'grade': 'Middle 1'})
+        self.assertEqual(len(response.data['topics']), 3)
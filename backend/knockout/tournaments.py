@@ -0,0 +1,303 @@
+import logging
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .bank import allocate_question_sets, copy_into_games
+from .models import KnockoutGame, SubjectRating, Tournament, TournamentEntry, TournamentMatch
+
+logger = logging.getLogger(__name__)
+
+MIN_ENTRANTS = 2
+MAX_ENTRANTS = 4096
+# Points a Swiss entrant gets for each result
+WIN_POINTS = 1.0
+DRAW_POINTS = 0.5
+# Backtracking steps Swiss pairing may take to avoid rematches before allowing them
+PAIRING_BUDGET = 100000
+
+
+class TournamentError(Exception):
+    pass
+
+
+def bracket_order(size):
+    """Seeds in bracket slot order, so seeds 1 and 2 can only meet in the final, e.g. [1, 8, 4, 5, 2, 7, 3, 6]."""
+    order = [1]
+    while len(order) < size:
+        total = 2 * len(order) + 1
+        order = [seed for top in order for seed in (top, total - top)]
+    return order
+
+
+def planned_rounds(entrants):
+    return max(math.ceil(math.log2(entrants)), 1)
+
+
+def _seed_entries(tournament):
+    """Number the entries 1..n by subject rating, earlier sign-ups first on equal ratings. Returns user ids in seed order."""
+    entries = list(tournament.entries.order_by('joined_at', 'pk').values_list('pk', 'user_id'))
+    ratings = dict(
+        SubjectRating.objects.filter(subject=tournament.subject, user_id__in=[user_id for _, user_id in entries])
+        .values_list('user_id', 'rating')
+    )
+    entries.sort(key=lambda entry: -ratings.get(entry[1], 0.0))
+    TournamentEntry.objects.bulk_update(
+        [TournamentEntry(pk=pk, seed=seed) for seed, (pk, _) in enumerate(entries, 1)], ['seed'], batch_size=1000,
+    )
+    return [user_id for _, user_id in entries]
+
+
+def start(tournament_id):
+    """Seed the entrants and create the first round."""
+    with transaction.atomic():
+        tournament = Tournament.objects.select_for_update().get(pk=tournament_id)
+        if tournament.status != 'registration':
+            raise TournamentError('The tournament has already started.')
+        seeded = _seed_entries(tournament)
+        if len(seeded) < MIN_ENTRANTS:
+            raise TournamentError(f'A tournament needs at least {MIN_ENTRANTS} entrants.')
+
+        tournament.status = 'in_progress'
+        tournament.started_at = timezone.now()
+        tournament.rounds = planned_rounds(len(seeded))
+        tournament.save(update_fields=['status', 'started_at', 'rounds'])
+
+        if tournament.format == 'swiss':
+            pairs = _swiss_pairs(seeded, defaultdict(set), set())
+        else:
+            # Top seeds get the byes that fill the bracket up to a power of two
+            slots = [seeded[seed - 1] if seed <= len(seeded) else None for seed in bracket_order(2 ** tournament.rounds)]
+            pairs = list(zip(slots[::2], slots[1::2]))
+        _create_round(tournament, 1, pairs)
+    return tournament
+
+
+def _pair_unplayed(waiting, opponents, budget):
+    """Pair `waiting` in order with no rematches, backtracking; None if impossible within `budget` tries."""
+    # Each frame is (players still to pair, index of the last partner tried for the first of them)
+    stack = [(waiting, 0)]
+    pairs = []
+    while stack:
+        remaining, tried = stack[-1]
+        if not remaining:
+            return pairs
+        first = remaining[0]
+        partner = next((i for i in range(tried + 1, len(remaining)) if remaining[i] not in opponents[first]), None)
+        if partner is None:
+            stack.pop()
+            if pairs:
+                pairs.pop()
+            continue
+        budget -= 1
+        if budget < 0:
+            return None
+        stack[-1] = (remaining, partner)
+        pairs.append((first, remaining[partner]))
+        stack.append((remaining[1:partner] + remaining[partner + 1:], 0))
+    return None
+
+
+def _swiss_pairs(standings, opponents, had_bye):
+    """
+    Pair entrants in standings order, each with the nearest one they haven't played.
+
+    With an odd count the lowest-ranked entrant without a bye yet sits out.
+    If nobody can avoid a rematch within PAIRING_BUDGET tries, rematches are
+    allowed. Returns [(user_id, user_id or None for a bye), ...].
+    """
+    waiting = list(standings)
+    pairs = []
+    if len(waiting) % 2:
+        bye = next((user_id for user_id in reversed(waiting) if user_id not in had_bye), waiting[-1])
+        waiting.remove(bye)
+        pairs.append((bye, None))
+    unplayed = _pair_unplayed(waiting, opponents, PAIRING_BUDGET)
+    if unplayed is not None:
+        return pairs + unplayed
+    while waiting:
+        first = waiting.pop(0)
+        index = next((i for i, user_id in enumerate(waiting) if user_id not in opponents[first]), 0)
+        pairs.append((first, waiting.pop(index)))
+    return pairs
+
+
+def _create_round(tournament, number, pairs):
+    """
+    Create a round's matches and games, and copy in every game's questions.
+
+    Takes a fixed number of queries however many games the round has: one
+    bulk insert each for the matches, the games and their questions, with a
+    read back after each insert because MySQL doesn't return new primary keys.
+    """
+    now = timezone.now()
+    deadline = now + timedelta(minutes=tournament.round_minutes)
+    TournamentMatch.objects.bulk_create([
+        TournamentMatch(tournament=tournament, round=number, position=position, player1_id=first, player2_id=second,
+                        deadline=deadline, winner_id=first if second is None else None,
+                        decided_at=now if second is None else None)
+        for position, (first, second) in enumerate(pairs)
+    ], batch_size=1000)
+    matches = list(
+        TournamentMatch.objects.filter(tournament=tournament, round=number, player2__isnull=False)
+        .values_list('pk', 'player1_id', 'player2_id')
+    )
+
+    question_sets = allocate_question_sets(tournament.subject, tournament.grade_level, len(matches),
+                                           tournament.questions_per_match)
+    if matches and not question_sets:
+        raise TournamentError('No questions for this subject and grade yet.')
+    KnockoutGame.objects.bulk_create([
+        KnockoutGame(player1_id=player1, player2_id=player2, subject=tournament.subject,
+                     grade_level=tournament.grade_level, question_time_seconds=tournament.question_time_seconds,
+                     tournament_match_id=pk)
+        for pk, player1, player2 in matches
+    ], batch_size=1000)
+    games = KnockoutGame.objects.filter(tournament_match__tournament=tournament, tournament_match__round=number)
+    copy_into_games(zip(games.order_by('pk').values_list('pk', flat=True), question_sets))
+
+    tournament.current_round = number
+    tournament.save(update_fields=['current_round'])
+
+
+def _decide(matches, now):
+    """
+    Record winners from game scores; rows are (match pk, tournament id, player1, player2, score1, score2).
+
+    Elimination ties go to the better seed. Swiss ties are draws.
+    """
+    tournaments = dict(Tournament.objects.filter(pk__in={row[1] for row in matches}).values_list('pk', 'format'))
+    seeds = {
+        (tournament_id, user_id): seed for tournament_id, user_id, seed in
+        TournamentEntry.objects.filter(tournament_id__in=tournaments).values_list('tournament_id', 'user_id', 'seed')
+    }
+    decided = defaultdict(list)
+    for pk, tournament_id, player1, player2, score1, score2 in matches:
+        if score1 != score2:
+            winner = 'player1' if score1 > score2 else 'player2'
+        elif tournaments[tournament_id] == 'swiss':
+            winner = None
+        else:
+            winner = 'player1' if seeds[tournament_id, player1] < seeds[tournament_id, player2] else 'player2'
+        decided[winner].append(pk)
+    # One UPDATE per outcome rather than per match; the decided_at check makes deciding twice a no-op
+    for winner, pks in decided.items():
+        TournamentMatch.objects.filter(pk__in=pks, decided_at__isnull=True).update(
+            winner_id=None if winner is None else F(f'{winner}_id'), decided_at=now,
+        )
+    return set(tournaments)
+
+
+def _undecided(queryset):
+    return list(
+        queryset.filter(decided_at__isnull=True)
+        .values_list('pk', 'tournament_id', 'player1_id', 'player2_id', 'game__player1_score', 'game__player2_score')
+    )
+
+
+def games_completed(game_ids):
+    """Decide the tournament matches of games that just finished, and advance their tournaments."""
+    matches = _undecided(TournamentMatch.objects.filter(game__pk__in=game_ids))
+    if not matches:
+        return
+    with transaction.atomic():
+        tournament_ids = _decide(matches, timezone.now())
+    for tournament_id in tournament_ids:
+        advance(tournament_id)
+
+
+def _standings(tournament, matches):
+    """Swiss standings: user ids by points, then Buchholz (opponents' points), then seed. Also returns the points."""
+    points = defaultdict(float)
+    opponents = defaultdict(set)
+    for _, player1, player2, winner in matches:
+        if player2 is None:
+            points[player1] += WIN_POINTS
+            continue
+        opponents[player1].add(player2)
+        opponents[player2].add(player1)
+        if winner is None:
+            points[player1] += DRAW_POINTS
+            points[player2] += DRAW_POINTS
+        else:
+            points[winner] += WIN_POINTS
+    seeds = dict(tournament.entries.values_list('user_id', 'seed'))
+    buchholz = {user_id: sum(points[opponent] for opponent in opponents[user_id]) for user_id in seeds}
+    standings = sorted(seeds, key=lambda user_id: (-points[user_id], -buchholz[user_id], seeds[user_id]))
+    return standings, points, opponents
+
+
+def advance(tournament_id):
+    """
+    Move the tournament on once every match in its current round is decided.
+
+    Everything is worked out from the decided matches, so calling this again,
+    or after a worker restart, never double counts.
+    """
+    with transaction.atomic():
+        tournament = Tournament.objects.select_for_update().get(pk=tournament_id)
+        number = tournament.current_round
+        undecided = tournament.matches.filter(round=number, decided_at__isnull=True)
+        if tournament.status != 'in_progress' or undecided.exists():
+            return
+        now = timezone.now()
+
+        if tournament.format == 'swiss':
+            matches = list(tournament.matches.values_list('round', 'player1_id', 'player2_id', 'winner_id'))
+            standings, points, opponents = _standings(tournament, matches)
+            by_points = defaultdict(list)
+            for user_id in standings:
+                by_points[points[user_id]].append(user_id)
+            for value, user_ids in by_points.items():
+                tournament.entries.filter(user_id__in=user_ids).update(points=value)
+            if number < tournament.rounds:
+                had_bye = {player1 for _, player1, player2, _ in matches if player2 is None}
+                _create_round(tournament, number + 1, _swiss_pairs(standings, opponents, had_bye))
+                return
+            winner = standings[0]
+        else:
+            results = list(
+                tournament.matches.filter(round=number).order_by('position')
+                .values_list('player1_id', 'player2_id', 'winner_id')
+            )
+            losers = [player for player1, player2, winner in results for player in (player1, player2)
+                      if player is not None and player != winner]
+            tournament.entries.filter(user_id__in=losers).update(eliminated_in=number)
+            winners = [winner for _, _, winner in results]
+            if len(winners) > 1:
+                _create_round(tournament, number + 1, list(zip(winners[::2], winners[1::2])))
+                return
+            winner = winners[0]
+
+        tournament.status = 'completed'
+        tournament.winner_id = winner
+        tournament.completed_at = now
+        tournament.save(update_fields=['status', 'winner', 'completed_at'])
+
+
+def sweep(now=None):
+    """
+    Catch up every running tournament: decide finished or overdue games and advance.
+
+    Covers games whose completion was checkpointed by a worker that died
+    before advancing the bracket, and games nobody finished by the round's
+    deadline, which are decided on the scores so far. Returns the number of
+    matches decided.
+    """
+    now = now or timezone.now()
+    matches = _undecided(
+        TournamentMatch.objects.filter(tournament__status='in_progress')
+        .filter(Q(game__status='completed') | Q(deadline__lt=now))
+    )
+    with transaction.atomic():
+        _decide(matches, now)
+    for tournament_id in Tournament.objects.filter(status='in_progress').values_list('pk', flat=True):
+        try:
+            advance(tournament_id)
+        except TournamentError:
+            logger.exception(f'Advancing tournament {tournament_id} failed')
+    return len(matches)
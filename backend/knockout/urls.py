@@ -0,0 +1,15 @@
+from django.urls import path
+from rest_framework.routers import DefaultRouter
+from .views import KnockoutGameViewSet, ReviewViewSet, SubjectRatingViewSet, TournamentViewSet, GradeHeatmapView, MasteryView, MatchmakingStatsView
+
+router = DefaultRouter()
+router.register(r'games', KnockoutGameViewSet, basename='knockout-games')
+router.register(r'ratings', SubjectRatingViewSet, basename='knockout-ratings')
+router.register(r'reviews', ReviewViewSet, basename='knockout-reviews')
+router.register(r'tournaments', TournamentViewSet, basename='knockout-tournaments')
+
+urlpatterns = [
+    path('mastery/', MasteryView.as_view(), name='knockout-mastery'),
+    path('heatmap/', GradeHeatmapView.as_view(), name='knockout-heatmap'),
+    path('matchmaking/', MatchmakingStatsView.as_view(), name='knockout-matchmaking'),
+] + router.urls
@@ -0,0 +1,189 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from rest_framework import mixins, permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from dof3a_base import activity
+
+from . import analytics, progress, reviews, tournaments
+from .bank import copy_into_game, pick_questions
+from .matchmaking import matchmaker
+from .models import KnockoutGame, ReviewItem, SubjectRating, Tournament, TournamentEntry
+from .serializers import (
+    KnockoutGameSerializer, CreateKnockoutGameSerializer, ReviewAnswerSerializer, ReviewItemSerializer,
+    SubjectRatingSerializer, TournamentSerializer, TournamentEntrySerializer, TournamentMatchSerializer,
+)
+
+
+class KnockoutGameViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """The viewer's games. Creating one challenges an opponent; play happens over the game's WebSocket."""
+    serializer_class = KnockoutGameSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        return KnockoutGame.objects.filter(Q(player1=user) | Q(player2=user)).order_by('-created_at')
+
+    def create(self, request):
+        serializer = CreateKnockoutGameSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        grade_level = request.user.student.grade
+
+        questions = pick_questions(data['subject'], grade_level, data['difficulty'], data['num_questions'])
+        if not questions:
+            return Response({'detail': 'No questions for this subject, grade and difficulty yet.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            game = KnockoutGame.objects.create(
+                player1=request.user,
+                player2=data['opponent'],
+                subject=data['subject'],
+                grade_level=grade_level,
+                difficulty=data['difficulty'],
+                question_time_seconds=data['question_time_seconds'],
+            )
+            copy_into_game(game, questions)
+            activity.record(request.user.pk, 'knockout_join', game=game.pk)
+        return Response(KnockoutGameSerializer(game).data, status=status.HTTP_201_CREATED)
+
+
+class SubjectRatingViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """The viewer's rating per subject, or with ?subject= the subject's top rated players."""
+    serializer_class = SubjectRatingSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    top_limit = 50
+
+    def get_queryset(self):
+        subject = self.request.query_params.get('subject')
+        if subject:
+            return SubjectRating.objects.filter(subject=subject, games__gt=0).order_by('-rating')[:self.top_limit]
+        return SubjectRating.objects.filter(user=self.request.user).order_by('subject')
+
+
+class TournamentViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                        viewsets.GenericViewSet):
+    """
+    Tournaments for the viewer's grade. Students join while it is open for
+    registration; its creator starts it, after which rounds advance by
+    themselves as games finish.
+    """
+    serializer_class = TournamentSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = Tournament.objects.annotate(entrants=Count('entries')).order_by('-created_at')
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(grade_level=self.request.user.student.grade)
+        if self.request.query_params.get('status'):
+            queryset = queryset.filter(status=self.request.query_params['status'])
+        return queryset
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user, grade_level=self.request.user.student.grade)
+
+    @action(detail=True, methods=['post'])
+    def join(self, request, pk=None):
+        tournament = self.get_object()
+        if tournament.status != 'registration':
+            return Response({'detail': 'Registration is closed.'}, status=status.HTTP_400_BAD_REQUEST)
+        if tournament.entrants >= tournaments.MAX_ENTRANTS:
+            return Response({'detail': 'The tournament is full.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                TournamentEntry.objects.create(tournament=tournament, user=request.user)
+                activity.record(request.user.pk, 'knockout_join', tournament=tournament.pk)
+        except IntegrityError:
+            return Response({'detail': 'You already joined.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def start(self, request, pk=None):
+        tournament = self.get_object()
+        if tournament.created_by_id != request.user.pk and not request.user.is_staff:
+            return Response({'detail': 'Only the organiser can start the tournament.'}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            tournaments.start(tournament.pk)
+        except tournaments.TournamentError as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(self.get_object()).data)
+
+    @action(detail=True)
+    def bracket(self, request, pk=None):
+        """Every match so far with its game, and the entrants with their seeds and standings."""
+        tournament = self.get_object()
+        matches = tournament.matches.select_related('game')
+        entries = tournament.entries.order_by('-points', 'seed')
+        return Response({
+            'matches': TournamentMatchSerializer(matches, many=True).data,
+            'entries': TournamentEntrySerializer(entries, many=True).data,
+        })
+
+
+class ReviewViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    The viewer's spaced-repetition reviews of questions they missed in games.
+    Listing gives today's; answers are graded here and rescheduled overnight.
+    """
+    serializer_class = ReviewItemSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if self.action == 'list':
+            return reviews.due_reviews(self.request.user)
+        return ReviewItem.objects.filter(user=self.request.user).select_related('bank_question')
+
+    @action(detail=True, methods=['post'])
+    def answer(self, request, pk=None):
+        item = self.get_object()
+        serializer = ReviewAnswerSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        correct = reviews.record_review(item, serializer.validated_data['choice'])
+        if correct is None:
+            return Response({'detail': 'This review is not due.'}, status=status.HTTP_400_BAD_REQUEST)
+        question = item.bank_question
+        return Response({'correct': correct, 'correct_answer': question.correct_answer,
+                         'explanation': question.explanation})
+
+
+class MasteryView(APIView):
+    """
+    The viewer's mastery of each topic they have answered questions on, or
+    with ?grade= (staff only) every student's in that grade. ?subject=
+    narrows either to one subject.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        subject = request.query_params.get('subject')
+        grade = request.query_params.get('grade')
+        if grade:
+            if not request.user.is_staff:
+                return Response({'detail': 'Only staff can see a whole grade.'}, status=status.HTTP_403_FORBIDDEN)
+            matrix = progress.class_mastery(grade, subject)
+            return Response({**matrix.to_dict(), 'weak_topics': matrix.weak_topics()})
+        matrix = progress.mastery_matrix([request.user.pk], subject)
+        return Response({**matrix.to_dict(), 'weak_topics': matrix.weak_topics(request.user.pk)})
+
+
+class GradeHeatmapView(APIView):
+    """Topic mastery analytics for a whole grade (?grade=), rebuilt at most hourly."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        grade = request.query_params.get('grade')
+        if grade not in analytics.GRADES:
+            return Response({'detail': 'grade must be one of ' + ', '.join(analytics.GRADES)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(analytics.grade_heatmap(grade))
+
+
+class MatchmakingStatsView(APIView):
+    """Queue depth per (grade, subject, band) and match-found latency for this worker process."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(matchmaker.snapshot)